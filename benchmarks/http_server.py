@@ -0,0 +1,58 @@
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+class _FolderRequestHandler(SimpleHTTPRequestHandler):
+    """Serves the files of the server's current folder, without logging every request."""
+
+    def __init__(self, request, client_address, server):
+        super().__init__(request, client_address, server, directory=server.folder)
+
+    def log_message(self, format, *args):
+        pass
+
+class WorkbookServer:
+    """
+    Local HTTP server standing in for BASE_URL: it serves the workbooks of a folder, answering conditional
+    requests (If-Modified-Since) like a static file server. The folder can be switched between benchmark
+    runs without restarting the server.
+    """
+
+    def __init__(self, folder: str, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            folder (str): Path to the folder with the workbooks.
+            host (str): Interface to listen on. Default is the loopback interface.
+            port (int): Port to listen on. Default picks a free port.
+        """
+        self.httpd = ThreadingHTTPServer((host, port), _FolderRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.folder = os.path.abspath(folder)
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        """URL of the served folder, ending with '/' like BASE_URL."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def set_folder(self, folder: str) -> None:
+        """Serves another folder from now on."""
+        self.httpd.folder = os.path.abspath(folder)
+
+    def start(self) -> "WorkbookServer":
+        """Starts serving in a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="workbook-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the server and releases its port."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,69 @@
+"""
+Times parse_index_correction against a naive row-by-row 'apply' on a synthetic 'Índice/ Correção' column, and
+checks both give the same result. Run from the repository root:
+
+    python -m benchmarks.index_parser_benchmark --rows 1000000
+"""
+import argparse
+import re
+import numpy as np
+import pandas as pd
+from benchmarks.run_benchmarks import timed
+from processing.dataset_cleaning import INDEX_CORRECTION_PATTERN, parse_index_correction
+
+def synthetic_index_column(rows: int, seed: int = 0) -> pd.Series:
+    """
+    Builds a column with the formats of the workbooks: "DI + 1,65%", "IPCA + 6,0797%" and "110,25% do DI",
+    plus a few missing values. Spreads are drawn from a small set, as in the real data (hundreds of distinct
+    values over the full history).
+    """
+    rng = np.random.default_rng(seed)
+    spreads = [f"{value:.4f}".rstrip('0').rstrip('.').replace('.', ',') for value in rng.uniform(0.5, 8, 400)]
+    percents = [f"{value:.2f}".rstrip('0').rstrip('.').replace('.', ',') for value in rng.uniform(100, 130, 100)]
+    distinct = [f"DI + {spread}%" for spread in spreads[:200]] + [f"IPCA + {spread}%" for spread in spreads[200:]] + \
+               [f"{percent}% do DI" for percent in percents] + [None]
+    return pd.Series(np.array(distinct, dtype=object)[rng.integers(0, len(distinct), size=rows)])
+
+def parse_index_correction_apply(values: pd.Series) -> pd.DataFrame:
+    """Reference implementation: the regular expression and the number conversion run once per row."""
+    pattern = re.compile(INDEX_CORRECTION_PATTERN)
+
+    def parse(text):
+        match = pattern.match(text) if isinstance(text, str) else None
+        if match is None:
+            return np.nan, np.nan
+        if match['base'] is not None:
+            label, number = f"{match['base'].strip().upper()} +", match['spread']
+        else:
+            label, number = f"% do {match['of'].strip().upper()}", match['percent']
+        return label, float(number.replace('.', '').replace(',', '.'))
+
+    parsed = values.apply(parse)
+    return pd.DataFrame({'Índice': parsed.str[0], 'Spread': parsed.str[1]}, index=values.index)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the parsing of 'Índice/ Correção'.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows of the synthetic column.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each parser (the fastest one is reported).")
+    args = parser.parse_args()
+
+    values = synthetic_index_column(args.rows)
+    categorical = values.astype('category')
+    vectorized, vectorized_time = timed(parse_index_correction, values, repeat=args.repeat)
+    _, categorical_time = timed(parse_index_correction, categorical, repeat=args.repeat)
+    naive, naive_time = timed(parse_index_correction_apply, values, repeat=args.repeat)
+
+    pd.testing.assert_series_equal(vectorized['Índice'].astype(object), naive['Índice'].astype(object),
+                                   check_names=False)
+    np.testing.assert_array_equal(vectorized['Spread'].to_numpy(), naive['Spread'].to_numpy())
+
+    print(f"{args.rows} rows, {values.nunique()} distinct values:")
+    print(f"  apply (per row):              {naive_time['seconds']:.3f}s")
+    print(f"  vectorized (text column):     {vectorized_time['seconds']:.3f}s "
+          f"({naive_time['seconds'] / vectorized_time['seconds']:.0f}x)")
+    print(f"  vectorized (categorical):     {categorical_time['seconds']:.3f}s "
+          f"({naive_time['seconds'] / categorical_time['seconds']:.0f}x)")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
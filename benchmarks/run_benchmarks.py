@@ -0,0 +1,228 @@
+"""
+Times each stage of the pipeline on synthetic ANBIMA workbooks served by a local HTTP server, at several data
+sizes, and stores the results as JSON. Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --scales 1 10 100
+    python -m benchmarks.run_benchmarks --scales 1 10 --compare benchmarks/results/<previous run>.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# BASE_URL is read from the environment when config is imported, so the address of the stand-in server is
+# set before any module of the project is imported
+BENCHMARK_HOST = "127.0.0.1"
+BENCHMARK_PORT = int(os.environ.get("BENCHMARK_PORT", 8765))
+os.environ["ANBIMA_BASE_URL"] = f"http://{BENCHMARK_HOST}:{BENCHMARK_PORT}/"
+
+from benchmarks.http_server import WorkbookServer
+from benchmarks.workbook_generator import DEFAULT_SHEET_ROWS, generate_workbooks
+
+DATA_FOLDER = os.path.join("benchmarks", "data")  # Generated workbooks, reused between runs
+RESULTS_FOLDER = os.path.join("benchmarks", "results")
+BASE_DAYS = 5  # Business days at scale 1x (the BUSINESS_DAYS_COUNT of the daily job)
+REFERENCE_DATE = "20240927"  # Last business day of the synthetic history
+
+def scaled_profile(scale: int, axis: str, days: int = BASE_DAYS, sheet_rows: dict = None) -> tuple:
+    """
+    Returns the business days and rows per sheet of a scale.
+
+    Args:
+        scale (int): Size multiplier (1, 10, 100...).
+        axis (str): 'days' multiplies the number of business days, 'rows' the rows of each sheet.
+        days (int): Business days at scale 1x. Default is BASE_DAYS.
+        sheet_rows (dict): Sheet name -> rows at scale 1x. Default is DEFAULT_SHEET_ROWS.
+
+    Returns:
+        tuple: (business days as 'yyyymmdd', most recent first; sheet name -> rows).
+    """
+    from utils.business_calendar import get_calendar
+
+    sheet_rows = sheet_rows or DEFAULT_SHEET_ROWS
+    if axis == 'rows':
+        sheet_rows = {name: rows * scale for name, rows in sheet_rows.items()}
+    else:
+        days *= scale
+    business_days = [day.strftime('%Y%m%d') for day in get_calendar().last_business_days(days, REFERENCE_DATE)]
+    return business_days, sheet_rows
+
+def timed(function, *args, repeat: int = 1, **kwargs) -> tuple:
+    """
+    Runs a function 'repeat' times and measures its wall time.
+
+    Returns:
+        tuple: (result of the last run, {'seconds': fastest run, 'runs': every run}).
+    """
+    runs = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function(*args, **kwargs)
+        runs.append(round(time.perf_counter() - start_time, 6))
+    return result, {'seconds': min(runs), 'runs': runs}
+
+def benchmark_scale(scale: int, server: WorkbookServer, axis: str, file_format: str, repeat: int) -> dict:
+    """
+    Generates (or reuses) the workbooks of a scale, serves them and times every stage separately.
+
+    Returns:
+        dict: Description of the scale and timings of each stage.
+    """
+    from processing.dataset_cleaning import clean_dataset
+    from processing.dataset_preparation import download_and_save_files, download_workbooks
+    from utils.csv_utilities import combine_and_save_csvs
+    from utils.data_validation import DatasetValidator
+    from utils.dataset_store import load_dataset
+    from utils.excel_processor import process_sheets, process_workbooks
+    from utils.plot_indicative_rate import plot_indicative_rate_by_indexer
+    from config import (
+        DOWNLOAD_MAX_WORKERS, PARSE_MAX_WORKERS, RAW_DATA_STORE, RAW_DATA_FILE, RAW_DATA_DTYPES,
+        DATASET_COLUMNS_TO_SELECT, PLOT_MANIFEST_FILE
+    )
+
+    business_days, sheet_rows = scaled_profile(scale, axis)
+    profile = f"{file_format}-{len(business_days)}d-" + "-".join(f"{rows}" for rows in sheet_rows.values())
+    workbook_folder = os.path.join(DATA_FOLDER, profile)
+    _, generation = timed(generate_workbooks, workbook_folder, business_days, sheet_rows, file_format)
+    server.set_folder(workbook_folder)
+    print(f"Scale {scale}x: {len(business_days)} days, {sheet_rows} rows per sheet "
+          f"(workbooks ready in {generation['seconds']:.1f}s).")
+
+    stages = {}
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as workspace:
+        source_folder = os.path.join(workspace, "Source")
+        dataset_folder = workspace
+
+        workbooks, stages['download'] = timed(download_workbooks, business_days, DOWNLOAD_MAX_WORKERS, repeat=repeat)
+        stages['download']['bytes'] = sum(len(file_data) for file_data in workbooks.values())
+
+        _, stages['process_sheets'] = timed(
+            lambda: [process_sheets(file_data, date_str) for date_str, file_data in workbooks.items()], repeat=repeat)
+        _, stages['process_workbooks'] = timed(process_workbooks, workbooks, PARSE_MAX_WORKERS, repeat=repeat)
+        stages['process_workbooks']['workers'] = PARSE_MAX_WORKERS
+
+        _, stages['download_and_save_files'] = timed(
+            download_and_save_files, source_folder, business_days, max_workers=DOWNLOAD_MAX_WORKERS,
+            parse_workers=PARSE_MAX_WORKERS, repeat=repeat)
+
+        combined_df, stages['combine_and_save_csvs'] = timed(
+            combine_and_save_csvs, source_folder, business_days, dataset_folder, repeat=repeat)
+        stages['combine_and_save_csvs']['rows'] = len(combined_df)
+
+        df, stages['load_combined'] = timed(
+            load_dataset, dataset_folder, RAW_DATA_STORE, RAW_DATA_FILE, columns=DATASET_COLUMNS_TO_SELECT,
+            dtype=RAW_DATA_DTYPES, repeat=repeat)
+
+        df_cleaned, stages['clean_dataset'] = timed(clean_dataset, df, repeat=repeat)
+        stages['clean_dataset']['rows'] = len(df_cleaned)
+
+        _, stages['validate_dataset'] = timed(DatasetValidator.validate_dataset, df_cleaned, raise_on_error=False,
+                                              repeat=repeat)
+
+        def plot():
+            # Forget the previous render, so every plot is drawn again
+            manifest_path = os.path.join(dataset_folder, PLOT_MANIFEST_FILE)
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+            return plot_indicative_rate_by_indexer(dataset_folder, df_cleaned)
+
+        plots, stages['plot'] = timed(plot, repeat=repeat)
+        stages['plot']['plots'] = len(plots)
+
+    return {
+        'scale': scale,
+        'axis': axis,
+        'days': len(business_days),
+        'sheet_rows': sheet_rows,
+        'format': file_format,
+        'generation_seconds': generation['seconds'],
+        'stages': stages,
+    }
+
+def run_metadata() -> dict:
+    """Returns the environment of the run (commit, Python, platform, CPUs)."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def compare_results(current: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compares the stage timings of two runs, scale by scale, and prints the ratio of each stage.
+
+    Args:
+        current (dict): Results of this run.
+        baseline (dict): Results of a previous run.
+        tolerance (float): Allowed slowdown before a stage is flagged (0.2 = 20% slower).
+
+    Returns:
+        list: (scale, stage, ratio) of the stages slower than the tolerance.
+    """
+    baseline_scales = {(entry['scale'], entry['axis']): entry for entry in baseline.get('scales', [])}
+    regressions = []
+    print(f"Comparison with {baseline.get('git_commit') or 'baseline'} ({baseline.get('created')}):")
+    for entry in current['scales']:
+        previous = baseline_scales.get((entry['scale'], entry['axis']))
+        if previous is None:
+            continue
+        for stage, timing in entry['stages'].items():
+            if stage not in previous['stages'] or not previous['stages'][stage]['seconds']:
+                continue
+            ratio = timing['seconds'] / previous['stages'][stage]['seconds']
+            flag = " <- slower" if ratio > 1 + tolerance else ""
+            print(f"  {entry['scale']:>4}x {stage:<24} {previous['stages'][stage]['seconds']:>9.3f}s -> "
+                  f"{timing['seconds']:>9.3f}s  ({ratio:.2f}x){flag}")
+            if flag:
+                regressions.append((entry['scale'], stage, round(ratio, 3)))
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic workbooks.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="Data size multipliers.")
+    parser.add_argument("--axis", choices=["days", "rows"], default="days",
+                        help="Whether a scale multiplies the business days or the rows per sheet.")
+    parser.add_argument("--format", choices=["xls", "xlsx"], default="xls", help="Format of the workbooks.")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage (the fastest one is reported).")
+    parser.add_argument("--output", help="JSON file for the results. Default is benchmarks/results/<timestamp>.json.")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare with.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Slowdown flagged by --compare (0.2 = 20%%).")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with status 1 if --compare flags a stage.")
+    args = parser.parse_args()
+
+    results = {**run_metadata(), 'settings': vars(args), 'scales': []}
+    os.makedirs(DATA_FOLDER, exist_ok=True)
+    with WorkbookServer(DATA_FOLDER, BENCHMARK_HOST, BENCHMARK_PORT) as server:
+        for scale in args.scales:
+            entry = benchmark_scale(scale, server, args.axis, args.format, args.repeat)
+            results['scales'].append(entry)
+            for stage, timing in entry['stages'].items():
+                print(f"  {stage:<24} {timing['seconds']:>9.3f}s")
+
+    output = args.output or os.path.join(RESULTS_FOLDER, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to: {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            regressions = compare_results(results, json.load(file), args.tolerance)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Checks the exact-rebuild contract of the snapshot store: every day added (in date order, as a back-fill or as a
+republished day) is rebuilt by sheet() and as_of() with the same columns, dtypes, values and row order, also
+after reopening the store from disk. Reports the size of the store against the per-sheet CSVs. Run from the
+repository root:
+
+    python -m benchmarks.snapshot_roundtrip --days 30 --rows 500
+"""
+import argparse
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from benchmarks.run_benchmarks import timed
+from benchmarks.workbook_generator import DEFAULT_SHEET_ROWS, synthetic_sheet
+from utils.snapshot_store import SnapshotStore, frame_digest
+
+def published_sheet(sheet_name: str, rows: int, date: pd.Timestamp, seed: int) -> pd.DataFrame:
+    """
+    Builds a sheet of a day as the parser leaves it, with what the deltas must survive: debentures added and
+    removed from one day to the next, rows in a different order, missing values, and columns of mixed types
+    (numbers and '--' in the same column) next to float columns.
+    """
+    rng = np.random.default_rng([seed, int(date.strftime('%Y%m%d'))])
+    df = synthetic_sheet(sheet_name, rows + 20, date, seed)
+    df = df[rng.random(len(df)) > 0.05].head(rows)  # A few debentures missing from the day
+    if rng.random() < 0.3:
+        df = df.sample(frac=1, random_state=int(rng.integers(1 << 31)))  # Rows published in another order
+    df = df.reset_index(drop=True)
+    df.loc[rng.random(len(df)) < 0.05, 'Nome'] = np.nan
+    if sheet_name == 'DI_SPREAD':
+        # Numeric columns as floats, the others as parsed (mixed objects)
+        df[['PU', '% Pu Par', 'Duration']] = df[['PU', '% Pu Par', 'Duration']].astype(float)
+    return df
+
+def expected_frames(days: list, sheet_rows: dict, seed: int) -> dict:
+    """Returns day -> sheet name -> DataFrame of every day, as last published."""
+    return {day: {sheet_name: published_sheet(sheet_name, rows, pd.Timestamp(day), seed)
+                  for sheet_name, rows in sheet_rows.items()} for day in days}
+
+def check_store(store: SnapshotStore, expected: dict) -> list:
+    """Returns the (day, sheet name, reason) of every day the store does not rebuild exactly."""
+    failures = []
+    for day in sorted(expected):
+        rebuilt = store.as_of(day)
+        for sheet_name, df in expected[day].items():
+            for how, result in (('sheet', store.sheet(day, sheet_name)), ('as_of', rebuilt.get(sheet_name))):
+                if result is None:
+                    failures.append((day, sheet_name, f"{how}: missing"))
+                elif list(result.columns) != list(df.columns) or not result.dtypes.equals(df.dtypes):
+                    failures.append((day, sheet_name, f"{how}: columns or dtypes differ"))
+                elif not result.reset_index(drop=True).equals(df) or frame_digest(result) != frame_digest(df):
+                    failures.append((day, sheet_name, f"{how}: values or row order differ"))
+    failures.extend((day, sheet_name, "verify: digest differs") for day, sheet_name in store.verify())
+    return failures
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check the snapshot store rebuilds every day exactly.")
+    parser.add_argument("--days", type=int, default=30, help="Business days stored.")
+    parser.add_argument("--rows", type=int, default=None, help="Rows of each sheet (default: as published).")
+    parser.add_argument("--base-every", type=int, default=10, help="Stored days of a sheet between two bases.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic sheets.")
+    args = parser.parse_args()
+
+    sheet_rows = {sheet_name: args.rows or rows for sheet_name, rows in DEFAULT_SHEET_ROWS.items()}
+    days = [day.strftime('%Y%m%d') for day in pd.bdate_range('2024-01-02', periods=args.days)]
+    expected = expected_frames(days, sheet_rows, args.seed)
+    # Two days are back-filled after the others, and one day is republished with other rates
+    backfilled = [days[len(days) // 3], days[2 * len(days) // 3]]
+    republished = days[len(days) // 2]
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = SnapshotStore(os.path.join(folder, 'snapshots'), base_every=args.base_every)
+
+        def add_days():
+            for day in days:
+                if day not in backfilled:
+                    store.add_day(day, expected[day])
+            for day in backfilled:
+                store.add_day(day, expected[day])
+            expected[republished] = expected_frames([republished], sheet_rows, args.seed + 1)[republished]
+            store.add_day(republished, expected[republished])
+
+        _, add_time = timed(add_days)
+        failures = check_store(store, expected)
+        # Reopened from disk, without the frames cached while adding
+        failures += check_store(SnapshotStore(store.folder, base_every=args.base_every), expected)
+
+        csv_size = sum(len(df.to_csv(index=False).encode('utf-8')) for sheets in expected.values()
+                       for df in sheets.values())
+        print(f"{len(days)} day(s), {len(sheet_rows)} sheet(s), {len(backfilled)} back-fill(s), 1 republished day:")
+        print(f"  added in {add_time['seconds']:.3f}s")
+        print(f"  store: {store.size() / 1_048_576:.2f} MB, per-sheet CSVs: {csv_size / 1_048_576:.2f} MB "
+              f"({csv_size / max(store.size(), 1):.1f}x)")
+
+    for day, sheet_name, reason in failures:
+        print(f"  {day} {sheet_name}: {reason}")
+    print(f"{len(failures)} mismatch(es)" if failures else "Every day rebuilt exactly.")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
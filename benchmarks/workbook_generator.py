@@ -0,0 +1,168 @@
+import os
+from io import BytesIO
+import numpy as np
+import pandas as pd
+from config import COLUMNS, EXCEL_HEADER_ROWS
+
+try:
+    import xlwt  # Writes .xls, the format published by ANBIMA
+except ImportError:  # Optional dependency, .xlsx is written with openpyxl instead
+    xlwt = None
+
+# Sheets of a daily workbook and their typical number of rows (as published in September 2024)
+DEFAULT_SHEET_ROWS = {
+    'DI_PERCENTUAL': 20,
+    'DI_SPREAD': 500,
+    'IPCA_SPREAD': 470,
+    'VENCIDOS_ANTECIPADAMENTE': 10,
+}
+
+# Words used to build synthetic issuer names
+ISSUER_WORDS = [
+    'ENERGIA', 'TRANSMISSAO', 'RODOVIAS', 'SANEAMENTO', 'PARTICIPACOES', 'HOLDING', 'MINERACAO', 'LOGISTICA',
+    'CONCESSIONARIA', 'TELECOMUNICACOES', 'AGRO', 'INDUSTRIA', 'COMERCIO', 'SERVICOS', 'SOLAR', 'EOLICA',
+]
+ISSUER_SUFFIXES = ['S/A', 'S.A.', 'S.A. (*)', 'S/A (*) (**)']
+
+def synthetic_sheet(sheet_name: str, rows: int, date: pd.Timestamp, seed: int = 0) -> pd.DataFrame:
+    """
+    Builds the rows of a synthetic sheet with the columns and value formats of the ANBIMA workbooks. The same
+    seed always produces the same codes and issuers, so consecutive days quote the same debentures.
+
+    Args:
+        sheet_name (str): Name of the sheet (decides the format of 'Índice/ Correção').
+        rows (int): Number of debentures in the sheet.
+        date (pd.Timestamp): Business day of the workbook, used to vary the prices.
+        seed (int): Seed of the random generator. Default is 0.
+
+    Returns:
+        pd.DataFrame: Sheet with the COLUMNS, numbers as floats and missing values as '--' or 'N/D'.
+    """
+    catalog = np.random.default_rng([seed, len(sheet_name), rows])
+    daily = np.random.default_rng([seed, len(sheet_name), rows, int(date.strftime('%Y%m%d'))])
+
+    letters = catalog.integers(0, 26, size=(rows, 4))
+    codes = [''.join(chr(65 + letter) for letter in row) + f"{number:02d}"
+             for row, number in zip(letters, catalog.integers(10, 99, size=rows))]
+    issuers = [f"{ISSUER_WORDS[a]} {ISSUER_WORDS[b]} {ISSUER_SUFFIXES[c]}" for a, b, c in
+               zip(catalog.integers(0, len(ISSUER_WORDS), rows), catalog.integers(0, len(ISSUER_WORDS), rows),
+                   catalog.integers(0, len(ISSUER_SUFFIXES), rows))]
+    maturities = (date + pd.to_timedelta(catalog.integers(180, 7300, size=rows), unit='D')).strftime('%d/%m/%Y')
+    spreads = catalog.uniform(0.5, 8.0, size=rows).round(4)
+
+    if 'PERCENTUAL' in sheet_name:
+        indexes = [f"{spread * 10 + 100:.2f}% do DI".replace('.', ',') for spread in spreads]
+    elif 'IPCA' in sheet_name:
+        indexes = [f"IPCA + {spread:.4f}%".replace('.', ',') for spread in spreads]
+    else:
+        indexes = [f"DI + {spread:.2f}%".replace('.', ',') for spread in spreads]
+
+    rate = spreads + daily.normal(0, 0.05, size=rows)
+    deviation = np.abs(daily.normal(0.1, 0.05, size=rows))
+    df = pd.DataFrame({
+        'Código': codes,
+        'Nome': issuers,
+        'Repac./ Venc.': maturities,
+        'Índice/ Correção': indexes,
+        'Taxa de Compra': (rate + deviation).round(4),
+        'Taxa de Venda': (rate - deviation).round(4),
+        'Taxa Indicativa': rate.round(4),
+        'Desvio Padrão': deviation.round(4),
+        'Intervalo Indicativo Min.': (rate - 2 * deviation).round(4),
+        'Intervalo Indicativo Máx.': (rate + 2 * deviation).round(4),
+        'PU': catalog.uniform(300, 12000, size=rows).round(6) * (1 + daily.normal(0, 0.001, size=rows)),
+        '% Pu Par': catalog.uniform(40, 110, size=rows).round(4),
+        'Duration': catalog.uniform(100, 3000, size=rows).round(2),
+        '% Reune': np.where(catalog.random(rows) < 0.1, catalog.uniform(0, 1, size=rows).round(2), np.nan),
+        'Referência NTN-B': np.where(catalog.random(rows) < 0.3, '15/05/2035', ''),
+    }, columns=COLUMNS).astype(object)
+
+    if sheet_name == 'VENCIDOS_ANTECIPADAMENTE':
+        df.loc[:, 'Taxa de Compra':'Intervalo Indicativo Máx.'] = '--'
+        df['Duration'] = 'N/D'
+    else:
+        # A few quotes without a buy/sell rate, as in the published files
+        df.loc[daily.random(rows) < 0.02, ['Taxa de Compra', 'Taxa de Venda']] = '--'
+    return df
+
+def write_workbook(sheets: dict, file_format: str = 'xls') -> bytes:
+    """
+    Writes sheets in the ANBIMA layout: EXCEL_HEADER_ROWS rows of title, notes and column header above the
+    data, and a footnote below it.
+
+    Args:
+        sheets (dict): Sheet name -> DataFrame with the COLUMNS.
+        file_format (str): 'xls' (requires xlwt) or 'xlsx' (requires openpyxl). Default is 'xls'.
+
+    Returns:
+        bytes: The workbook.
+    """
+    buffer = BytesIO()
+    if file_format == 'xls':
+        if xlwt is None:
+            raise ImportError("Writing .xls workbooks requires xlwt, use file_format='xlsx' instead.")
+        workbook = xlwt.Workbook(encoding='utf-8')
+        for sheet_name, df in sheets.items():
+            worksheet = workbook.add_sheet(sheet_name)
+            _write_rows(worksheet.write, sheet_name, df)
+        workbook.save(buffer)
+    elif file_format == 'xlsx':
+        from openpyxl import Workbook  # Optional dependency, only needed for .xlsx
+        workbook = Workbook()
+        workbook.remove(workbook.active)
+        for sheet_name, df in sheets.items():
+            worksheet = workbook.create_sheet(sheet_name)
+            _write_rows(lambda row, column, value: worksheet.cell(row + 1, column + 1, value), sheet_name, df)
+        workbook.save(buffer)
+    else:
+        raise ValueError(f"Unknown workbook format '{file_format}', expected 'xls' or 'xlsx'.")
+    return buffer.getvalue()
+
+def _write_rows(write, sheet_name: str, df: pd.DataFrame) -> None:
+    """Writes the header rows, the data and the footnote of a sheet through a write(row, column, value) function."""
+    write(0, 0, f"ANBIMA - Mercado Secundário de Debêntures - {sheet_name}")
+    for row in range(1, EXCEL_HEADER_ROWS - 1):
+        write(row, 0, f"Nota {row}")
+    for column, name in enumerate(df.columns):
+        write(EXCEL_HEADER_ROWS - 1, column, name)
+
+    for row, values in enumerate(df.itertuples(index=False, name=None), start=EXCEL_HEADER_ROWS):
+        for column, value in enumerate(values):
+            if isinstance(value, float) and np.isnan(value) or value == '':
+                continue
+            write(row, column, value)
+    write(EXCEL_HEADER_ROWS + len(df) + 1, 0, "(*) Nota de rodapé")
+
+def generate_workbooks(output_folder: str, business_days: list, sheet_rows: dict = None, file_format: str = 'xls',
+                       seed: int = 0) -> list:
+    """
+    Writes one synthetic workbook per business day, named as build_url expects ('d24set27.xls'), so the folder
+    can be served in place of BASE_URL. Workbooks already in the folder are kept.
+
+    Args:
+        output_folder (str): Path to the folder where the workbooks are written.
+        business_days (list): Business days ('yyyymmdd').
+        sheet_rows (dict): Sheet name -> number of rows. Default is DEFAULT_SHEET_ROWS.
+        file_format (str): 'xls' or 'xlsx'. Default is 'xls'.
+        seed (int): Seed of the random generator. Default is 0.
+
+    Returns:
+        list: Paths of the workbooks.
+    """
+    from utils.file_downloader import build_url  # Only the file name is used, not the base URL
+
+    sheet_rows = sheet_rows or DEFAULT_SHEET_ROWS
+    os.makedirs(output_folder, exist_ok=True)
+    paths = []
+    for date_str in business_days:
+        date = pd.to_datetime(date_str, format='%Y%m%d')
+        file_name = os.path.basename(build_url(date))
+        if file_format != 'xls':
+            file_name = f"{os.path.splitext(file_name)[0]}.{file_format}"
+        file_path = os.path.join(output_folder, file_name)
+        if not os.path.exists(file_path):
+            sheets = {name: synthetic_sheet(name, rows, date, seed) for name, rows in sheet_rows.items()}
+            with open(file_path, 'wb') as file:
+                file.write(write_workbook(sheets, file_format))
+        paths.append(file_path)
+    return paths
@@ -0,0 +1,370 @@
+"""
+Command-line interface of the pipeline, one subcommand per step:
+
+    python cli.py run                                  # Every step, as main.py
+    python cli.py download --start 20240901 --end 20240927 --workers 8
+    python cli.py combine --days 10
+    python cli.py clean --streaming
+    python cli.py validate
+    python cli.py plot --workers 2
+    python cli.py aggregates --level Indexer --windows 5 21 63
+    python cli.py screen --flags stale jump
+    python cli.py snapshot --as-of 20240920 --export restored
+    python cli.py daemon --interval 300 --status-port 8080
+
+Only argparse and config are imported at startup: pandas, numpy, matplotlib and requests are imported inside
+the subcommands that use them, so '--help' and the light subcommands start quickly.
+"""
+import argparse
+import os
+import sys
+from config import (
+    SOURCE_FOLDER, DATASET_FOLDER, BUSINESS_DAYS_COUNT, DOWNLOAD_MAX_WORKERS, PARSE_MAX_WORKERS, PLOT_MAX_WORKERS,
+    COMBINE_INCREMENTAL, CLEAN_STREAMING, CLEAN_CHUNK_SIZE, PIPELINE_IN_MEMORY, RUN_REPORT_FILE,
+    INSTRUMENTATION_TRACE_MEMORY, ROLLING_WINDOWS, AGGREGATE_COLUMNS, DAEMON_POLL_INTERVAL, DAEMON_STATUS_PORT,
+    QUOTE_FLAGS
+)
+
+def resolve_business_days(args: argparse.Namespace) -> list:
+    """
+    Returns the business days selected by the date options: '--start'/'--end' (both inclusive), or the last
+    '--days' business days up to '--end' (default yesterday).
+
+    Returns:
+        list: Business days in the format 'yyyymmdd', most recent first.
+    """
+    from utils.business_calendar import get_calendar
+    from utils.date_utilities import get_business_days, get_business_days_between
+
+    if args.start:
+        return get_business_days_between(args.start, args.end or args.start)
+    if args.end:
+        return [day.strftime("%Y%m%d") for day in get_calendar().last_business_days(args.days, args.end)]
+    return get_business_days(args.days)
+
+def command_download(args: argparse.Namespace) -> int:
+    """Downloads the workbooks of the business days and saves their sheets (snapshot store or per-sheet CSVs)."""
+    from processing.dataset_preparation import download_and_save_files
+    from utils.download_cache import DownloadCache
+    from utils.parse_cache import ParsedWorkbookCache
+
+    business_days = resolve_business_days(args)
+    print(f"Business days: {business_days}")
+    download_and_save_files(args.source_folder, business_days, max_workers=args.workers,
+                            cache=None if args.no_cache else DownloadCache(), parse_workers=args.parse_workers,
+                            parse_cache=None if args.no_cache else ParsedWorkbookCache())
+    return 0
+
+def command_combine(args: argparse.Namespace) -> int:
+    """Combines the sheets of the business days (snapshot store or per-sheet CSVs) into the combined dataset."""
+    from utils.csv_utilities import combine_and_save_csvs
+
+    business_days = resolve_business_days(args)
+    combined_df = combine_and_save_csvs(args.source_folder, business_days, args.dataset_folder,
+                                        incremental=args.incremental)
+    return 0 if args.incremental or not combined_df.empty else 1
+
+def command_clean(args: argparse.Namespace) -> int:
+    """Cleans and validates the combined dataset, saving the cleaned dataset."""
+    from processing.dataset_preparation import prepare_and_clean_dataset, prepare_and_clean_dataset_streaming
+
+    if args.streaming:
+        prepare_and_clean_dataset_streaming(args.dataset_folder, args.chunk_size)
+    else:
+        prepare_and_clean_dataset(args.dataset_folder)
+    return 0
+
+def command_validate(args: argparse.Namespace) -> int:
+    """Validates the saved cleaned dataset, printing every failing rule. Exits with 1 if a rule fails."""
+    from utils.csv_utilities import validate_date_column
+    from utils.data_validation import DatasetValidator
+    from utils.dataset_store import load_dataset
+    from config import CLEANED_DATA_STORE, CLEANED_DATA_FILE, CLEANED_DATA_DTYPES
+
+    df = load_dataset(args.dataset_folder, CLEANED_DATA_STORE, CLEANED_DATA_FILE, dtype=CLEANED_DATA_DTYPES)
+    if df is None:
+        print(f"Failed to load the cleaned dataset from {args.dataset_folder}.")
+        return 1
+    report = DatasetValidator.validate_dataset(validate_date_column(df, 'data'), raise_on_error=False)
+    return 0 if report.passed else 1
+
+def command_plot(args: argparse.Namespace) -> int:
+    """Plots the average indicative rate by indexer from the saved cleaned dataset."""
+    from utils.plot_indicative_rate import plot_indicative_rate_by_indexer
+
+    saved_files = plot_indicative_rate_by_indexer(args.dataset_folder, max_workers=args.workers)
+    for file_path in saved_files:
+        print(file_path)
+    return 0 if saved_files else 1
+
+def command_aggregates(args: argparse.Namespace) -> int:
+    """Prints the rolling-window statistics of the daily aggregates, ending on the last (or --end) day."""
+    import pandas as pd
+    from utils.daily_aggregates import DailyAggregates
+    from config import DAILY_AGGREGATES_FILE
+
+    aggregates = DailyAggregates.load(os.path.join(args.dataset_folder, DAILY_AGGREGATES_FILE))
+    if not len(aggregates):
+        print(f"No daily aggregates in {args.dataset_folder}, run the clean step first.")
+        return 1
+    summary = aggregates.window_summary(args.level, args.windows, args.end)
+    columns = ['window', 'days_covered', 'data', args.level, 'rows'] + \
+              [f"{args.column}_{field}" for field in ('mean', 'min', 'max')] + ['duration_weighted_rate']
+    with pd.option_context('display.width', 200, 'display.max_rows', None):
+        print(summary[columns].to_string(index=False))
+    return 0
+
+def command_screen(args: argparse.Namespace) -> int:
+    """Prints the quotes flagged by the screening of the cleaned dataset, on the last (or --end) day."""
+    import pandas as pd
+    from utils.dataset_store import load_dataset
+    from utils.quote_screening import flag_counts, has_flags
+    from config import CLEANED_DATA_STORE, CLEANED_DATA_FILE, CLEANED_DATA_DTYPES
+
+    day = pd.to_datetime(args.end, format="%Y%m%d") if args.end else None
+    df = load_dataset(args.dataset_folder, CLEANED_DATA_STORE, CLEANED_DATA_FILE, dtype=CLEANED_DATA_DTYPES,
+                      start_date=args.end, end_date=args.end)
+    if df is None or df.empty:
+        print(f"No cleaned quotes in {args.dataset_folder}{f' on {args.end}' if args.end else ''}.")
+        return 1
+    df = df[df['data'] == (day if day is not None else df['data'].max())]
+
+    flagged = df[has_flags(df['Flags'], *args.flags)]
+    print(f"{len(flagged)} of {len(df)} quotes flagged on {df['data'].iloc[0]:%d/%m/%Y}: {flag_counts(df['Flags'])}")
+    columns = ['Código', 'Nome', 'Indexer', 'Taxa Indicativa', 'Intervalo Indicativo Min.',
+               'Intervalo Indicativo Máx.', 'Taxa de Compra', 'Taxa de Venda', 'Flags']
+    flagged = flagged.assign(Flags=[", ".join(name for name, bit in QUOTE_FLAGS.items() if flags & bit)
+                                    for flags in flagged['Flags']])
+    with pd.option_context('display.width', 200, 'display.max_rows', None, 'display.max_colwidth', 40):
+        print(flagged[columns].to_string(index=False))
+    return 0
+
+def command_snapshot(args: argparse.Namespace) -> int:
+    """Summarizes the snapshot store of the sheets, imports the per-sheet CSVs, rebuilds a day or lists changes."""
+    import pandas as pd
+    from utils.csv_utilities import index_source_files, read_source_csv, sheet_name_from_file, source_file_name
+    from utils.file_utilities import save_dataframe_to_csv
+    from utils.snapshot_store import SnapshotStore, update_snapshot_store, frame_digest
+    from config import SNAPSHOT_FOLDER
+
+    if args.import_csvs:
+        business_days = resolve_business_days(args)
+        files_by_day = index_source_files(args.source_folder, business_days)
+        sheets_by_day = {
+            date_str: {sheet_name_from_file(file_name): df.drop(columns=['sheet_name', 'data'])
+                       for file_name in file_names
+                       if (df := read_source_csv(args.source_folder, file_name, date_str)) is not None}
+            for date_str, file_names in files_by_day.items() if file_names
+        }
+        store = update_snapshot_store(args.source_folder, sheets_by_day)
+        if args.prune:
+            # Only the CSVs the store now rebuilds exactly are removed
+            pruned = 0
+            for date_str, file_names in files_by_day.items():
+                for file_name in file_names:
+                    df = sheets_by_day.get(date_str, {}).get(sheet_name_from_file(file_name))
+                    stored = store.sheets.get(sheet_name_from_file(file_name), {}).get(date_str)
+                    if df is not None and stored is not None and stored['digest'] == frame_digest(df):
+                        os.remove(os.path.join(args.source_folder, file_name))
+                        pruned += 1
+            print(f"Removed {pruned} per-sheet CSV(s) now held by the snapshot store.")
+        return 0 if sheets_by_day else 1
+
+    store = SnapshotStore(os.path.join(args.source_folder, SNAPSHOT_FOLDER))
+    days = store.days()
+    if not days:
+        print(f"No snapshots in {store.folder}, run the download step or 'snapshot --import' first.")
+        return 1
+
+    if args.verify:
+        mismatches = store.verify()
+        for day, sheet_name in mismatches:
+            print(f"  {day} {sheet_name}: rebuilt sheet differs from the one stored")
+        print(f"{len(mismatches)} mismatch(es) over {len(days)} day(s) in {store.folder}")
+        return 1 if mismatches else 0
+
+    if args.changes:
+        changes = store.changes(*args.changes)
+        if args.output:
+            save_dataframe_to_csv(changes, args.output)
+        summary = changes.groupby(['data', 'sheet_name', 'change']).size().unstack('change', fill_value=0)
+        with pd.option_context('display.width', 200, 'display.max_rows', None):
+            print(summary.to_string() if len(summary) else "No changes.")
+        return 0
+
+    if args.as_of:
+        sheets = store.as_of(args.as_of)
+        if not sheets:
+            print(f"No snapshot on or before {args.as_of}, the first day stored is {days[0]}.")
+            return 1
+        day = max(day for day in days if day <= args.as_of)
+        print(f"Sheets of {day}:")
+        for sheet_name, df in sheets.items():
+            print(f"  {sheet_name}: {len(df)} rows")
+            if args.export:
+                os.makedirs(args.export, exist_ok=True)
+                save_dataframe_to_csv(df, os.path.join(args.export, source_file_name(day, sheet_name)))
+        return 0
+
+    entries = [entry for sheet_entries in store.sheets.values() for entry in sheet_entries.values()]
+    bases = sum(entry['kind'] == 'base' for entry in entries)
+    print(f"{len(days)} day(s) from {days[0]} to {days[-1]}, {len(store.sheets)} sheet(s): {bases} base(s) and "
+          f"{len(entries) - bases} delta(s), {store.size() / 1_048_576:.2f} MB in {store.folder}")
+    return 0
+
+def command_run(args: argparse.Namespace) -> int:
+    """Runs every step: as an in-memory pipeline skipping unchanged stages, or step by step from disk."""
+    if args.step_by_step:
+        for command in (command_download, command_combine, command_clean, command_plot):
+            args.workers = args.plot_workers if command is command_plot else args.download_workers
+            status = command(args)
+            if status and command is not command_combine:
+                return status
+        return 0
+
+    from processing.pipeline import PipelineRunner
+    from utils.download_cache import DownloadCache
+    from utils.parse_cache import ParsedWorkbookCache
+
+    business_days = resolve_business_days(args)
+    print(f"Business days: {business_days}")
+    runner = PipelineRunner(args.source_folder, args.dataset_folder, download_workers=args.download_workers,
+                            parse_workers=args.parse_workers,
+                            download_cache=None if args.no_cache else DownloadCache(),
+                            parse_cache=None if args.no_cache else ParsedWorkbookCache())
+    runner.run(business_days)
+    return 0
+
+def command_daemon(args: argparse.Namespace) -> int:
+    """Stays running, polling for the workbook of the current business day and ingesting it when it appears."""
+    from processing.daemon import PublicationDaemon
+
+    daemon = PublicationDaemon(args.source_folder, args.dataset_folder, poll_interval=args.interval,
+                               days=args.days, download_workers=args.download_workers,
+                               parse_workers=args.parse_workers, status_port=args.status_port,
+                               target_date=args.date)
+    daemon.run(max_polls=args.max_polls)
+    return 0 if daemon.status['last_poll_result'] != 'error' else 1
+
+def add_date_options(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("business days")
+    group.add_argument("--start", metavar="YYYYMMDD", help="First business day (with --end, a date range).")
+    group.add_argument("--end", metavar="YYYYMMDD", help="Last business day. Default is yesterday.")
+    group.add_argument("--days", type=int, default=BUSINESS_DAYS_COUNT,
+                       help=f"Number of business days up to --end, without --start. Default is {BUSINESS_DAYS_COUNT}.")
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser with a subparser per step."""
+    parser = argparse.ArgumentParser(prog="cli.py", description="ANBIMA debentures daily prices pipeline.")
+    parser.add_argument("--source-folder", default=SOURCE_FOLDER,
+                        help="Folder of the sheets (snapshot store and per-sheet CSVs).")
+    parser.add_argument("--dataset-folder", default=DATASET_FOLDER, help="Folder of the datasets and plots.")
+    parser.add_argument("--report", action="store_true", help="Record the stages and save a JSON run report.")
+    parser.add_argument("--report-file", default=RUN_REPORT_FILE,
+                        help=f"Run report file, under the dataset folder. Default is {RUN_REPORT_FILE}.")
+    parser.add_argument("--profile", action="store_true", help="With --report, also capture a cProfile profile.")
+    subparsers = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    download = subparsers.add_parser("download", help=command_download.__doc__)
+    add_date_options(download)
+    download.add_argument("--workers", type=int, default=DOWNLOAD_MAX_WORKERS, help="Concurrent downloads.")
+    download.add_argument("--parse-workers", type=int, default=PARSE_MAX_WORKERS, help="Workbook parsing processes.")
+    download.add_argument("--no-cache", action="store_true", help="Ignore the download and parse caches.")
+    download.set_defaults(handler=command_download)
+
+    combine = subparsers.add_parser("combine", help=command_combine.__doc__)
+    add_date_options(combine)
+    combine.add_argument("--incremental", action=argparse.BooleanOptionalAction, default=COMBINE_INCREMENTAL,
+                         help="Only combine new or changed CSVs into the existing combined dataset.")
+    combine.set_defaults(handler=command_combine)
+
+    clean = subparsers.add_parser("clean", help=command_clean.__doc__)
+    clean.add_argument("--streaming", action=argparse.BooleanOptionalAction, default=CLEAN_STREAMING,
+                       help="Clean the combined dataset in chunks instead of in memory.")
+    clean.add_argument("--chunk-size", type=int, default=CLEAN_CHUNK_SIZE, help="Rows per chunk when streaming.")
+    clean.set_defaults(handler=command_clean)
+
+    validate = subparsers.add_parser("validate", help=command_validate.__doc__)
+    validate.set_defaults(handler=command_validate)
+
+    plot = subparsers.add_parser("plot", help=command_plot.__doc__)
+    plot.add_argument("--workers", type=int, default=PLOT_MAX_WORKERS, help="Plot rendering processes.")
+    plot.set_defaults(handler=command_plot)
+
+    aggregates = subparsers.add_parser("aggregates", help=command_aggregates.__doc__)
+    aggregates.add_argument("--level", choices=["Indexer", "Issuer", "all"], default="Indexer",
+                            help="Group by Indexer, by issuer or over every quote.")
+    aggregates.add_argument("--windows", type=int, nargs="+", default=ROLLING_WINDOWS,
+                            help=f"Window lengths in business days. Default is {ROLLING_WINDOWS}.")
+    aggregates.add_argument("--column", choices=AGGREGATE_COLUMNS, default="Taxa Indicativa",
+                            help="Column whose mean, min and max are printed.")
+    aggregates.add_argument("--end", metavar="YYYYMMDD", help="Last day of the windows. Default is the last day.")
+    aggregates.set_defaults(handler=command_aggregates)
+
+    screen = subparsers.add_parser("screen", help=command_screen.__doc__)
+    screen.add_argument("--flags", nargs="+", choices=list(QUOTE_FLAGS), default=[],
+                        help="Only list the quotes raising these flags. Default lists any flagged quote.")
+    screen.add_argument("--end", metavar="YYYYMMDD", help="Day of the quotes. Default is the last day.")
+    screen.set_defaults(handler=command_screen)
+
+    snapshot = subparsers.add_parser("snapshot", help=command_snapshot.__doc__)
+    add_date_options(snapshot)
+    action = snapshot.add_mutually_exclusive_group()
+    action.add_argument("--import", dest="import_csvs", action="store_true",
+                        help="Add the per-sheet CSVs of the business days to the store.")
+    action.add_argument("--as-of", metavar="YYYYMMDD", help="Rebuild the sheets of the last day stored up to this day.")
+    action.add_argument("--changes", nargs=2, metavar=("START", "END"),
+                        help="Count the added, removed and changed codes of each day between two days.")
+    action.add_argument("--verify", action="store_true",
+                        help="Rebuild every stored day and check it is exactly the sheet that was added.")
+    snapshot.add_argument("--prune", action="store_true",
+                          help="With --import, remove the per-sheet CSVs once the store holds them.")
+    snapshot.add_argument("--export", metavar="FOLDER", help="With --as-of, save the rebuilt sheets as CSVs there.")
+    snapshot.add_argument("--output", metavar="FILE", help="With --changes, save every change to a CSV.")
+    snapshot.set_defaults(handler=command_snapshot)
+
+    run = subparsers.add_parser("run", help=command_run.__doc__)
+    add_date_options(run)
+    run.add_argument("--download-workers", type=int, default=DOWNLOAD_MAX_WORKERS, help="Concurrent downloads.")
+    run.add_argument("--parse-workers", type=int, default=PARSE_MAX_WORKERS, help="Workbook parsing processes.")
+    run.add_argument("--plot-workers", type=int, default=PLOT_MAX_WORKERS, help="Plot rendering processes.")
+    run.add_argument("--no-cache", action="store_true", help="Ignore the download and parse caches.")
+    run.add_argument("--step-by-step", action="store_true", default=not PIPELINE_IN_MEMORY,
+                     help="Run the steps one after the other from disk instead of the in-memory pipeline.")
+    run.add_argument("--incremental", action=argparse.BooleanOptionalAction, default=COMBINE_INCREMENTAL,
+                     help="With --step-by-step, only combine new or changed CSVs.")
+    run.add_argument("--streaming", action=argparse.BooleanOptionalAction, default=CLEAN_STREAMING,
+                     help="With --step-by-step, clean the combined dataset in chunks.")
+    run.add_argument("--chunk-size", type=int, default=CLEAN_CHUNK_SIZE, help="Rows per chunk when streaming.")
+    run.set_defaults(handler=command_run)
+
+    daemon = subparsers.add_parser("daemon", help=command_daemon.__doc__)
+    daemon.add_argument("--interval", type=float, default=DAEMON_POLL_INTERVAL,
+                        help=f"Seconds between two polls. Default is {DAEMON_POLL_INTERVAL}.")
+    daemon.add_argument("--days", type=int, default=BUSINESS_DAYS_COUNT,
+                        help=f"Business days processed on each ingest. Default is {BUSINESS_DAYS_COUNT}.")
+    daemon.add_argument("--date", metavar="YYYYMMDD", help="Poll this business day instead of today.")
+    daemon.add_argument("--status-port", type=int, default=DAEMON_STATUS_PORT,
+                        help="Serve /status and /health on this port (0 picks a free one).")
+    daemon.add_argument("--max-polls", type=int, help="Stop after this many polls. Default polls until stopped.")
+    daemon.add_argument("--download-workers", type=int, default=DOWNLOAD_MAX_WORKERS, help="Concurrent downloads.")
+    daemon.add_argument("--parse-workers", type=int, default=PARSE_MAX_WORKERS, help="Workbook parsing processes.")
+    daemon.set_defaults(handler=command_daemon)
+    return parser
+
+def main(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+    if not args.report:
+        return args.handler(args)
+
+    from utils.instrumentation import stage, start_run, finish_run
+
+    start_run(trace_memory=INSTRUMENTATION_TRACE_MEMORY, profile=args.profile)
+    try:
+        with stage(args.command):
+            return args.handler(args)
+    finally:
+        finish_run(os.path.join(args.dataset_folder, args.report_file))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,8 @@ PLOT_FOLDER = os.path.join("Daily Prices", "Plots")
 
 # Business day configuration
 BUSINESS_DAYS_COUNT = 5
+CALENDAR_START_YEAR = 2000  # Range of years precomputed by the business calendar
+CALENDAR_END_YEAR = 2078
 
 # Excel file column names
 COLUMNS = [
@@ -15,8 +17,41 @@ COLUMNS = [
     'Intervalo Indicativo Máx.', 'PU', '% Pu Par', 'Duration', '% Reune', 'Referência NTN-B'
 ]
 
-# URL configuration
-BASE_URL = "https://www.anbima.com.br/informacoes/merc-sec-debentures/arqs/"
+# Excel parsing configuration
+EXCEL_HEADER_ROWS = 9  # Rows above the data in each sheet (title, notes and the column header)
+EXCEL_NA_VALUES = ['--', 'N/D']  # Placeholders used by ANBIMA for missing values
+SOURCE_COLUMNS = COLUMNS  # Columns parsed from the workbooks and saved to the per-sheet CSVs
+PARSE_MAX_WORKERS = os.cpu_count() or 1  # Number of processes decoding workbooks in parallel
+PARSE_CACHE_FOLDER = os.path.join("Daily Prices", "Cache", "parsed")
+PARSE_RULES_VERSION = 1  # Bump whenever process_sheets changes, invalidating the parsed-workbook cache
+
+# URL configuration (the ANBIMA_BASE_URL environment variable overrides it, e.g. with a local stand-in server)
+BASE_URL = os.environ.get("ANBIMA_BASE_URL", "https://www.anbima.com.br/informacoes/merc-sec-debentures/arqs/")
+
+# Download configuration
+DOWNLOAD_MAX_WORKERS = 4  # Number of business days downloaded concurrently (1 disables concurrency)
+DOWNLOAD_MAX_RETRIES = 3
+DOWNLOAD_TIMEOUT = 10  # Seconds
+DOWNLOAD_BACKOFF_BASE = 1  # Seconds, doubled on every retry
+DOWNLOAD_BACKOFF_MAX = 30  # Seconds, upper bound for a single backoff wait
+
+# Download cache configuration
+DOWNLOAD_CACHE_FOLDER = os.path.join("Daily Prices", "Cache", "downloads")
+DOWNLOAD_CACHE_FINAL_AFTER_DAYS = 3  # Workbooks older than this (in calendar days) are no longer republished
+DOWNLOAD_CACHE_NEGATIVE_TTL = 6 * 60 * 60  # Seconds a missing file (404 on holidays/unpublished dates) is remembered
+
+# Write-behind output writer: CSVs are queued and written by background threads, atomically (temporary file
+# plus rename), while the next workbook is parsed; at most OUTPUT_WRITER_QUEUE_SIZE writes wait in the queue
+OUTPUT_WRITER_WORKERS = 2
+OUTPUT_WRITER_QUEUE_SIZE = 16
+OUTPUT_FSYNC = False  # Also fsync each file before the rename (durable across power loss, but slower)
+SOURCE_CSV_COMPRESSION = False  # Save the per-sheet CSVs gzip-compressed ('yyyymmdd-SHEET_NAME.csv.gz')
+# (the per-sheet CSVs are only written when SNAPSHOT_STORE_ENABLED is False)
+
+# Plot rendering configuration
+PLOT_MAX_WORKERS = os.cpu_count() or 1  # Number of processes rendering plots in parallel
+PLOT_MANIFEST_FILE = "plots.manifest.json"  # Fingerprint of the data of each rendered plot, next to the plots
+PLOT_STYLE_VERSION = 2  # Bump whenever the look of the plots changes, forcing them to be rendered again
 
 # Mapping of English month abbreviations to Portuguese
 MONTHS_PT_BR = {
@@ -37,7 +72,128 @@ MONTHS_PT_BR = {
 # File names for dataset preparation
 RAW_DATA_FILE = "dataset_source_combined.csv"
 CLEANED_DATA_FILE = "cleaned_dataset.csv"
+COMBINED_MANIFEST_FILE = "dataset_source_combined.manifest.json"  # Source files already in RAW_DATA_FILE
+
+# Columnar dataset store: Parquet files partitioned by date and sheet/Indexer (requires pyarrow)
+DATASET_STORE_FORMAT = "parquet"  # "parquet" or "csv" (CSV files only)
+RAW_DATA_STORE = "dataset_source_combined"  # Folder under DATASET_FOLDER
+CLEANED_DATA_STORE = "cleaned_dataset"  # Folder under DATASET_FOLDER
+RAW_DATA_PARTITIONS = ['data', 'sheet_name']
+CLEANED_DATA_PARTITIONS = ['data', 'Indexer']
+EXPORT_CSV = True  # Also export RAW_DATA_FILE and CLEANED_DATA_FILE as CSV when the store is enabled
+
+# Columns stored as floats ('--' and 'N/D' placeholders become empty values)
+NUMERIC_COLUMNS = [
+    'Taxa de Compra', 'Taxa de Venda', 'Taxa Indicativa', 'Desvio Padrão', 'Intervalo Indicativo Min.',
+    'Intervalo Indicativo Máx.', 'PU', '% Pu Par', 'Duration', '% Reune'
+]
+
+# Combine only new or changed source files into RAW_DATA_FILE, keeping the history of previous runs
+COMBINE_INCREMENTAL = True
+
+# In-memory pipeline: the stages of main hand their DataFrames over in memory and are skipped when their inputs
+# did not change (the step-by-step mode reads every stage back from disk, and supports streaming cleaning)
+PIPELINE_IN_MEMORY = True
+PIPELINE_STATE_FILE = "pipeline_state.json"  # Fingerprint and outputs of each stage, under DATASET_FOLDER
+PIPELINE_RULES_VERSION = 6  # Bump whenever a stage changes, forcing every stage to run again
+
+# Instrumentation: wall/CPU time, peak memory, rows and bytes of each stage and day, saved as a JSON run report
+INSTRUMENTATION_ENABLED = os.environ.get("BCP_INSTRUMENTATION", "0") == "1"
+INSTRUMENTATION_TRACE_MEMORY = False  # Also record the peak Python allocations of each stage (slows the run down)
+INSTRUMENTATION_PROFILE = False  # Also capture a cProfile profile of the run, saved next to the report as .prof
+RUN_REPORT_FILE = "run_report.json"  # Under DATASET_FOLDER
+
+# Streaming cleaning: the combined dataset is cleaned in chunks of CLEAN_CHUNK_SIZE rows instead of in memory
+CLEAN_STREAMING = False
+CLEAN_CHUNK_SIZE = 100_000
+
+# Validation of the cleaned dataset: when report-only, failing rows are quarantined instead of stopping the run
+VALIDATION_REPORT_ONLY = False
+QUARANTINE_FILE = "quarantined_rows.csv"
+
+# Local SQLite database with the cleaned quotes, loaded day by day after cleaning
+QUOTES_DATABASE_ENABLED = True
+QUOTES_DATABASE_FILE = "cotacao_debentures.sqlite"  # Under DATASET_FOLDER
+QUOTES_TABLE = "CotacaoDebentures"
+QUOTES_BULK_LOAD_DAYS = 20  # Loads of at least this many changed days rebuild the secondary indexes once at the end
+
+# Search index over the issuer names ('Nome') of the full history, updated after cleaning
+ISSUER_INDEX_ENABLED = True
+ISSUER_INDEX_FILE = "issuer_index.pkl"  # Under DATASET_FOLDER
+ISSUER_FUZZY_THRESHOLD = 0.6  # Minimum share of the query's trigrams found in the name of a fuzzy issuer match
+
+# Per-day aggregates of the cleaned quotes by Indexer and issuer, updated after cleaning
+DAILY_AGGREGATES_ENABLED = True
+DAILY_AGGREGATES_FILE = "daily_aggregates.pkl"  # Under DATASET_FOLDER
+AGGREGATE_COLUMNS = ['PU', 'Taxa Indicativa', 'Duration', 'Spread']  # Columns with count, sum, mean, min and max per day
+ROLLING_WINDOWS = [5, 21, 63]  # Business days of the rolling-window statistics (a week, a month, a quarter)
+
+# Dense Código x business day panel of the cleaned quotes: one float64 array per field, memory-mapped from disk with
+# a row per business day (a new day is appended to the files), updated after cleaning
+QUOTE_PANEL_ENABLED = True
+QUOTE_PANEL_FOLDER = "quote_panel"  # Under DATASET_FOLDER
+QUOTE_PANEL_INDEX_FILE = "panel.json"  # Codes and days of the array positions, under QUOTE_PANEL_FOLDER
+PANEL_FIELDS = ['PU', 'Taxa Indicativa', 'Duration']
+PANEL_CODE_CAPACITY = 4096  # Columns reserved for codes in each row, doubled (rewriting the arrays) when exceeded
+
+# Daemon mode: a warm process polling for the workbook of the current business day and ingesting it when it appears
+DAEMON_POLL_INTERVAL = 300  # Seconds between two conditional requests for the workbook
+DAEMON_STATUS_FILE = "daemon_status.json"  # Last poll, last ingest and stage latencies, under DATASET_FOLDER
+DAEMON_STATUS_HOST = '127.0.0.1'
+DAEMON_STATUS_PORT = None  # Port of the HTTP status endpoint (/status, /health); None only writes the status file
+
+# Point-in-time snapshot store of the parsed sheets: per sheet, a full base every SNAPSHOT_BASE_EVERY stored days
+# and, in between, the delta of each day keyed by SNAPSHOT_KEY_COLUMN (added rows, removed codes, changed cells).
+# When enabled it is the source of record: the per-sheet CSVs are no longer written and combine reads the store
+# (the CSVs of days it does not hold are still read; 'cli.py snapshot --import --prune' moves them in)
+SNAPSHOT_STORE_ENABLED = True  # False keeps the per-sheet CSVs as the source of record, without the store
+SNAPSHOT_FOLDER = "snapshots"  # Under SOURCE_FOLDER
+SNAPSHOT_INDEX_FILE = "snapshots.json"  # Kind, parent and digest of the file of each sheet and day
+SNAPSHOT_BASE_EVERY = 20  # Stored days of a sheet per full base (bounds the deltas applied to rebuild a day)
+SNAPSHOT_KEY_COLUMN = 'Código'
+SNAPSHOT_MAX_DECIMALS = 9  # Changed floats with up to this many decimals are stored as integer steps
+
+# Indexer of each sheet, matched as a substring of the sheet name (sheets without a match are dropped)
+INDEXER_BY_SHEET = {'IPCA_SPREAD': 'IPCA +', 'DI_PERCENTUAL': '% do DI', 'DI_SPREAD': 'DI +'}
+INDEXERS = ['DI +', 'IPCA +', '% do DI']
+
+# Low-cardinality text columns kept as pandas categoricals (each distinct value is stored once)
+CATEGORICAL_COLUMNS = ['Código', 'Nome', 'sheet_name', 'Indexer', 'Índice/ Correção', 'Índice']
+
+# Dtypes declared when loading the datasets from CSV
+RAW_DATA_DTYPES = {'Código': 'category', 'Nome': 'category', 'sheet_name': 'category', 'Índice/ Correção': 'category'}
+CLEANED_DATA_DTYPES = {
+    'Código': 'category', 'Nome': 'category', 'PU': 'float64', 'Taxa Indicativa': 'float64', 'Indexer': 'category',
+    'Duration': 'float64', '% Pu Par': 'float64', 'Índice': 'category', 'Spread': 'float64',
+    'Taxa de Compra': 'float64', 'Taxa de Venda': 'float64', 'Desvio Padrão': 'float64',
+    'Intervalo Indicativo Min.': 'float64', 'Intervalo Indicativo Máx.': 'float64', 'Flags': 'uint8'
+}
+
+# Dates are kept as datetime64 in memory and in the store, and only formatted as text in the CSV exports
+DATE_COLUMN = 'data'
+EXPORT_DATE_FORMAT = '%d/%m/%Y'
 
 # Column names used in dataset cleaning
-DATASET_COLUMNS_TO_SELECT = ['Código', 'Nome', 'PU', 'Taxa Indicativa', 'sheet_name', 'data']
-DATASET_FINAL_COLUMNS = ['Código', 'Nome', 'PU', 'Taxa Indicativa', 'data', 'Indexer']
\ No newline at end of file
+DATASET_ANALYTIC_COLUMNS = ['Duration', '% Pu Par']  # Kept as numbers by cleaning, missing values allowed
+# 'Índice/ Correção' ("DI + 4,35%", "IPCA + 6,1%", "110,5% do DI") is parsed into the index ('DI +', 'IPCA +',
+# '% do DI'...) and the spread: % a.a. over the index, or % of the DI (missing when the text does not parse)
+DATASET_INDEX_SOURCE_COLUMN = 'Índice/ Correção'
+DATASET_INDEX_COLUMNS = ['Índice', 'Spread']
+# Buy/sell rates, dispersion and indicative interval of each quote, kept for the quote screening
+DATASET_QUOTE_COLUMNS = [
+    'Taxa de Compra', 'Taxa de Venda', 'Desvio Padrão', 'Intervalo Indicativo Min.', 'Intervalo Indicativo Máx.'
+]
+DATASET_COLUMNS_TO_SELECT = ['Código', 'Nome', 'PU', 'Taxa Indicativa', 'sheet_name', 'data'] + \
+                            DATASET_ANALYTIC_COLUMNS + [DATASET_INDEX_SOURCE_COLUMN] + DATASET_QUOTE_COLUMNS
+DATASET_FINAL_COLUMNS = ['Código', 'Nome', 'PU', 'Taxa Indicativa', 'data', 'Indexer'] + DATASET_ANALYTIC_COLUMNS + \
+                        DATASET_INDEX_COLUMNS + DATASET_QUOTE_COLUMNS + ['Flags']
+
+# Quote screening: cleaning gives every quote a bitmask ('Flags', 0 when clean) of the QUOTE_FLAGS it raises
+QUOTE_FLAGS = {'stale': 1, 'out_of_interval': 2, 'outside_bid_ask': 4, 'jump': 8}
+SCREEN_STALE_DAYS = 5  # Business days over which an unchanged 'Taxa Indicativa' of a code makes it stale
+SCREEN_JUMP_WINDOW = 21  # Previous daily rate changes of a code whose mean and standard deviation judge a jump
+SCREEN_JUMP_MIN_PERIODS = 5  # Fewer previous changes than this never make a jump
+SCREEN_JUMP_STDS = 4.0  # Standard deviations from the mean change that make a jump
+SCREEN_JUMP_MIN_CHANGE = 0.05  # Percentage points: smaller moves are never jumps, even for flat histories
+SCREEN_RATE_TOLERANCE = 1e-9  # Floating point noise allowed past the bounds (rates are screened before rounding)
+SCREEN_HISTORY_DAYS = 2 * SCREEN_JUMP_WINDOW  # Stored business days before a cleaned window screened as its history
\ No newline at end of file
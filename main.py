@@ -1,38 +1,84 @@
-from processing.dataset_preparation import download_and_save_files, prepare_and_clean_dataset
+import os
+from processing.dataset_preparation import (
+    download_and_save_files, prepare_and_clean_dataset, prepare_and_clean_dataset_streaming
+)
+from processing.pipeline import PipelineRunner
 from utils.csv_utilities import combine_and_save_csvs
 from utils.date_utilities import get_business_days
 from utils.plot_indicative_rate import plot_indicative_rate_by_indexer
-from config import SOURCE_FOLDER, DATASET_FOLDER, PLOT_FOLDER, BUSINESS_DAYS_COUNT
+from utils.download_cache import DownloadCache
+from utils.parse_cache import ParsedWorkbookCache
+from utils.instrumentation import stage, start_run, finish_run
+from config import (
+    SOURCE_FOLDER, DATASET_FOLDER, PLOT_FOLDER, BUSINESS_DAYS_COUNT, DOWNLOAD_MAX_WORKERS, PARSE_MAX_WORKERS,
+    COMBINE_INCREMENTAL, CLEAN_STREAMING, CLEAN_CHUNK_SIZE, PIPELINE_IN_MEMORY, INSTRUMENTATION_ENABLED,
+    INSTRUMENTATION_TRACE_MEMORY, INSTRUMENTATION_PROFILE, RUN_REPORT_FILE
+)
 
 def main():
     """
     Main function that orchestrates the process of data extraction, 
     CSV combination, dataset preparation, and plotting.
     """
-    print("Step 1: Getting the list of recent business days.")
-    # Get the list of recent business days
-    business_days = get_business_days(BUSINESS_DAYS_COUNT)
-    print(f"Business days: {business_days}")
+    if INSTRUMENTATION_ENABLED:
+        start_run(trace_memory=INSTRUMENTATION_TRACE_MEMORY, profile=INSTRUMENTATION_PROFILE)
 
+    try:
+        print("Step 1: Getting the list of recent business days.")
+        # Get the list of recent business days
+        business_days = get_business_days(BUSINESS_DAYS_COUNT)
+        print(f"Business days: {business_days}")
+
+        if PIPELINE_IN_MEMORY:
+            # Steps 2 to 5 as an in-memory pipeline, skipping the stages whose inputs did not change
+            runner = PipelineRunner(SOURCE_FOLDER, DATASET_FOLDER, download_workers=DOWNLOAD_MAX_WORKERS,
+                                    parse_workers=PARSE_MAX_WORKERS, download_cache=DownloadCache(),
+                                    parse_cache=ParsedWorkbookCache())
+            runner.run(business_days)
+        else:
+            run_steps(business_days)
+    finally:
+        # Writes the run report, even for a failed run (does nothing when instrumentation is off)
+        finish_run(os.path.join(DATASET_FOLDER, RUN_REPORT_FILE))
+
+def run_steps(business_days: list) -> None:
+    """
+    Runs steps 2 to 5 one after the other, each stage reading the output of the previous one from disk.
+
+    Args:
+        business_days (list): List of business days to process.
+    """
     print("Step 2: Data extraction - Downloading and saving files for the business days.")
     # 1. Data extraction - Downloads and saves the files for the business days
-    download_and_save_files(SOURCE_FOLDER, business_days)
+    with stage("extract"):
+        download_and_save_files(SOURCE_FOLDER, business_days, max_workers=DOWNLOAD_MAX_WORKERS,
+                                cache=DownloadCache(), parse_workers=PARSE_MAX_WORKERS,
+                                parse_cache=ParsedWorkbookCache())
     print("Files downloaded and saved successfully.")
 
     print("Step 3: CSV combination - Combining the CSV files for the business days.")
     # 2. CSV combination - Combines the CSV files for the business days
     # Adds the 'sheet_name' and 'date' columns to the combined DataFrame
-    combined_dataframe = combine_and_save_csvs(SOURCE_FOLDER, business_days, DATASET_FOLDER)
+    with stage("combine") as metrics:
+        combined_dataframe = combine_and_save_csvs(SOURCE_FOLDER, business_days, DATASET_FOLDER,
+                                                   incremental=COMBINE_INCREMENTAL)
+        metrics.count(rows_out=len(combined_dataframe))
     print("CSV files combined successfully.")
 
     print("Step 4: Dataset preparation - Cleaning and preparing the dataset for further analysis.")
     # 3. Dataset preparation - Cleans and prepares the dataset for further analysis
-    prepare_and_clean_dataset(DATASET_FOLDER)
+    with stage("clean"):
+        if CLEAN_STREAMING:
+            prepare_and_clean_dataset_streaming(DATASET_FOLDER, CLEAN_CHUNK_SIZE)
+        else:
+            prepare_and_clean_dataset(DATASET_FOLDER)
     print("Dataset prepared and cleaned successfully.")
 
     print("Step 5: Plotting - Generating plots based on the indicative rate by indexer.")
     # 4. Plotting - Generates plots based on the indicative rate by indexer
-    plot_indicative_rate_by_indexer(DATASET_FOLDER)
+    with stage("plot") as metrics:
+        saved_files = plot_indicative_rate_by_indexer(DATASET_FOLDER)
+        metrics.count(plots=len(saved_files))
     print("Plots generated successfully.")
 
 if __name__ == "__main__":
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+from processing.pipeline import PipelineRunner
+from utils.business_calendar import get_calendar
+from utils.csv_utilities import save_manifest
+from utils.download_cache import DownloadCache
+from utils.file_downloader import build_url, create_session, download_file
+from utils.instrumentation import stage
+from utils.parse_cache import ParsedWorkbookCache
+from config import (
+    SOURCE_FOLDER, DATASET_FOLDER, BUSINESS_DAYS_COUNT, DOWNLOAD_MAX_WORKERS, PARSE_MAX_WORKERS,
+    DAEMON_POLL_INTERVAL, DAEMON_STATUS_FILE, DAEMON_STATUS_HOST, DAEMON_STATUS_PORT
+)
+
+class _StatusRequestHandler(BaseHTTPRequestHandler):
+    """Answers GET /status with the daemon status and GET /health with 200 (healthy) or 503, both as JSON."""
+
+    def do_GET(self):
+        daemon = self.server.daemon
+        if self.path.rstrip('/') in ('', '/status'):
+            code, body = 200, daemon.snapshot()
+        elif self.path.rstrip('/') == '/health':
+            healthy = daemon.is_healthy()
+            code, body = (200 if healthy else 503), {'healthy': healthy, 'state': daemon.snapshot()['state']}
+        else:
+            code, body = 404, {'error': f"Unknown path '{self.path}', expected /status or /health."}
+        content = json.dumps(body, indent=2, default=str).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+class PublicationDaemon:
+    """
+    Long-running mode of the daily job: the process stays warm (libraries imported, caches and HTTP session
+    open) and polls for the workbook of the current business day every 'poll_interval' seconds with a
+    conditional GET. When a new or republished workbook appears, the pipeline runs for the last business days
+    ending on that day, and its fingerprints skip every stage whose inputs did not change.
+
+    The status (last poll, last ingest, latency of each stage, last error) is written to DAEMON_STATUS_FILE
+    after every poll and, when a port is given, served as JSON on /status and /health.
+    """
+
+    def __init__(self, source_folder: str = SOURCE_FOLDER, destination_folder: str = DATASET_FOLDER,
+                 poll_interval: float = DAEMON_POLL_INTERVAL, days: int = BUSINESS_DAYS_COUNT,
+                 download_workers: int = DOWNLOAD_MAX_WORKERS, parse_workers: int = PARSE_MAX_WORKERS,
+                 status_port: int = DAEMON_STATUS_PORT, target_date: str = None):
+        """
+        Args:
+            source_folder (str): Path to the folder of the sheets (snapshot store and per-sheet CSVs).
+            destination_folder (str): Path to the folder where the datasets and the status file are saved.
+            poll_interval (float): Seconds between two polls. Default is DAEMON_POLL_INTERVAL.
+            days (int): Number of business days processed on each ingest. Default is BUSINESS_DAYS_COUNT.
+            download_workers (int): Maximum number of days downloaded at the same time on an ingest.
+            parse_workers (int): Maximum number of processes decoding workbooks on an ingest.
+            status_port (int): Port of the HTTP status endpoint (0 picks a free port). Default is
+                               DAEMON_STATUS_PORT; None serves no endpoint.
+            target_date (str): Business day ('yyyymmdd') to poll instead of today, e.g. to test against a
+                               local stand-in for BASE_URL serving a past workbook.
+        """
+        self.destination_folder = destination_folder
+        self.poll_interval = poll_interval
+        self.days = days
+        self.status_port = status_port
+        self.target_date = target_date
+        self.status_path = os.path.join(destination_folder, DAEMON_STATUS_FILE)
+
+        # A workbook that is not published yet must be asked for again on the next poll, not after the TTL
+        self.download_cache = DownloadCache(negative_ttl=0)
+        self.session = create_session(1)
+        self.runner = PipelineRunner(source_folder, destination_folder, download_workers=download_workers,
+                                     parse_workers=parse_workers, download_cache=self.download_cache,
+                                     parse_cache=ParsedWorkbookCache())
+
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._server = None
+        self._last_hash = None
+        self.status = {
+            'pid': os.getpid(), 'started': datetime.now().isoformat(timespec='seconds'), 'state': 'starting',
+            'poll_interval': poll_interval, 'polls': 0, 'ingests': 0, 'target_day': None, 'last_poll': None,
+            'last_poll_result': None, 'last_poll_seconds': None, 'last_ingest': None, 'last_ingest_day': None,
+            'stage_seconds': {}, 'skipped_stages': [], 'last_error': None,
+        }
+
+    def snapshot(self) -> dict:
+        """Returns a copy of the current status."""
+        with self._lock:
+            return json.loads(json.dumps(self.status, default=str))
+
+    def is_healthy(self) -> bool:
+        """Returns True if the last poll did not fail and happened within three poll intervals."""
+        status = self.snapshot()
+        if status['state'] == 'starting':
+            return True
+        if status['last_poll'] is None or status['last_poll_result'] == 'error':
+            return False
+        age = (datetime.now() - datetime.fromisoformat(status['last_poll'])).total_seconds()
+        return age <= 3 * self.poll_interval + 60
+
+    def _update_status(self, **changes) -> None:
+        """Updates the status and saves it to DAEMON_STATUS_FILE."""
+        with self._lock:
+            self.status.update(changes)
+            status = dict(self.status)
+        os.makedirs(self.destination_folder, exist_ok=True)
+        save_manifest(status, self.status_path)
+
+    def target_day(self, now: datetime = None) -> str:
+        """Returns the business day to poll ('yyyymmdd'), or None on weekends and holidays."""
+        if self.target_date:
+            return self.target_date
+        today = (now or datetime.now()).date()
+        return today.strftime('%Y%m%d') if get_calendar().is_business_day(today) else None
+
+    def download_target(self, day: str) -> bytes:
+        """
+        Downloads the workbook of the target day (a conditional GET when it is cached).
+
+        Args:
+            day (str): Business day in the format 'yyyymmdd'.
+
+        Returns:
+            bytes: The workbook, or None if the server answered that it does not exist (404/410).
+
+        Raises:
+            ConnectionError: If the download failed without such an answer (connection error, timeout, 5xx),
+                             so an outage is never taken for a workbook that is not published yet.
+        """
+        url = build_url(pd.to_datetime(day, format="%Y%m%d"))
+        requested_at = time.time()
+        with stage("download", day=day) as metrics:
+            file_data = download_file(url, session=self.session, cache=self.download_cache)
+            metrics.count(bytes_read=len(file_data) if file_data else 0)
+        if file_data is None:
+            # A 404/410 answered during this poll leaves a fresh negative entry in the cache
+            entry = self.download_cache.lookup(url)
+            answered = entry.get('fetched_at', 0) >= requested_at or self.download_cache.is_missing(entry) \
+                if entry is not None and entry.get('status') != 200 else False
+            if not answered:
+                raise ConnectionError(f"the download of {url} failed without an answer from the server")
+        return file_data
+
+    def poll_once(self, now: datetime = None) -> str:
+        """
+        Polls for the workbook of the target day once, ingesting it if it is new or was republished. A download
+        that fails (rather than being answered 404/410) is an 'error', which turns /health unhealthy.
+
+        Args:
+            now (datetime): Time of the poll, used to pick the target day. Default is the current time.
+
+        Returns:
+            str: 'idle' (not a business day), 'not published', 'unchanged', 'ingested' or 'error'.
+        """
+        start_time = time.perf_counter()
+        day = self.target_day(now)
+        changes = {'target_day': day}
+        try:
+            if day is None:
+                result = 'idle'
+            else:
+                file_data = self.download_target(day)
+                file_hash = hashlib.sha256(file_data).hexdigest() if file_data else None
+                if file_data is None:
+                    result = 'not published'
+                elif file_hash == self._last_hash:
+                    result = 'unchanged'
+                else:
+                    business_days = [business_day.strftime('%Y%m%d')
+                                     for business_day in get_calendar().last_business_days(self.days, day)]
+                    timings, skipped = self.runner.run(business_days)
+                    self._last_hash = file_hash
+                    result = 'ingested'
+                    changes.update({
+                        'ingests': self.status['ingests'] + 1,
+                        'last_ingest': datetime.now().isoformat(timespec='seconds'), 'last_ingest_day': day,
+                        'stage_seconds': {stage: round(seconds, 6) for stage, seconds in timings.items()},
+                        'skipped_stages': skipped,
+                    })
+            changes['last_error'] = None
+        except Exception as e:
+            result = 'error'
+            changes['last_error'] = f"{type(e).__name__}: {e}"
+            print(f"Error polling for the workbook of {day}: {e}")
+
+        self._update_status(state='running', polls=self.status['polls'] + 1, last_poll_result=result,
+                            last_poll=datetime.now().isoformat(timespec='seconds'),
+                            last_poll_seconds=round(time.perf_counter() - start_time, 6), **changes)
+        return result
+
+    def start_status_server(self) -> str:
+        """Starts the HTTP status endpoint in a background thread and returns its URL."""
+        self._server = ThreadingHTTPServer((DAEMON_STATUS_HOST, self.status_port), _StatusRequestHandler)
+        self._server.daemon_threads = True
+        self._server.daemon = self
+        threading.Thread(target=self._server.serve_forever, name="daemon-status", daemon=True).start()
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/status"
+
+    def stop(self) -> None:
+        """Asks the polling loop to stop after the current poll."""
+        self._stop.set()
+
+    def run(self, max_polls: int = None) -> None:
+        """
+        Polls until stopped (SIGINT/SIGTERM or stop()) or until 'max_polls' polls were made.
+
+        Args:
+            max_polls (int): Number of polls before returning. Default polls forever.
+        """
+        if threading.current_thread() is threading.main_thread():
+            for signal_number in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signal_number, lambda *_: self.stop())
+        if self.status_port is not None:
+            print(f"Daemon status served on: {self.start_status_server()}")
+
+        polls = 0
+        try:
+            while not self._stop.is_set():
+                result = self.poll_once()
+                polls += 1
+                print(f"Poll {polls} for {self.status['target_day']}: {result}.")
+                if max_polls is not None and polls >= max_polls:
+                    break
+                self._stop.wait(self.poll_interval)
+        finally:
+            self._update_status(state='stopped')
+            if self._server is not None:
+                self._server.shutdown()
+                self._server.server_close()
+            self.session.close()
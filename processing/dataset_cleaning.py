@@ -1,40 +1,167 @@
+import os
+from datetime import timedelta
 import pandas as pd
 import numpy as np
+from utils.business_calendar import get_calendar
 from utils.csv_utilities import validate_date_column
-from config import DATASET_COLUMNS_TO_SELECT, DATASET_FINAL_COLUMNS
+from utils.dataset_store import load_dataset, parse_dates, dataset_outputs, resolve_folder
+from utils.quote_screening import screen_quotes
+from config import (
+    DATASET_COLUMNS_TO_SELECT, DATASET_FINAL_COLUMNS, DATASET_ANALYTIC_COLUMNS, INDEXER_BY_SHEET, INDEXERS,
+    DATASET_INDEX_SOURCE_COLUMN, DATASET_INDEX_COLUMNS, DATASET_QUOTE_COLUMNS, RAW_DATA_STORE, RAW_DATA_FILE,
+    RAW_DATA_DTYPES, SCREEN_HISTORY_DAYS
+)
 
-def clean_dataset(df: pd.DataFrame) -> pd.DataFrame:
+# "DI + 4,35%" / "IPCA + 6,1%" (index plus a spread) or "110,5% do DI" (percentage of an index), with
+# Brazilian number formatting ('1.234,5')
+INDEX_CORRECTION_PATTERN = (r'^\s*(?:(?P<base>[^\d%+]*[^\d%+\s])\s*\+\s*(?P<spread>\d[\d.]*(?:,\d+)?)\s*%'
+                            r'|(?P<percent>\d[\d.]*(?:,\d+)?)\s*%\s*d[oa]\s+(?P<of>\S.*?))\s*$')
+
+def map_sheet_to_indexer(sheet_names: pd.Series) -> pd.Series:
+    """
+    Maps each sheet name to its Indexer ('Other' when no key of INDEXER_BY_SHEET is part of the name).
+    The substring test runs once per distinct sheet name and is broadcast to the rows through the
+    categorical codes, instead of once per row.
+
+    Args:
+        sheet_names (pd.Series): Sheet name of each row.
+
+    Returns:
+        pd.Series: Categorical Indexer of each row, with categories INDEXERS + ['Other'].
+    """
+    sheets = sheet_names.astype('category')
+    categories = INDEXERS + ['Other']
+    category_codes = np.array([
+        categories.index(next((indexer for key, indexer in INDEXER_BY_SHEET.items() if key in str(sheet)), 'Other'))
+        for sheet in sheets.cat.categories
+    ] + [categories.index('Other')], dtype='int8')  # Last entry is used by missing sheet names (code -1)
+
+    codes = category_codes[sheets.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=sheet_names.index)
+
+def parse_index_correction(values: pd.Series) -> pd.DataFrame:
+    """
+    Parses the free text of 'Índice/ Correção' into a categorical index and a float spread: "DI + 4,35%" is
+    ('DI +', 4.35), "IPCA + 6,1%" is ('IPCA +', 6.1) and "110,5% do DI" is ('% do DI', 110.5). The text is
+    parsed once per distinct value (a few hundred over the full history) and broadcast to the rows through
+    the categorical codes, so the cost per row is a single array lookup.
+
+    Args:
+        values (pd.Series): 'Índice/ Correção' of each row (text or categorical).
+
+    Returns:
+        pd.DataFrame: Columns DATASET_INDEX_COLUMNS ('Índice' categorical, with the INDEXERS first, and 'Spread'
+                      float), missing where the text is missing or does not parse.
+    """
+    values = values.astype('category')
+    parts = pd.Series(values.cat.categories.astype(str)).str.extract(INDEX_CORRECTION_PATTERN)
+
+    labels = (parts['base'].str.strip().str.upper() + ' +').fillna('% do ' + parts['of'].str.strip().str.upper())
+    numbers = parts['spread'].fillna(parts['percent']).str.replace('.', '', regex=False)
+    spreads = pd.to_numeric(numbers.str.replace(',', '.', regex=False), errors='coerce').to_numpy(dtype='float64')
+
+    found = labels.dropna().unique().tolist()
+    categories = INDEXERS + sorted(set(found) - set(INDEXERS))
+    label_codes = pd.Categorical(labels, categories=categories).codes
+
+    # Last entries are used by missing values (code -1)
+    codes = np.append(label_codes, -1).astype('int16')[values.cat.codes.to_numpy()]
+    spread = np.append(spreads, np.nan)[values.cat.codes.to_numpy()]
+    index_column, spread_column = DATASET_INDEX_COLUMNS
+    return pd.DataFrame({
+        index_column: pd.Categorical.from_codes(codes, categories=categories),
+        spread_column: spread,
+    }, index=values.index)
+
+def screening_history(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the quotes of a raw (combined) dataset that clean_dataset would screen, in the form screen_quotes takes
+    as history: 'Código', 'data' and the unrounded 'Taxa Indicativa' of the rows of a known Indexer with a valid
+    'PU' and rate.
+
+    Args:
+        df (pd.DataFrame): Raw rows, with 'Código', 'PU', 'Taxa Indicativa', 'sheet_name' and 'data'.
+
+    Returns:
+        pd.DataFrame: The screened quotes, with 'data' as datetime64.
+    """
+    known = map_sheet_to_indexer(df['sheet_name']) != 'Other'
+    history = pd.DataFrame({
+        'Código': df.loc[known, 'Código'].astype(str),
+        'data': parse_dates(df.loc[known, 'data']),
+        'Taxa Indicativa': pd.to_numeric(df.loc[known, 'Taxa Indicativa'], errors='coerce'),
+        'PU': pd.to_numeric(df.loc[known, 'PU'], errors='coerce'),
+    })
+    return history.dropna().drop(columns='PU')
+
+def load_screening_history(destination_folder: str, first_date) -> pd.DataFrame:
+    """
+    Loads the stored raw quotes of the SCREEN_HISTORY_DAYS business days before 'first_date', so that a window of
+    the last days is screened against the history of its codes (stale runs and jumps need the earlier quotes).
+
+    Args:
+        destination_folder (str): Folder holding the combined dataset (RAW_DATA_STORE or RAW_DATA_FILE).
+        first_date: First day of the quotes to screen.
+
+    Returns:
+        pd.DataFrame: The history (see screening_history), empty when no earlier day is stored.
+    """
+    outputs = dataset_outputs(destination_folder, RAW_DATA_STORE, RAW_DATA_FILE)
+    if not any(os.path.exists(resolve_folder(path)) for path in outputs):
+        return pd.DataFrame(columns=['Código', 'data', 'Taxa Indicativa'])
+
+    last_day = pd.Timestamp(first_date) - timedelta(days=1)
+    start_day = get_calendar().last_business_days(SCREEN_HISTORY_DAYS, last_day)[-1]
+    df = load_dataset(destination_folder, RAW_DATA_STORE, RAW_DATA_FILE,
+                      columns=['Código', 'PU', 'Taxa Indicativa', 'sheet_name', 'data'],
+                      start_date=start_day, end_date=last_day, dtype=RAW_DATA_DTYPES)
+    if df is None or df.empty:
+        return pd.DataFrame(columns=['Código', 'data', 'Taxa Indicativa'])
+    return screening_history(df)
+
+def clean_dataset(df: pd.DataFrame, history: pd.DataFrame = None) -> pd.DataFrame:
     """
     Cleans the dataset by performing the following tasks:
     1. Selecting only relevant columns.
-    2. Creating an 'Indexer' column based on the 'sheet_name'.
+    2. Creating a categorical 'Indexer' column based on the 'sheet_name', and parsing 'Índice/ Correção' into
+       the categorical 'Índice' and the float 'Spread' (parse_index_correction).
     3. Filtering out rows with invalid 'Indexer' values.
     4. Converting date formats using the existing validate_date_column function.
-    5. Ensuring 'PU' and 'Taxa Indicativa' are numeric and removing invalid rows.
-    6. Formatting numeric columns to 2 decimal places.
+    5. Ensuring 'PU' and 'Taxa Indicativa' are numeric and removing invalid rows, and converting the analytic
+       columns ('Duration', '% Pu Par') and the buy/sell, dispersion and interval columns to numbers, keeping
+       the rows where they are missing.
+    6. Screening the quotes into the 'Flags' bitmask (stale, out-of-interval, outside buy/sell and jump quotes),
+       on the unrounded rates and against the 'history' of their codes.
+    7. Formatting numeric columns to 2 decimal places.
+    8. Storing 'Código' and 'Nome' as categoricals.
+    9. Sorting the rows by date, so date ranges are selected by binary search (select_date_range).
 
     Args:
         df (pd.DataFrame): The raw dataset that needs cleaning. 
                            It should include at least the following columns: 
-                           ['Código', 'Nome', 'PU', 'Taxa Indicativa', 'sheet_name', 'data']
+                           ['Código', 'Nome', 'PU', 'Taxa Indicativa', 'sheet_name', 'data', 'Duration', '% Pu Par',
+                            'Índice/ Correção'] + DATASET_QUOTE_COLUMNS
+        history (pd.DataFrame, optional): Earlier quotes of the codes for the stale and jump rules, as returned by
+                                          load_screening_history or screening_history. Default is None.
 
     Returns:
         pd.DataFrame: The cleaned dataset with the following columns: 
-                      ['Código', 'Nome', 'PU', 'Taxa Indicativa', 'data', 'Indexer']
-                      Rows with invalid or missing values are removed, and numeric fields are rounded to 2 decimals.
+                      ['Código', 'Nome', 'PU', 'Taxa Indicativa', 'data', 'Indexer', 'Duration', '% Pu Par',
+                       'Índice', 'Spread'] + DATASET_QUOTE_COLUMNS + ['Flags']
+                      Rows with invalid or missing values are removed, numeric fields are rounded to 2 decimals
+                      and 'data' is datetime64, in ascending order.
     """
     
     # Step 1: Select only the columns of interest
     df_cleaned = df.loc[:, DATASET_COLUMNS_TO_SELECT]
 
     # Step 2: Create a new 'Indexer' column based on the 'sheet_name'
-    df_cleaned['Indexer'] = df_cleaned['sheet_name'].apply(lambda x: (
-        'IPCA +' if 'IPCA_SPREAD' in str(x) else
-        '% do DI' if 'DI_PERCENTUAL' in str(x) else
-        'DI +' if 'DI_SPREAD' in str(x) else 'Other'))
+    df_cleaned['Indexer'] = map_sheet_to_indexer(df_cleaned['sheet_name'])
+    df_cleaned[DATASET_INDEX_COLUMNS] = parse_index_correction(df_cleaned[DATASET_INDEX_SOURCE_COLUMN])
 
     # Step 3: Filter out rows where 'Indexer' equals 'Other'
     df_filtered = df_cleaned[df_cleaned['Indexer'] != 'Other'].copy()
+    df_filtered['Indexer'] = df_filtered['Indexer'].cat.remove_categories(['Other'])
 
     # Step 4: Validate and clean the 'data' column using the existing csv_utilities function
     df_filtered = validate_date_column(df_filtered, 'data')
@@ -45,12 +172,26 @@ def clean_dataset(df: pd.DataFrame) -> pd.DataFrame:
     df_filtered['PU'] = pd.to_numeric(df_filtered['PU'], errors='coerce')
     df_filtered['Taxa Indicativa'] = pd.to_numeric(df_filtered['Taxa Indicativa'], errors='coerce')
     df_filtered = df_filtered.dropna(subset=['PU', 'Taxa Indicativa', 'data'])
+    for column in DATASET_ANALYTIC_COLUMNS + DATASET_QUOTE_COLUMNS:
+        df_filtered[column] = pd.to_numeric(df_filtered[column], errors='coerce')
+
+    # Step 6: Flag suspect quotes against their interval, buy/sell rates and the history of their code,
+    # before rounding hides small rate changes
+    df_filtered['Flags'] = screen_quotes(df_filtered, history)
 
-    # Step 6: Format numeric columns to 2 decimal places
+    # Step 7: Format numeric columns to 2 decimal places
     df_filtered['PU'] = df_filtered['PU'].round(2)
     df_filtered['Taxa Indicativa'] = df_filtered['Taxa Indicativa'].round(2)
 
-    # Step 7: Select final columns for output
+    # Step 8: Store the repeated text columns as categoricals
+    df_filtered['Código'] = df_filtered['Código'].astype('category')
+    df_filtered['Nome'] = df_filtered['Nome'].astype('category')
+
+    # Step 9: Sort by date (stable, so each day keeps the order of its sheets)
+    if not df_filtered['data'].is_monotonic_increasing:
+        df_filtered = df_filtered.sort_values('data', kind='stable')
+
+    # Step 10: Select final columns for output
     df_filtered = df_filtered.loc[:, DATASET_FINAL_COLUMNS]
     
     return df_filtered
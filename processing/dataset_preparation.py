@@ -1,51 +1,197 @@
 import os
+import shutil
+import time
+import numpy as np
 import pandas as pd
-from utils.data_validation import DatasetValidator
-from utils.csv_utilities import load_csv
+from concurrent.futures import ThreadPoolExecutor
+from utils.data_validation import DatasetValidator, ValidationReport, DATASET_UNIQUE_KEY
+from utils.dataset_store import (
+    load_dataset, save_dataset, store_enabled, iter_partitioned_dataset, save_partitioned_dataset, replace_folder,
+    resolve_folder
+)
+from utils.csv_utilities import source_file_name
 from utils.file_utilities import save_dataframe_to_csv
-from processing.dataset_cleaning import clean_dataset
-from utils.excel_processor import process_sheets
-from utils.file_downloader import build_url, download_file
-from config import RAW_DATA_FILE, CLEANED_DATA_FILE
+from utils.output_writer import OutputWriter
+from utils.instrumentation import stage
+from processing.dataset_cleaning import clean_dataset, screening_history
+from utils.memory_utilities import print_memory_usage
+from utils.business_calendar import get_calendar
+from utils.quote_database import load_quotes_database
+from utils.issuer_index import IssuerIndex, update_issuer_index
+from utils.daily_aggregates import DailyAggregates, aggregate_by_day, merge_aggregates, update_daily_aggregates
+from utils.quote_panel import QuotePanel, update_quote_panel
+from utils.snapshot_store import update_snapshot_store
+from utils.excel_processor import process_workbooks
+from utils.file_downloader import build_url, create_session, download_file
+from utils.download_cache import DownloadCache
+from utils.parse_cache import ParsedWorkbookCache
+from config import (
+    RAW_DATA_FILE, CLEANED_DATA_FILE, RAW_DATA_STORE, CLEANED_DATA_STORE, CLEANED_DATA_PARTITIONS,
+    DATASET_COLUMNS_TO_SELECT, DOWNLOAD_CACHE_FINAL_AFTER_DAYS, VALIDATION_REPORT_ONLY, QUARANTINE_FILE,
+    CLEAN_CHUNK_SIZE, EXPORT_CSV, EXPORT_DATE_FORMAT, RAW_DATA_DTYPES, QUOTES_DATABASE_ENABLED, ISSUER_INDEX_ENABLED,
+    ISSUER_INDEX_FILE, DAILY_AGGREGATES_ENABLED, DAILY_AGGREGATES_FILE, QUOTE_PANEL_ENABLED, QUOTE_PANEL_FOLDER,
+    SNAPSHOT_STORE_ENABLED, SCREEN_HISTORY_DAYS
+)
 
-def download_and_save_files(destination_folder: str, business_days: list) -> None:
+def download_day(date_str: str, session=None, cache: DownloadCache = None) -> bytes:
     """
-    Downloads and saves files for the given business days. Processes each sheet and saves it as
-    'sheet_name-yyyymmdd.csv'.
+    Downloads the workbook of a single business day. Errors are reported and contained to this day.
+
+    Args:
+        date_str (str): Business day in the format 'yyyymmdd'.
+        session (requests.Session): Optional shared HTTP session used for the download.
+        cache (DownloadCache): Optional on-disk download cache.
+
+    Returns:
+        bytes: The workbook content, or None if the download failed.
+    """
+    try:
+        # Convert date string to datetime
+        date = pd.to_datetime(date_str, format="%Y%m%d")
+
+        # Generate URL and download the file
+        url = build_url(date)
+        final = (pd.Timestamp.now().normalize() - date).days >= DOWNLOAD_CACHE_FINAL_AFTER_DAYS
+        with stage("download", day=date_str) as metrics:
+            file_data = download_file(url, session=session, cache=cache, final=final)
+            metrics.count(bytes_read=len(file_data) if file_data else 0)
+
+        if not file_data:
+            print(f"Failed to download the file for {date_str}.")
+        return file_data
+
+    except Exception as e:
+        print(f"Error downloading file for date {date_str}: {e}")
+        return None
+
+def save_day_sheets(destination_folder: str, date_str: str, sheets_dict: dict, writer: OutputWriter = None) -> None:
+    """
+    Saves each processed sheet of a business day individually as 'yyyymmdd-sheet_name.csv' (or '.csv.gz' when
+    SOURCE_CSV_COMPRESSION is set). Each file is written atomically, so combine never reads a partial CSV.
+
+    Args:
+        destination_folder (str): Path to the folder where the files will be saved.
+        date_str (str): Business day in the format 'yyyymmdd'.
+        sheets_dict (dict): Sheet name -> processed DataFrame, as returned by process_sheets.
+        writer (OutputWriter): Optional background writer the files are queued to, instead of written here.
+    """
+    with stage("save_day_sheets", day=date_str) as metrics:
+        for sheet_name, df in sheets_dict.items():
+            if not df.empty:
+                file_path = os.path.join(destination_folder, source_file_name(date_str, sheet_name))
+                # A copy saved with the other compression setting would be combined twice
+                stale_path = os.path.join(destination_folder, source_file_name(
+                    date_str, sheet_name, compressed=not file_path.endswith('.gz')))
+                if os.path.exists(stale_path):
+                    os.remove(stale_path)
+                if writer is not None:
+                    writer.write_csv(df, file_path)
+                    metrics.count(rows_out=len(df))
+                else:
+                    save_dataframe_to_csv(df, file_path)
+                    metrics.count(rows_out=len(df), bytes_written=os.path.getsize(file_path))
+
+def day_sheets_saved(destination_folder: str, date_str: str, sheets_dict: dict) -> bool:
+    """Returns True if the CSV of every non-empty sheet of the business day already exists."""
+    return all(os.path.exists(os.path.join(destination_folder, source_file_name(date_str, sheet_name)))
+               for sheet_name, df in sheets_dict.items() if not df.empty)
+
+def download_workbooks(business_days: list, max_workers: int = 1, cache: DownloadCache = None) -> dict:
+    """
+    Downloads the workbooks of the given business days. When 'max_workers' is greater than 1 the days are
+    downloaded concurrently by a thread pool sharing a single keep-alive session.
+
+    Args:
+        business_days (list): List of business days ('yyyymmdd') to download.
+        max_workers (int): Maximum number of days downloaded at the same time. Default is 1 (sequential).
+        cache (DownloadCache): Optional on-disk download cache, avoiding requests for unchanged or missing files.
+
+    Returns:
+        dict: Mapping of business day to the Excel file in bytes format (days that failed are left out).
+    """
+    max_workers = max(1, min(max_workers, len(business_days)))
+    start_time = time.perf_counter()
+
+    with create_session(max_workers) as session:
+        if max_workers == 1:
+            downloaded = [download_day(date_str, session, cache) for date_str in business_days]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                downloaded = list(executor.map(lambda date_str: download_day(date_str, session, cache),
+                                               business_days))
+
+    elapsed = time.perf_counter() - start_time
+    workbooks = {date_str: file_data for date_str, file_data in zip(business_days, downloaded) if file_data}
+    total_bytes = sum(len(file_data) for file_data in workbooks.values())
+    print(f"Downloaded {len(workbooks)}/{len(business_days)} files ({total_bytes / 1_048_576:.2f} MB) "
+          f"in {elapsed:.2f}s using {max_workers} worker(s): "
+          f"{len(workbooks) / elapsed if elapsed else 0:.2f} files/s, "
+          f"{total_bytes / 1_048_576 / elapsed if elapsed else 0:.2f} MB/s.")
+    return workbooks
+
+def download_and_save_files(destination_folder: str, business_days: list, max_workers: int = 1,
+                            cache: DownloadCache = None, parse_workers: int = 1,
+                            parse_cache: ParsedWorkbookCache = None) -> None:
+    """
+    Downloads and saves files for the given business days. Processes each sheet and adds it to the snapshot
+    store of the folder (SNAPSHOT_STORE_ENABLED, the source of record), or otherwise saves it as
+    'yyyymmdd-sheet_name.csv'.
+
+    When 'max_workers' is greater than 1 the business days are downloaded concurrently by a thread pool
+    sharing a single keep-alive session, and when 'parse_workers' is greater than 1 the workbooks are
+    decoded in parallel by a process pool. A failure on one day never affects the others. The sheets of each
+    day are queued to a background writer as soon as the day is parsed, so writing overlaps parsing.
+
+    With a parsed-workbook cache, a workbook whose bytes were already parsed with the current rules is neither
+    decoded again nor, if its CSVs are still in place, written again. The snapshot store leaves the sheets that
+    did not change untouched.
 
     Args:
         destination_folder (str): Path to the folder where the files will be saved.
         business_days (list): List of business days to process.
+        max_workers (int): Maximum number of days downloaded at the same time. Default is 1 (sequential).
+        cache (DownloadCache): Optional on-disk download cache, avoiding requests for unchanged or missing files.
+        parse_workers (int): Maximum number of processes decoding workbooks. Default is 1 (sequential).
+        parse_cache (ParsedWorkbookCache): Optional cache of parsed workbooks.
     """
     # Ensure the destination folder exists
     if not os.path.exists(destination_folder):
         os.makedirs(destination_folder)
         print(f"Created directory: {destination_folder}")
 
-    for date_str in business_days:
-        try:
-            # Convert date string to datetime
-            date = pd.to_datetime(date_str, format="%Y%m%d")
-            
-            # Generate URL and download the file
-            url = build_url(date)
-            file_data = download_file(url)
-
-            if file_data:
-                # Process the data from the sheet
-                sheets_dict = process_sheets(file_data, date_str)
-
-                # Save each processed sheet individually as a CSV
-                for sheet_name, df in sheets_dict.items():
-                    if not df.empty:
-                        file_path = os.path.join(destination_folder, f"{date_str}-{sheet_name}.csv")
-                        save_dataframe_to_csv(df, file_path)
-                        print(f"File saved: {file_path}")
-            else:
-                print(f"Failed to download the file for {date_str}.")
-        
-        except Exception as e:
-            print(f"Error processing file for date {date_str}: {e}")
+    workbooks = download_workbooks(business_days, max_workers, cache)
+
+    # Process the data from the sheets of every downloaded workbook
+    start_time = time.perf_counter()
+    cached_days = {date_str for date_str, file_data in workbooks.items()
+                   if parse_cache is not None and parse_cache.contains(file_data)}
+
+    with OutputWriter() as writer:
+        def save_parsed_day(date_str: str, sheets_dict: dict) -> None:
+            if SNAPSHOT_STORE_ENABLED:
+                return  # The parsed days go to the snapshot store below, in date order
+            try:
+                if date_str in cached_days and day_sheets_saved(destination_folder, date_str, sheets_dict):
+                    return  # Same workbook and parse rules as the CSVs already saved
+                save_day_sheets(destination_folder, date_str, sheets_dict, writer=writer)
+            except Exception as e:
+                print(f"Error saving files for date {date_str}: {e}")
+
+        with stage("parse") as metrics:
+            processed = process_workbooks(workbooks, parse_workers, cache=parse_cache, on_parsed=save_parsed_day)
+            metrics.count(bytes_read=sum(len(file_data) for file_data in workbooks.values()),
+                          rows_out=sum(len(df) for sheets_dict in processed.values() for df in sheets_dict.values()))
+        print(f"Processed {len(processed)} workbooks in {time.perf_counter() - start_time:.2f}s.")
+
+        if SNAPSHOT_STORE_ENABLED and processed:
+            # Parsed days are kept as deltas of the previous day, from which any day can be rebuilt exactly
+            writer.submit(update_snapshot_store, destination_folder, processed)
+
+        # Wait for the sheets to be on disk before returning, since the combine step reads them next
+        with stage("flush_writes"):
+            errors = writer.flush()
+    for error in errors:
+        print(f"Error saving a sheet: {error}")
 
 def prepare_and_clean_dataset(destination_folder: str) -> None:
     """
@@ -54,29 +200,184 @@ def prepare_and_clean_dataset(destination_folder: str) -> None:
     Args:
         destination_folder (str): Path to the folder where the files are stored.
     """
-    # Load the combined dataset
-    input_file_path = os.path.join(destination_folder, RAW_DATA_FILE)
-    
     try:
-        df = load_csv(input_file_path)
+        # Load the combined dataset, reading only the columns used by the cleaning step
+        df = load_dataset(destination_folder, RAW_DATA_STORE, RAW_DATA_FILE, columns=DATASET_COLUMNS_TO_SELECT,
+                          dtype=RAW_DATA_DTYPES)
         if df is None:
-            print(f"Failed to load the dataset from {input_file_path}.")
+            print(f"Failed to load the dataset from {destination_folder}.")
             return
 
         # Clean the dataset
-        df_cleaned = clean_dataset(df)
+        with stage("clean_dataset") as metrics:
+            df_cleaned = clean_dataset(df)
+            metrics.count(rows_in=len(df), rows_out=len(df_cleaned))
+        print_memory_usage(df_cleaned, "the cleaned dataset")
+
+        # Validate the cleaned dataset in a single pass, collecting every failing rule
+        with stage("validate") as metrics:
+            report = DatasetValidator.validate_dataset(df_cleaned, raise_on_error=False)
+            metrics.count(rows_in=len(df_cleaned))
+        with OutputWriter() as writer:
+            if not report.passed and VALIDATION_REPORT_ONLY:
+                # Keep going with the valid rows, setting the failing ones aside for review
+                with stage("quarantine") as metrics:
+                    df_cleaned, df_quarantined = DatasetValidator.quarantine(df_cleaned, report)
+                    metrics.count(rows_in=len(df_cleaned) + len(df_quarantined), rows_out=len(df_cleaned))
+                writer.write_csv(df_quarantined, os.path.join(destination_folder, QUARANTINE_FILE))
+                print(f"{len(df_quarantined)} rows quarantined, continuing with {len(df_cleaned)} valid rows.")
+
+            # Save the cleaned dataset in the background while the derived outputs are updated
+            writer.submit(save_dataset, df_cleaned, destination_folder, CLEANED_DATA_STORE, CLEANED_DATA_FILE,
+                          CLEANED_DATA_PARTITIONS)
+
+            # Load the cleaned days into the local quotes database
+            if QUOTES_DATABASE_ENABLED:
+                load_quotes_database(df_cleaned, destination_folder)
 
-        # Save the cleaned dataset
-        output_file_path = os.path.join(destination_folder, CLEANED_DATA_FILE)
-        save_dataframe_to_csv(df_cleaned, output_file_path)
-        print(f"Cleaned dataset saved to: {output_file_path}")
+            # Add the issuers and codes of the cleaned dataset to the issuer search index
+            if ISSUER_INDEX_ENABLED:
+                update_issuer_index(df_cleaned, destination_folder)
 
-        # Validate the cleaned dataset
-        DatasetValidator.validate_dataset(df_cleaned)
-        print("Dataset validation passed.")
+            # Refresh the per-day aggregates of the cleaned days
+            if DAILY_AGGREGATES_ENABLED:
+                update_daily_aggregates(df_cleaned, destination_folder)
+
+            # Append the cleaned days to the dense Código x date panel
+            if QUOTE_PANEL_ENABLED:
+                update_quote_panel(df_cleaned, destination_folder)
+
+            errors = writer.flush()
+        if errors:
+            raise errors[0]
+        print(f"Cleaned dataset saved to: {destination_folder}")
+
+        if not VALIDATION_REPORT_ONLY:
+            report.raise_if_failed()
+            print("Dataset validation passed.")
     
     except Exception as e:
         print(f"Error in preparing or cleaning the dataset: {e}")
 
+def prepare_and_clean_dataset_streaming(destination_folder: str, chunksize: int = CLEAN_CHUNK_SIZE) -> None:
+    """
+    Streaming version of prepare_and_clean_dataset for long histories. The combined dataset is read in
+    bounded chunks, each chunk goes through clean_dataset and the validation rules, and is written out
+    before the next one is read, so peak memory depends on the chunk size and not on the dataset size.
+    Duplicates across chunks are detected with row-key hashes. The key holds the date and the partitions of the
+    store are read in date order, so only the last day read can continue in the next chunk and only its keys are
+    kept. The combined CSV (when there is no store) may hold back-filled days after later ones, so all of its keys
+    are kept and that set grows with the number of rows.
+    Quotes are screened (stale and jump flags) against the raw quotes of the last SCREEN_HISTORY_DAYS business
+    days of the previous chunks.
 
+    Args:
+        destination_folder (str): Path to the folder where the files are stored.
+        chunksize (int): Number of rows per chunk. Default is CLEAN_CHUNK_SIZE.
+    """
+    store_folder = os.path.join(destination_folder, CLEANED_DATA_STORE)
+    csv_path = os.path.join(destination_folder, CLEANED_DATA_FILE)
+    raw_store_folder = os.path.join(destination_folder, RAW_DATA_STORE)
+    write_store = store_enabled()
+    write_csv = EXPORT_CSV or not write_store
 
+    try:
+        date_ordered = write_store and os.path.isdir(resolve_folder(raw_store_folder))
+        if date_ordered:
+            chunks = iter_partitioned_dataset(raw_store_folder, DATASET_COLUMNS_TO_SELECT, chunksize)
+        else:
+            chunks = pd.read_csv(os.path.join(destination_folder, RAW_DATA_FILE), usecols=DATASET_COLUMNS_TO_SELECT,
+                                 dtype={column: dtype for column, dtype in RAW_DATA_DTYPES.items()
+                                        if column in DATASET_COLUMNS_TO_SELECT},
+                                 chunksize=chunksize)
+
+        # Outputs are written next to the final ones and swapped in at the end, so a failure never leaves them half-written
+        temp_store_folder, temp_csv_path = f"{store_folder}.tmp", f"{csv_path}.tmp"
+        if os.path.exists(temp_store_folder):
+            shutil.rmtree(temp_store_folder)
+
+        seen_keys, seen_day = set(), None  # Key hashes (of 'seen_day' only, the last day read, if date-ordered)
+        history = None  # Raw quotes of the previous chunks, the screening history of the next one
+        issuer_index = IssuerIndex.load(os.path.join(destination_folder, ISSUER_INDEX_FILE))
+        partial_aggregates = {'Indexer': [], 'Issuer': []}  # Chunks may split a day, so partials are merged at the end
+        quote_panel = QuotePanel.open(os.path.join(destination_folder, QUOTE_PANEL_FOLDER), mode='r+') \
+            if QUOTE_PANEL_ENABLED else None
+        panel_days = set()  # Days already written to the panel by earlier chunks, completed instead of replaced
+        total_report = ValidationReport(0)
+        rows_in = rows_out = quarantined = 0
+
+        for chunk_number, chunk in enumerate(chunks):
+            chunk.index = pd.RangeIndex(rows_in, rows_in + len(chunk))
+            rows_in += len(chunk)
+
+            # Clean the chunk with the same steps as the in-memory mode
+            with stage("clean_dataset", chunk=chunk_number) as metrics:
+                df_cleaned = clean_dataset(chunk, history)
+                metrics.count(rows_in=len(chunk), rows_out=len(df_cleaned))
+            history = pd.concat([history, screening_history(chunk)], ignore_index=True)
+            if not history.empty:
+                start_day = get_calendar().last_business_days(SCREEN_HISTORY_DAYS, history['data'].max())[-1]
+                history = history[history['data'] >= pd.Timestamp(start_day)]
+
+            # Validate the chunk, checking duplicates against the keys of the day the previous chunks ended with
+            report = DatasetValidator.build_report(df_cleaned, unique_key=[])
+            key_hashes = pd.util.hash_pandas_object(df_cleaned[DATASET_UNIQUE_KEY], index=False).to_numpy()
+            duplicated = pd.Series(key_hashes, dtype='uint64').duplicated().to_numpy()
+            duplicated |= np.fromiter((key in seen_keys for key in key_hashes.tolist()), dtype=bool,
+                                      count=len(key_hashes))
+            if date_ordered and not df_cleaned.empty:
+                days = df_cleaned['data'].to_numpy()
+                if days.max() != seen_day:
+                    seen_keys, seen_day = set(), days.max()
+                seen_keys.update(key_hashes[days == seen_day].tolist())
+            else:
+                seen_keys.update(key_hashes.tolist())
+            report.add('duplicate rows', None, duplicated, df_cleaned.index)
+            total_report.merge(report)
+
+            if not report.passed and VALIDATION_REPORT_ONLY:
+                df_cleaned, df_quarantined = DatasetValidator.quarantine(df_cleaned, report)
+                df_quarantined.to_csv(os.path.join(destination_folder, QUARANTINE_FILE), index=False,
+                                      date_format=EXPORT_DATE_FORMAT,
+                                      mode='w' if quarantined == 0 else 'a', header=quarantined == 0)
+                quarantined += len(df_quarantined)
+
+            # Write the cleaned chunk before reading the next one
+            if write_store:
+                save_partitioned_dataset(df_cleaned, temp_store_folder, CLEANED_DATA_PARTITIONS,
+                                         part_name=f"part-{chunk_number}")
+            if write_csv:
+                df_cleaned.to_csv(temp_csv_path, index=False, encoding='utf-8', date_format=EXPORT_DATE_FORMAT,
+                                  mode='w' if chunk_number == 0 else 'a', header=chunk_number == 0)
+            if ISSUER_INDEX_ENABLED:
+                issuer_index.update(df_cleaned)
+            if DAILY_AGGREGATES_ENABLED and not df_cleaned.empty:
+                for level, partials in partial_aggregates.items():
+                    partials.append(aggregate_by_day(df_cleaned, level))
+            if quote_panel is not None and not df_cleaned.empty:
+                quote_panel.update(df_cleaned, keep_days=panel_days)
+                panel_days.update(str(day) for day in np.unique(df_cleaned['data'].to_numpy().astype('datetime64[D]')))
+            rows_out += len(df_cleaned)
+
+        if write_store and os.path.isdir(temp_store_folder):
+            replace_folder(temp_store_folder, store_folder)
+        if write_csv and os.path.exists(temp_csv_path):
+            os.replace(temp_csv_path, csv_path)
+        if ISSUER_INDEX_ENABLED:
+            issuer_index.save(os.path.join(destination_folder, ISSUER_INDEX_FILE))
+        if DAILY_AGGREGATES_ENABLED and partial_aggregates['Indexer']:
+            aggregates_path = os.path.join(destination_folder, DAILY_AGGREGATES_FILE)
+            aggregates = DailyAggregates.load(aggregates_path)
+            aggregates.replace_days({level: merge_aggregates(partials, level)
+                                     for level, partials in partial_aggregates.items()})
+            aggregates.save(aggregates_path)
+        print(f"Cleaned dataset streamed to: {destination_folder} ({rows_in} rows in, {rows_out} rows out, "
+              f"{quarantined} quarantined).")
+
+        print(total_report.summary())
+        if not VALIDATION_REPORT_ONLY:
+            total_report.raise_if_failed()
+            print("Dataset validation passed.")
+
+    except Exception as e:
+        print(f"Error in preparing or cleaning the dataset: {e}")
@@ -0,0 +1,314 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import wait
+import pandas as pd
+from processing.dataset_cleaning import clean_dataset, load_screening_history
+from processing.dataset_preparation import download_workbooks, save_day_sheets, day_sheets_saved
+from utils.csv_utilities import (
+    combine_sheets, load_manifest, save_manifest, source_file_name, record_combined_days
+)
+from utils.data_validation import DatasetValidator
+from utils.dataset_store import load_dataset, update_dataset, dataset_outputs, parse_dates
+from utils.download_cache import DownloadCache
+from utils.excel_processor import process_workbooks
+from utils.file_utilities import save_dataframe_to_csv
+from utils.instrumentation import stage
+from utils.memory_utilities import print_memory_usage
+from utils.output_writer import OutputWriter
+from utils.parse_cache import ParsedWorkbookCache, parse_version
+from utils.plot_indicative_rate import plot_indicative_rate_by_indexer
+from utils.quote_database import load_quotes_database
+from utils.issuer_index import update_issuer_index
+from utils.daily_aggregates import update_daily_aggregates
+from utils.quote_panel import update_quote_panel
+from utils.snapshot_store import update_snapshot_store
+from config import (
+    SOURCE_FOLDER, DATASET_FOLDER, PIPELINE_STATE_FILE, PIPELINE_RULES_VERSION, RAW_DATA_FILE, RAW_DATA_STORE,
+    RAW_DATA_PARTITIONS, RAW_DATA_DTYPES, CLEANED_DATA_FILE, CLEANED_DATA_STORE, CLEANED_DATA_PARTITIONS,
+    DATASET_COLUMNS_TO_SELECT, DATASET_FINAL_COLUMNS, INDEXER_BY_SHEET, INDEXERS, VALIDATION_REPORT_ONLY,
+    QUARANTINE_FILE, EXPORT_CSV, DATASET_STORE_FORMAT, QUOTES_DATABASE_ENABLED, QUOTES_DATABASE_FILE,
+    ISSUER_INDEX_ENABLED, ISSUER_INDEX_FILE, DAILY_AGGREGATES_ENABLED, DAILY_AGGREGATES_FILE, AGGREGATE_COLUMNS,
+    QUOTE_PANEL_ENABLED, QUOTE_PANEL_FOLDER, PANEL_FIELDS, SNAPSHOT_STORE_ENABLED, SNAPSHOT_FOLDER,
+    SNAPSHOT_INDEX_FILE
+)
+
+def fingerprint(*parts) -> str:
+    """
+    Returns the SHA-256 of the JSON representation of the given parts.
+
+    Returns:
+        str: Hexadecimal fingerprint.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+def stage_rules() -> dict:
+    """Returns the settings that change the output of each stage, folded into the stage fingerprints."""
+    storage = {"store": DATASET_STORE_FORMAT, "export_csv": EXPORT_CSV}
+    return {
+        "combine": {"version": PIPELINE_RULES_VERSION, "parse": parse_version(), "partitions": RAW_DATA_PARTITIONS,
+                    "snapshots": SNAPSHOT_STORE_ENABLED, **storage},
+        "clean": {"version": PIPELINE_RULES_VERSION, "selected": DATASET_COLUMNS_TO_SELECT,
+                  "final": DATASET_FINAL_COLUMNS, "indexer_by_sheet": INDEXER_BY_SHEET, "indexers": INDEXERS,
+                  "report_only": VALIDATION_REPORT_ONLY, "partitions": CLEANED_DATA_PARTITIONS,
+                  "database": QUOTES_DATABASE_ENABLED, "issuer_index": ISSUER_INDEX_ENABLED,
+                  "aggregates": DAILY_AGGREGATES_ENABLED and AGGREGATE_COLUMNS,
+                  "panel": QUOTE_PANEL_ENABLED and PANEL_FIELDS, **storage},
+        "plot": {"version": PIPELINE_RULES_VERSION},
+    }
+
+class PipelineRunner:
+    """
+    Runs the daily job as a chain of stages (extract -> combine -> clean -> plot) that hand their DataFrames to
+    the next stage in memory, while a background writer saves each stage's outputs to disk. The plots are the
+    exception: they cover every stored day, so they read the full cleaned dataset back once it is written.
+
+    Every stage has a fingerprint built from the fingerprint of the stage before it and its own settings, and
+    the extract stage fingerprints the bytes of the downloaded workbooks. Fingerprints are recorded in
+    PIPELINE_STATE_FILE with the files each stage wrote, once those writes are complete. On a rerun, a stage
+    with the same fingerprint whose outputs are still on disk is skipped. A stage that must run after a
+    skipped one loads that stage's output from disk.
+    """
+
+    def __init__(self, source_folder: str = SOURCE_FOLDER, destination_folder: str = DATASET_FOLDER,
+                 download_workers: int = 1, parse_workers: int = 1, download_cache: DownloadCache = None,
+                 parse_cache: ParsedWorkbookCache = None):
+        """
+        Args:
+            source_folder (str): Path to the folder of the sheets (snapshot store and per-sheet CSVs).
+            destination_folder (str): Path to the folder where the datasets, plots and pipeline state are saved.
+            download_workers (int): Maximum number of days downloaded at the same time. Default is 1.
+            parse_workers (int): Maximum number of processes decoding workbooks. Default is 1.
+            download_cache (DownloadCache): Optional on-disk download cache.
+            parse_cache (ParsedWorkbookCache): Optional cache of parsed workbooks.
+        """
+        self.source_folder = source_folder
+        self.destination_folder = destination_folder
+        self.download_workers = download_workers
+        self.parse_workers = parse_workers
+        self.download_cache = download_cache
+        self.parse_cache = parse_cache
+        self.state_path = os.path.join(destination_folder, PIPELINE_STATE_FILE)
+        self.state = {}
+        self.timings = {}
+        self._writer = None
+        self._writes = {}
+        self._completed = {}
+        self._skipped = set()
+
+    def _is_current(self, stage: str, stage_fingerprint: str) -> bool:
+        """Returns True if the stage already ran with the same fingerprint and its outputs are still on disk."""
+        record = self.state.get(stage)
+        current = (record is not None and record.get("fingerprint") == stage_fingerprint
+                   and all(os.path.exists(path) for path in record.get("outputs", [])))
+        if current:
+            self._skipped.add(stage)
+        return current
+
+    def _write(self, stage: str, function, *args) -> None:
+        """Runs a write of the stage in the background writer."""
+        self._writes.setdefault(stage, []).append(self._writer.submit(function, *args))
+
+    def _complete(self, stage: str, stage_fingerprint: str, outputs: list, **details) -> None:
+        """Marks the stage as done, to be recorded in the state once its background writes have finished."""
+        self._completed[stage] = {"fingerprint": stage_fingerprint, "outputs": outputs, **details}
+
+    def _record_state(self) -> None:
+        """Records the stages whose writes all succeeded, and forgets those whose writes failed."""
+        for stage, record in self._completed.items():
+            failed = [future.exception() for future in self._writes.get(stage, []) if future.exception()]
+            if failed:
+                print(f"Error writing the outputs of stage '{stage}': {failed[0]}")
+                self.state.pop(stage, None)
+            else:
+                self.state[stage] = record
+        save_manifest(self.state, self.state_path)
+
+    def extract(self, business_days: list) -> tuple:
+        """
+        Downloads the workbooks of the business days. Always runs, since it is how new data is detected, but with
+        the download cache it only sends conditional requests for the days that may still be republished.
+
+        Returns:
+            tuple: (workbooks, day hashes, fingerprint) where the day hashes are the SHA-256 of each workbook.
+        """
+        workbooks = download_workbooks(business_days, self.download_workers, self.download_cache)
+        day_hashes = {date_str: hashlib.sha256(file_data).hexdigest() for date_str, file_data in workbooks.items()}
+        return workbooks, day_hashes, fingerprint("extract", day_hashes)
+
+    def combine(self, workbooks: dict, day_hashes: dict, input_fingerprint: str) -> tuple:
+        """
+        Parses the workbooks and combines their sheets in memory. The sheets are added to the snapshot store
+        (or, without it, the per-sheet CSVs of new or changed days are written) in the background, and the parsed
+        days replace theirs in the combined dataset (the other days are kept).
+
+        Returns:
+            tuple: (combined DataFrame or None when skipped, fingerprint).
+        """
+        stage_fingerprint = fingerprint("combine", input_fingerprint, stage_rules()["combine"])
+        if self._is_current("combine", stage_fingerprint):
+            return None, stage_fingerprint
+
+        os.makedirs(self.source_folder, exist_ok=True)
+        previous_hashes = self.state.get("combine", {}).get("day_hashes", {})
+        with stage("parse") as metrics:
+            sheets_by_day = process_workbooks(workbooks, self.parse_workers, cache=self.parse_cache)
+            metrics.count(bytes_read=sum(len(file_data) for file_data in workbooks.values()),
+                          rows_out=sum(len(df) for sheets_dict in sheets_by_day.values() for df in sheets_dict.values()))
+
+        outputs = []
+        if SNAPSHOT_STORE_ENABLED:
+            self._write("combine", update_snapshot_store, self.source_folder, sheets_by_day)
+            outputs.append(os.path.join(self.source_folder, SNAPSHOT_FOLDER, SNAPSHOT_INDEX_FILE))
+        else:
+            for date_str, sheets_dict in sheets_by_day.items():
+                outputs.extend(os.path.join(self.source_folder, source_file_name(date_str, sheet_name))
+                               for sheet_name, df in sheets_dict.items() if not df.empty)
+                if previous_hashes.get(date_str) == day_hashes[date_str] and \
+                        day_sheets_saved(self.source_folder, date_str, sheets_dict):
+                    continue  # Same workbook as the CSVs already saved
+                self._write("combine", save_day_sheets, self.source_folder, date_str, sheets_dict)
+
+        combined_df = combine_sheets(sheets_by_day)
+        if combined_df.empty:
+            return None, stage_fingerprint
+
+        # Only the parsed days are replaced, the combined history of earlier runs is kept
+        self._write("combine", update_dataset, combined_df, self.destination_folder, RAW_DATA_STORE, RAW_DATA_FILE,
+                    RAW_DATA_PARTITIONS)
+        self._write("combine", record_combined_days, self.source_folder, list(sheets_by_day), self.destination_folder)
+        outputs.extend(dataset_outputs(self.destination_folder, RAW_DATA_STORE, RAW_DATA_FILE))
+        self._complete("combine", stage_fingerprint, outputs, day_hashes=day_hashes)
+        return combined_df, stage_fingerprint
+
+    def clean(self, combined_df: pd.DataFrame, input_fingerprint: str) -> tuple:
+        """
+        Cleans and validates the combined dataset (loaded from disk if the combine stage was skipped) and
+        writes its days to the cleaned dataset in the background, keeping the other days. The quotes are
+        screened against the stored quotes of the days before the window (load_screening_history).
+
+        Returns:
+            tuple: (cleaned DataFrame or None when skipped, fingerprint).
+        """
+        stage_fingerprint = fingerprint("clean", input_fingerprint, stage_rules()["clean"])
+        if self._is_current("clean", stage_fingerprint):
+            return None, stage_fingerprint
+
+        if combined_df is None:
+            combined_df = load_dataset(self.destination_folder, RAW_DATA_STORE, RAW_DATA_FILE,
+                                       columns=DATASET_COLUMNS_TO_SELECT, dtype=RAW_DATA_DTYPES)
+            if combined_df is None:
+                print(f"Failed to load the dataset from {self.destination_folder}.")
+                return None, stage_fingerprint
+
+        with stage("clean_dataset") as metrics:
+            first_date = parse_dates(combined_df['data']).min()
+            history = None if pd.isna(first_date) else load_screening_history(self.destination_folder, first_date)
+            df_cleaned = clean_dataset(combined_df, history)
+            metrics.count(rows_in=len(combined_df), rows_out=len(df_cleaned))
+        print_memory_usage(df_cleaned, "the cleaned dataset")
+
+        outputs = dataset_outputs(self.destination_folder, CLEANED_DATA_STORE, CLEANED_DATA_FILE)
+        with stage("validate") as metrics:
+            report = DatasetValidator.validate_dataset(df_cleaned, raise_on_error=False)
+            metrics.count(rows_in=len(df_cleaned))
+        if not report.passed and VALIDATION_REPORT_ONLY:
+            with stage("quarantine") as metrics:
+                df_cleaned, df_quarantined = DatasetValidator.quarantine(df_cleaned, report)
+                metrics.count(rows_in=len(df_cleaned) + len(df_quarantined), rows_out=len(df_cleaned))
+            quarantine_path = os.path.join(self.destination_folder, QUARANTINE_FILE)
+            self._write("clean", save_dataframe_to_csv, df_quarantined, quarantine_path)
+            outputs.append(quarantine_path)
+            print(f"{len(df_quarantined)} rows quarantined, continuing with {len(df_cleaned)} valid rows.")
+
+        self._write("clean", update_dataset, df_cleaned, self.destination_folder, CLEANED_DATA_STORE,
+                    CLEANED_DATA_FILE, CLEANED_DATA_PARTITIONS)
+        if QUOTES_DATABASE_ENABLED:
+            self._write("clean", load_quotes_database, df_cleaned, self.destination_folder)
+            outputs.append(os.path.join(self.destination_folder, QUOTES_DATABASE_FILE))
+        if ISSUER_INDEX_ENABLED:
+            self._write("clean", update_issuer_index, df_cleaned, self.destination_folder)
+            outputs.append(os.path.join(self.destination_folder, ISSUER_INDEX_FILE))
+        if DAILY_AGGREGATES_ENABLED:
+            self._write("clean", update_daily_aggregates, df_cleaned, self.destination_folder)
+            outputs.append(os.path.join(self.destination_folder, DAILY_AGGREGATES_FILE))
+        if QUOTE_PANEL_ENABLED:
+            self._write("clean", update_quote_panel, df_cleaned, self.destination_folder)
+            outputs.append(os.path.join(self.destination_folder, QUOTE_PANEL_FOLDER))
+
+        if not report.passed and not VALIDATION_REPORT_ONLY:
+            # Saved as before, but not recorded: the stage runs (and fails) again until the data is fixed
+            print(f"Error in preparing or cleaning the dataset: {report.summary()}")
+        else:
+            self._complete("clean", stage_fingerprint, outputs)
+        return df_cleaned, stage_fingerprint
+
+    def plot(self, input_fingerprint: str) -> str:
+        """
+        Plots the full cleaned dataset, loaded from disk once the clean stage has written its days: the cleaned
+        DataFrame of the run only holds the days of the window, while the plots (as in step-by-step mode and
+        'cli.py plot') cover every stored day.
+
+        Returns:
+            str: The fingerprint of the stage.
+        """
+        stage_fingerprint = fingerprint("plot", input_fingerprint, stage_rules()["plot"])
+        if self._is_current("plot", stage_fingerprint):
+            return stage_fingerprint
+
+        wait(self._writes.get("clean", []))
+        saved_files = plot_indicative_rate_by_indexer(self.destination_folder)
+        self._complete("plot", stage_fingerprint, saved_files)
+        return stage_fingerprint
+
+    def _timed(self, stage_name: str, function, *args):
+        """Runs a stage, recording and printing its wall time (and measuring it when instrumentation is on)."""
+        start_time = time.perf_counter()
+        with stage(stage_name) as metrics:
+            result = function(*args)
+            metrics.count(skipped=int(stage_name in self._skipped))
+        self.timings[stage_name] = time.perf_counter() - start_time
+        print(f"Stage '{stage_name}' {'skipped (inputs unchanged)' if stage_name in self._skipped else 'done'} "
+              f"in {self.timings[stage_name]:.3f}s.")
+        return result
+
+    def run(self, business_days: list) -> dict:
+        """
+        Runs the pipeline for the given business days.
+
+        Args:
+            business_days (list): List of business days ('yyyymmdd') to process.
+
+        Returns:
+            tuple: (Wall time in seconds of each stage plus 'total' (dict), stages skipped because their inputs
+                   did not change (sorted list)).
+        """
+        start_time = time.perf_counter()
+        os.makedirs(self.destination_folder, exist_ok=True)
+        self.state = load_manifest(self.state_path)
+        self.timings, self._writes, self._completed, self._skipped = {}, {}, {}, set()
+
+        # One writer thread keeps the writes of a stage in order; the bounded queue holds back a stage that
+        # produces outputs faster than the disk takes them
+        with OutputWriter(max_workers=1) as self._writer:
+            workbooks, day_hashes, extract_fingerprint = self._timed("extract", self.extract, business_days)
+            combined_df, combine_fingerprint = self._timed("combine", self.combine, workbooks, day_hashes,
+                                                           extract_fingerprint)
+            del workbooks
+            df_cleaned, clean_fingerprint = self._timed("clean", self.clean, combined_df, combine_fingerprint)
+            del combined_df
+            del df_cleaned
+            self._timed("plot", self.plot, clean_fingerprint)
+
+            flush_start = time.perf_counter()
+        # Leaving the block waits for the background writes, so the state never points to unwritten files
+        self.timings["flush"] = time.perf_counter() - flush_start
+        self._record_state()
+        self.timings["total"] = time.perf_counter() - start_time
+        print(f"Pipeline finished in {self.timings['total']:.3f}s "
+              f"({self.timings['flush']:.3f}s waiting for background writes).")
+        return self.timings, sorted(self._skipped)
@@ -0,0 +1,180 @@
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+import numpy as np
+from config import CALENDAR_START_YEAR, CALENDAR_END_YEAR
+
+# Fixed-date Brazilian national holidays (month, day, first year it applies)
+FIXED_HOLIDAYS = [
+    (1, 1, None),    # Confraternização Universal
+    (4, 21, None),   # Tiradentes
+    (5, 1, None),    # Dia do Trabalho
+    (9, 7, None),    # Independência do Brasil
+    (10, 12, None),  # Nossa Senhora Aparecida
+    (11, 2, None),   # Finados
+    (11, 15, None),  # Proclamação da República
+    (11, 20, 2024),  # Dia Nacional de Zumbi e da Consciência Negra (national holiday since 2024)
+    (12, 25, None),  # Natal
+]
+
+# Moveable holidays observed by the financial market, as offsets in days from Easter Sunday
+EASTER_HOLIDAYS = [
+    -48,  # Carnaval (Monday)
+    -47,  # Carnaval (Tuesday)
+    -2,   # Sexta-feira da Paixão
+    60,   # Corpus Christi
+]
+
+def easter_sunday(year: int) -> date:
+    """
+    Returns the date of Easter Sunday (Gregorian calendar, anonymous algorithm).
+
+    Args:
+        year (int): The year.
+
+    Returns:
+        date: Easter Sunday of the year.
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def brazilian_holidays(year: int) -> list:
+    """
+    Returns the national and market holidays of a year, as used by ANBIMA to define business days.
+
+    Args:
+        year (int): The year.
+
+    Returns:
+        list: Sorted list of holiday dates.
+    """
+    holidays = {date(year, month, day) for month, day, since in FIXED_HOLIDAYS if since is None or year >= since}
+    easter = easter_sunday(year)
+    holidays.update(easter + timedelta(days=offset) for offset in EASTER_HOLIDAYS)
+    return sorted(holidays)
+
+def _to_date(value) -> date:
+    """Converts a 'YYYYMMDD' string, a datetime or a date into a date."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value), "%Y%m%d").date()
+
+class BusinessCalendar:
+    """
+    Brazilian business-day calendar, bundled offline. All business days between 'start_year' and 'end_year'
+    are precomputed once into a sorted NumPy array, so range and "last N business days" lookups are binary
+    searches (O(log n)) instead of day-by-day loops.
+    """
+
+    def __init__(self, start_year: int = CALENDAR_START_YEAR, end_year: int = CALENDAR_END_YEAR,
+                 extra_holidays: list = None):
+        """
+        Args:
+            start_year (int): First year covered by the calendar.
+            end_year (int): Last year covered by the calendar.
+            extra_holidays (list): Additional non-business dates (e.g. exceptional market closures).
+        """
+        self.holidays = {holiday for year in range(start_year, end_year + 1) for holiday in brazilian_holidays(year)}
+        self.holidays.update(_to_date(holiday) for holiday in extra_holidays or [])
+
+        all_days = np.arange(np.datetime64(f"{start_year}-01-01"), np.datetime64(f"{end_year + 1}-01-01"))
+        weekdays = np.is_busday(all_days)  # Monday to Friday
+        holidays = np.isin(all_days, np.array(sorted(self.holidays), dtype='datetime64[D]'))
+        self.business_days = all_days[weekdays & ~holidays]
+
+        self.first_day = all_days[0]
+        self.last_day = all_days[-1]
+
+    def _check_range(self, day: np.datetime64) -> None:
+        """Raises a ValueError if the date is outside the precomputed range."""
+        if day < self.first_day or day > self.last_day:
+            raise ValueError(f"Date {day} is outside the calendar range ({self.first_day} to {self.last_day}).")
+
+    def is_business_day(self, value) -> bool:
+        """
+        Returns True if the date is a business day.
+
+        Args:
+            value: Date as 'YYYYMMDD', datetime or date.
+        """
+        day = np.datetime64(_to_date(value), 'D')
+        self._check_range(day)
+        position = np.searchsorted(self.business_days, day)
+        return position < len(self.business_days) and self.business_days[position] == day
+
+    def business_days_between(self, start, end) -> list:
+        """
+        Returns the business days between two dates (both inclusive), in ascending order.
+
+        Args:
+            start: First date, as 'YYYYMMDD', datetime or date.
+            end: Last date, as 'YYYYMMDD', datetime or date.
+
+        Returns:
+            list: List of dates.
+        """
+        start_day, end_day = np.datetime64(_to_date(start), 'D'), np.datetime64(_to_date(end), 'D')
+        self._check_range(start_day)
+        self._check_range(end_day)
+        first = np.searchsorted(self.business_days, start_day, side='left')
+        last = np.searchsorted(self.business_days, end_day, side='right')
+        return self.business_days[first:last].astype(date).tolist()
+
+    def business_day_numbers(self, days: np.ndarray) -> np.ndarray:
+        """
+        Returns the position of each date among the business days (a non-business date gets the position of the
+        next business day), so the difference of two positions is a number of business days.
+
+        Args:
+            days (np.ndarray): Dates as datetime64.
+
+        Returns:
+            np.ndarray: Integer positions, one per date.
+        """
+        return np.searchsorted(self.business_days, np.asarray(days).astype('datetime64[D]'), side='left')
+
+    def last_business_days(self, count: int, reference=None) -> list:
+        """
+        Returns the last 'count' business days on or before the reference date, most recent first.
+
+        Args:
+            count (int): Number of business days to return.
+            reference: Latest date that may be returned. Default is today.
+
+        Returns:
+            list: List of dates, most recent first.
+        """
+        reference_day = np.datetime64(_to_date(reference or date.today()), 'D')
+        self._check_range(reference_day)
+        last = np.searchsorted(self.business_days, reference_day, side='right')
+        if last < count:
+            raise ValueError(f"The calendar has fewer than {count} business days before {reference_day}.")
+        return self.business_days[last - count:last][::-1].astype(date).tolist()
+
+    def previous_business_day(self, reference=None) -> date:
+        """
+        Returns the last business day strictly before the reference date.
+
+        Args:
+            reference: Reference date. Default is today.
+
+        Returns:
+            date: The previous business day.
+        """
+        reference_day = _to_date(reference or date.today())
+        return self.last_business_days(1, reference_day - timedelta(days=1))[0]
+
+@lru_cache(maxsize=1)
+def get_calendar() -> BusinessCalendar:
+    """Returns the shared business calendar, built on first use."""
+    return BusinessCalendar()
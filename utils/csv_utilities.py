@@ -1,19 +1,38 @@
+import hashlib
+import json
 import pandas as pd
 import os
-from config import RAW_DATA_FILE
+from utils.dataset_store import store_enabled, save_partitioned_dataset, remove_partitions, parse_dates, resolve_folder
+from utils.instrumentation import stage
+from config import (
+    RAW_DATA_FILE, COMBINED_MANIFEST_FILE, RAW_DATA_STORE, RAW_DATA_PARTITIONS, EXPORT_CSV, SOURCE_CSV_COMPRESSION,
+    SNAPSHOT_STORE_ENABLED, SNAPSHOT_FOLDER
+)
 
-def load_csv(file_path: str) -> pd.DataFrame:
+# Extensions of the per-sheet source CSVs, plain or gzip-compressed (read back transparently by pandas)
+SOURCE_FILE_EXTENSIONS = ('.csv', '.csv.gz')
+# Extension of the source names of the sheets held by the snapshot store ('yyyymmdd-SHEET_NAME.snapshot')
+SNAPSHOT_SOURCE_EXTENSION = '.snapshot'
+
+def load_csv(file_path: str, dtype: dict = None, usecols: list = None) -> pd.DataFrame:
     """
     Loads a CSV file into a pandas DataFrame with error handling.
 
     Args:
         file_path (str): Path to the CSV file.
+        dtype (dict): Optional column -> dtype declared up front (e.g. 'category' for repeated text).
+                      Columns not present in the file are ignored.
+        usecols (list): Optional list of columns to load.
 
     Returns:
         pd.DataFrame: Loaded DataFrame, or None if an error occurs.
     """
     try:
-        df = pd.read_csv(file_path)
+        if dtype:
+            header = pd.read_csv(file_path, nrows=0).columns
+            dtype = {column: column_dtype for column, column_dtype in dtype.items()
+                     if column in header and (usecols is None or column in usecols)}
+        df = pd.read_csv(file_path, dtype=dtype, usecols=usecols)
         return df
     except FileNotFoundError:
         print(f"Error: The file {file_path} was not found.")
@@ -26,32 +45,25 @@ def load_csv(file_path: str) -> pd.DataFrame:
 
 def validate_date_column(df: pd.DataFrame, date_column: str) -> pd.DataFrame:
     """
-    Validates and converts the date column. If the date is in 'YYYYMMDD', it converts to 'DD/MM/YYYY'.
-    If the date is already in 'DD/MM/YYYY' format, no change is made. Invalid dates are removed.
+    Validates and converts the date column to datetime64. Dates in 'YYYYMMDD', 'DD/MM/YYYY' or 'YYYY-MM-DD'
+    are parsed (once per distinct value), datetime columns are kept as they are, and invalid dates are removed.
+    Dates are only formatted back to text when exported to CSV.
 
     Args:
         df (pd.DataFrame): The DataFrame to validate.
         date_column (str): The name of the column to validate.
 
     Returns:
-        pd.DataFrame: DataFrame with the date column formatted as 'DD/MM/YYYY', and invalid date rows removed.
+        pd.DataFrame: DataFrame with the date column as datetime64, and invalid date rows removed.
     """
     try:
-        # First, attempt to convert from 'YYYYMMDD' to datetime
-        try:
-            df[date_column] = pd.to_datetime(df[date_column], format='%Y%m%d', errors='raise')
-        except (ValueError, TypeError):
-            # If it fails, try to parse the date as 'DD/MM/YYYY'
-            df[date_column] = pd.to_datetime(df[date_column], format='%d/%m/%Y', errors='coerce')
+        df[date_column] = parse_dates(df[date_column])
 
         # Drop rows with invalid dates (NaT)
         if df[date_column].isnull().any():
             print("Warning: Some dates could not be converted and will be removed.")
             df = df.dropna(subset=[date_column])
 
-        # Convert to 'DD/MM/YYYY' format
-        df[date_column] = df[date_column].dt.strftime('%d/%m/%Y')
-
         return df
     except KeyError:
         print(f"Error: Column '{date_column}' not found in the DataFrame.")
@@ -60,48 +72,347 @@ def validate_date_column(df: pd.DataFrame, date_column: str) -> pd.DataFrame:
         print(f"Error validating date column: {e}")
         return df
 
-def combine_and_save_csvs(source_folder: str, business_days: list, output_folder: str) -> pd.DataFrame:
+def open_source_snapshots(source_folder: str):
     """
-    Combines CSV files corresponding to the business days from the source folder and saves the result as a CSV.
-    
+    Returns the snapshot store of a source folder when it is the source of record of the sheets
+    (SNAPSHOT_STORE_ENABLED), or None when the sheets are kept as per-sheet CSVs.
+    """
+    if not SNAPSHOT_STORE_ENABLED:
+        return None
+    from utils.snapshot_store import SnapshotStore  # Imported here, snapshot_store saves its index with this module
+    return SnapshotStore(os.path.join(source_folder, SNAPSHOT_FOLDER))
+
+def index_source_files(source_folder: str, business_days: list, snapshots=None) -> dict:
+    """
+    Lists the sources of the sheets of each business day. The days held by the snapshot store (when given) list
+    one 'yyyymmdd-SHEET_NAME.snapshot' name per stored sheet; the other days list their CSV files (plain or
+    '.csv.gz'), found by listing the source folder once.
+
+    Args:
+        source_folder (str): Path to the folder containing the source CSV files.
+        business_days (list): List of business days ('yyyymmdd') to look for.
+        snapshots (SnapshotStore): Snapshot store of the folder (see open_source_snapshots). Default is None.
+
+    Returns:
+        dict: Mapping of each business day to the sorted list of its source names.
+    """
+    wanted_days = set(business_days)
+    files_by_day = {date_str: [] for date_str in business_days}
+
+    stored_days = set()
+    if snapshots is not None:
+        for date_str in business_days:
+            files_by_day[date_str] = [source_snapshot_name(date_str, sheet_name)
+                                      for sheet_name in snapshots.sheet_names(date_str)]
+            if files_by_day[date_str]:
+                stored_days.add(date_str)
+
+    for file_name in sorted(os.listdir(source_folder)) if os.path.isdir(source_folder) else []:
+        date_str = file_name.split('-')[0]
+        if date_str in wanted_days and date_str not in stored_days and file_name.endswith(SOURCE_FILE_EXTENSIONS):
+            files_by_day[date_str].append(file_name)
+
+    return files_by_day
+
+def file_fingerprint(file_path: str, previous: dict = None) -> dict:
+    """
+    Returns the size, modification time and SHA-256 hash of a file. The hash is reused from 'previous'
+    when the size and modification time did not change, so unchanged files are not read again.
+
+    Args:
+        file_path (str): Path to the file.
+        previous (dict): Fingerprint recorded for the same file on a previous run, if any.
+
+    Returns:
+        dict: Fingerprint with the keys 'size', 'mtime' and 'sha256'.
+    """
+    stat = os.stat(file_path)
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime:
+        return previous
+
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha256.update(block)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': sha256.hexdigest()}
+
+def source_fingerprint(source_folder: str, file_name: str, previous: dict = None, snapshots=None) -> dict:
+    """
+    Returns the fingerprint of a source listed by index_source_files: for a CSV, its file_fingerprint; for a sheet
+    of the snapshot store, the SHA-256 digest of the stored DataFrame, recorded by the store's index.
+    """
+    if file_name.endswith(SNAPSHOT_SOURCE_EXTENSION):
+        entry = snapshots.sheets[sheet_name_from_file(file_name)][file_name.split('-')[0]]
+        return {'sha256': entry['digest'], 'rows': entry['rows']}
+    return file_fingerprint(os.path.join(source_folder, file_name), previous)
+
+def load_manifest(manifest_path: str) -> dict:
+    """
+    Loads the manifest of source files already combined (date -> file name -> fingerprint).
+
+    Args:
+        manifest_path (str): Path to the manifest JSON file.
+
+    Returns:
+        dict: The manifest, or an empty dict if it does not exist or cannot be read.
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_manifest(manifest: dict, manifest_path: str) -> None:
+    """
+    Saves the manifest atomically (temporary file plus rename).
+
+    Args:
+        manifest (dict): Manifest of combined source files.
+        manifest_path (str): Path to the manifest JSON file.
+    """
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+def source_file_name(date_str: str, sheet_name: str, compressed: bool = SOURCE_CSV_COMPRESSION) -> str:
+    """Returns the name of the source file of a sheet: 'yyyymmdd-SHEET_NAME.csv', or '.csv.gz' when compressed."""
+    return f"{date_str}-{sheet_name}{SOURCE_FILE_EXTENSIONS[1] if compressed else SOURCE_FILE_EXTENSIONS[0]}"
+
+def source_snapshot_name(date_str: str, sheet_name: str) -> str:
+    """Returns the source name of a sheet held by the snapshot store: 'yyyymmdd-SHEET_NAME.snapshot'."""
+    return f"{date_str}-{sheet_name}{SNAPSHOT_SOURCE_EXTENSION}"
+
+def sheet_name_from_file(file_name: str) -> str:
+    """Returns the sheet name of a source named 'yyyymmdd-SHEET_NAME.csv' (or '.csv.gz', '.snapshot')."""
+    return file_name.split('-')[1].split('.')[0]
+
+def read_source_csv(source_folder: str, file_name: str, date_str: str) -> pd.DataFrame:
+    """
+    Reads a per-sheet source CSV and adds the 'sheet_name' and 'data' columns taken from its file name.
+
+    Args:
+        source_folder (str): Path to the folder containing the source CSV files.
+        file_name (str): Name of the file, in the format 'yyyymmdd-SHEET_NAME.csv'.
+        date_str (str): Business day of the file.
+
+    Returns:
+        pd.DataFrame: The sheet data, or None if the file could not be read.
+    """
+    file_path = os.path.join(source_folder, file_name)
+    try:
+        with stage("read_source_csv", day=date_str, sheet_name=sheet_name_from_file(file_name)) as metrics:
+            df = pd.read_csv(file_path)
+            df['sheet_name'] = sheet_name_from_file(file_name)  # Add sheet name from file name
+            df['data'] = date_str  # Add the date based on the file name
+            metrics.count(rows_out=len(df), bytes_read=os.path.getsize(file_path))
+        return df
+    except Exception as e:
+        print(f"Error reading {file_path}: {e}")
+        return None
+
+def read_source_sheet(source_folder: str, file_name: str, date_str: str, snapshots=None) -> pd.DataFrame:
+    """
+    Reads a source listed by index_source_files, rebuilding the sheets held by the snapshot store exactly as they
+    were added (SnapshotStore.sheet) and reading the others from their CSV (read_source_csv).
+
+    Args:
+        source_folder (str): Path to the folder containing the source CSV files.
+        file_name (str): Source name, 'yyyymmdd-SHEET_NAME.snapshot' or the name of a CSV file.
+        date_str (str): Business day of the source.
+        snapshots (SnapshotStore): Snapshot store of the folder, needed for the '.snapshot' sources.
+
+    Returns:
+        pd.DataFrame: The sheet data with the 'sheet_name' and 'data' columns, or None if it could not be read.
+    """
+    if not file_name.endswith(SNAPSHOT_SOURCE_EXTENSION):
+        return read_source_csv(source_folder, file_name, date_str)
+
+    sheet_name = sheet_name_from_file(file_name)
+    try:
+        with stage("read_source_snapshot", day=date_str, sheet_name=sheet_name) as metrics:
+            df = snapshots.sheet(date_str, sheet_name)
+            df['sheet_name'] = sheet_name
+            df['data'] = date_str
+            metrics.count(rows_out=len(df))
+        return df
+    except Exception as e:
+        print(f"Error rebuilding {sheet_name} of {date_str} from the snapshot store: {e}")
+        return None
+
+def combine_and_save_csvs(source_folder: str, business_days: list, output_folder: str,
+                          incremental: bool = False) -> pd.DataFrame:
+    """
+    Combines the sheets of the business days from the source folder and saves the result as a CSV. When the
+    columnar store is enabled the result is also stored as Parquet partitioned by date and sheet, and the CSV
+    is only written if EXPORT_CSV is set.
+
+    When SNAPSHOT_STORE_ENABLED is set, the sheets of the days held by the snapshot store are rebuilt from it
+    (days are read in date order, so each one only applies its delta to the day before); days it does not hold
+    are read from their per-sheet CSVs, as they all are otherwise.
+
+    In incremental mode a manifest of the sources already combined (hash per date and sheet) is kept next
+    to the combined CSV, and only new or changed sources are read. New sources are appended to the
+    combined CSV in place; a changed or removed source only replaces the rows of its own day and sheet.
+
     Args:
         source_folder (str): Path to the folder containing the source CSV files.
         business_days (list): List of business days to look for CSVs.
         output_folder (str): Path to the folder where the combined CSV will be saved.
+        incremental (bool): Whether to update the existing combined CSV instead of rebuilding it. Default is False.
 
     Returns:
-        pd.DataFrame: Combined DataFrame from all the CSV files.
+        pd.DataFrame: Combined DataFrame from all the CSV files (in incremental mode, only the rows combined in this run).
     """
-    combined_data = []
-
     # Ensure the output folder exists
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    for date_str in business_days:
-        # Look for all CSV files corresponding to the business days
-        for file_name in os.listdir(source_folder):
-            if date_str in file_name and file_name.endswith('.csv'):
-                file_path = os.path.join(source_folder, file_name)
-                
-                try:
-                    # Read the CSV file into a DataFrame and append it to the list
-                    df = pd.read_csv(file_path)
-                    df['sheet_name'] = file_name.split('-')[1].split('.')[0]  # Add sheet name from file name
-                    df['data'] = date_str  # Add the date based on the file name
-                    combined_data.append(df)
-                except Exception as e:
-                    print(f"Error reading {file_path}: {e}")
-
-    # Combine all DataFrames into one
-    if combined_data:
-        combined_df = pd.concat(combined_data, ignore_index=True)
-
-        # Save the combined DataFrame to the output folder
-        combined_file_path = os.path.join(output_folder, RAW_DATA_FILE)
-        combined_df.to_csv(combined_file_path, index=False)
-        print(f"Combined CSV saved to: {combined_file_path}")
-        return combined_df
+    combined_file_path = os.path.join(output_folder, RAW_DATA_FILE)
+    manifest_path = os.path.join(output_folder, COMBINED_MANIFEST_FILE)
+    snapshots = open_source_snapshots(source_folder)
+    files_by_day = index_source_files(source_folder, business_days, snapshots)
+
+    store_folder = os.path.join(output_folder, RAW_DATA_STORE)
+    export_csv = EXPORT_CSV or not store_enabled()
+    output_exists = os.path.exists(combined_file_path) if export_csv else os.path.isdir(resolve_folder(store_folder))
+
+    previous_manifest = load_manifest(manifest_path) if incremental and output_exists else {}
+    manifest = {date_str: dict(files) for date_str, files in previous_manifest.items()}
+
+    data_by_day = {date_str: [] for date_str in business_days}
+    replaced_keys = set()  # (date, sheet_name) pairs whose rows must be replaced in the combined CSV
+
+    for date_str in sorted(business_days):
+        previous_files = previous_manifest.get(date_str, {})
+        current_files = {}
+
+        # Look for all the sources corresponding to the business days
+        for file_name in files_by_day[date_str]:
+            fingerprint = source_fingerprint(source_folder, file_name, previous_files.get(file_name), snapshots)
+            current_files[file_name] = fingerprint
+
+            previous = previous_files.get(file_name)
+            if previous and previous['sha256'] == fingerprint['sha256']:
+                continue  # Already combined and unchanged
+
+            df = read_source_sheet(source_folder, file_name, date_str, snapshots)
+            if df is None:
+                current_files.pop(file_name)
+                continue
+            data_by_day[date_str].append(df)
+            if previous:
+                replaced_keys.add((date_str, sheet_name_from_file(file_name)))
+
+        for file_name in set(previous_files) - set(current_files):
+            replaced_keys.add((date_str, sheet_name_from_file(file_name)))
+
+        if current_files:
+            manifest[date_str] = current_files
+        else:
+            manifest.pop(date_str, None)
+
+    # The rows keep the order of the business days given
+    combined_data = [df for date_str in business_days for df in data_by_day[date_str]]
+
+    if not previous_manifest:
+        # Full build: combine all DataFrames into one
+        if combined_data:
+            combined_df = pd.concat(combined_data, ignore_index=True)
+
+            # Save the combined DataFrame to the output folder
+            if store_enabled():
+                save_partitioned_dataset(combined_df, store_folder, RAW_DATA_PARTITIONS, overwrite_all=True)
+                print(f"Combined dataset stored in: {store_folder}")
+            if export_csv:
+                combined_df.to_csv(combined_file_path, index=False)
+                print(f"Combined CSV saved to: {combined_file_path}")
+            save_manifest(manifest, manifest_path)
+            return combined_df
+        else:
+            print("No CSV files were combined.")
+            return pd.DataFrame()  # Return an empty DataFrame if no files were combined
+
+    new_df = pd.concat(combined_data, ignore_index=True) if combined_data else pd.DataFrame()
+
+    if store_enabled():
+        # Partitions hold one day and sheet, so changed files only replace their own partitions
+        remove_partitions(store_folder, RAW_DATA_PARTITIONS, replaced_keys)
+        save_partitioned_dataset(new_df, store_folder, RAW_DATA_PARTITIONS)
+        print(f"Combined dataset updated with {len(new_df)} rows in: {store_folder}")
+    if export_csv:
+        update_combined_csv(combined_file_path, new_df, replaced_keys)
+
+    save_manifest(manifest, manifest_path)
+    return new_df
+
+def record_combined_days(source_folder: str, business_days: list, output_folder: str) -> None:
+    """
+    Records the sources of some business days in the manifest of combine_and_save_csvs, once another writer
+    (the in-memory pipeline) has replaced those days in the combined dataset, so that a later incremental combine
+    neither skips nor appends them again.
+
+    Args:
+        source_folder (str): Path to the folder containing the source CSV files.
+        business_days (list): Business days ('yyyymmdd') written to the combined dataset.
+        output_folder (str): Path to the folder of the combined dataset and its manifest.
+    """
+    manifest_path = os.path.join(output_folder, COMBINED_MANIFEST_FILE)
+    manifest = load_manifest(manifest_path)
+    snapshots = open_source_snapshots(source_folder)
+    for date_str, file_names in index_source_files(source_folder, business_days, snapshots).items():
+        previous_files = manifest.get(date_str, {})
+        files = {file_name: source_fingerprint(source_folder, file_name, previous_files.get(file_name), snapshots)
+                 for file_name in file_names}
+        if files:
+            manifest[date_str] = files
+        else:
+            manifest.pop(date_str, None)
+    save_manifest(manifest, manifest_path)
+
+def combine_sheets(sheets_by_day: dict) -> pd.DataFrame:
+    """
+    In-memory counterpart of combine_and_save_csvs: combines the processed sheets of several business days,
+    adding the 'sheet_name' and 'data' columns, without reading the per-sheet CSVs back from disk.
+
+    Args:
+        sheets_by_day (dict): Mapping of business day ('yyyymmdd') to its dictionary of processed sheets.
+
+    Returns:
+        pd.DataFrame: Combined DataFrame, with the same columns as the combined CSV.
+    """
+    combined_data = []
+    for date_str, sheets_dict in sheets_by_day.items():
+        for sheet_name, df in sheets_dict.items():
+            if not df.empty:
+                combined_data.append(df.assign(sheet_name=sheet_name, data=date_str))
+
+    if not combined_data:
+        print("No sheets were combined.")
+        return pd.DataFrame()
+    return pd.concat(combined_data, ignore_index=True)
+
+def update_combined_csv(combined_file_path: str, new_df: pd.DataFrame, replaced_keys: set) -> None:
+    """
+    Updates the combined CSV in place: new rows are appended, and only when a previously combined
+    sheet changed is the file rewritten without the stale rows of that day and sheet.
+
+    Args:
+        combined_file_path (str): Path to the combined CSV.
+        new_df (pd.DataFrame): Rows combined in this run.
+        replaced_keys (set): (date, sheet_name) pairs whose previous rows must be dropped.
+    """
+    header = pd.read_csv(combined_file_path, nrows=0).columns.tolist()
+
+    if replaced_keys or not set(new_df.columns).issubset(header):
+        # Rare path: a combined file changed, so its previous rows are dropped before appending the new ones
+        existing_df = pd.read_csv(combined_file_path, dtype=str)
+        stale = pd.MultiIndex.from_frame(existing_df[['data', 'sheet_name']]).isin(list(replaced_keys))
+        updated_df = pd.concat([existing_df[~stale], new_df], ignore_index=True)
+        updated_df.to_csv(combined_file_path, index=False)
+        print(f"Combined CSV rewritten with {len(replaced_keys)} replaced sheet(s): {combined_file_path}")
+    elif not new_df.empty:
+        new_df.reindex(columns=header).to_csv(combined_file_path, mode='a', header=False, index=False)
+        print(f"Appended {len(new_df)} rows to combined CSV: {combined_file_path}")
     else:
-        print("No CSV files were combined.")
-        return pd.DataFrame()  # Return an empty DataFrame if no files were combined
\ No newline at end of file
+        print("Combined CSV is up to date, no new source files.")
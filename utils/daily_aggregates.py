@@ -0,0 +1,290 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from utils.business_calendar import get_calendar
+from utils.dataset_store import load_dataset, select_date_range
+from utils.issuer_index import normalize_name
+from config import (
+    DAILY_AGGREGATES_FILE, AGGREGATE_COLUMNS, ROLLING_WINDOWS, CLEANED_DATA_STORE, CLEANED_DATA_FILE,
+    CLEANED_DATA_DTYPES
+)
+
+# Grouping levels of the aggregate tables: 'Indexer' and 'Issuer' (the issuer name normalized by the issuer
+# index, so 'VALE S/A' and 'VALE S.A.' are one issuer), plus 'all' (every quote of the day, from the Indexer table)
+LEVELS = ['Indexer', 'Issuer', 'all']
+
+# Additive components of a table row: summed when rows are merged or rolled over a window
+_SUM_FIELDS = ['rows', 'rate_x_duration_sum', 'duration_weight_sum'] + \
+              [f"{column}_{field}" for column in AGGREGATE_COLUMNS for field in ('count', 'sum')]
+
+def aggregate_by_day(df: pd.DataFrame, level: str) -> pd.DataFrame:
+    """
+    Aggregates cleaned quotes per day and Indexer or issuer: for each of the AGGREGATE_COLUMNS its count of
+    values, sum, min and max, plus the sums behind the duration-weighted rate (sum of rate x Duration and
+    sum of Duration). These components can be merged across chunks and rolled over windows.
+
+    Args:
+        df (pd.DataFrame): Cleaned dataset (or chunk), with 'data', 'Indexer', 'Nome' and the AGGREGATE_COLUMNS.
+        level (str): 'Indexer' or 'Issuer'.
+
+    Returns:
+        pd.DataFrame: One row per day and key, without the derived means (see finalize).
+    """
+    if level == 'Issuer':
+        # Normalized once per distinct name and broadcast to the rows through the codes
+        codes, names = pd.factorize(df['Nome'])
+        issuers = np.append(np.array([normalize_name(name) for name in names], dtype=object), None)
+        keys = pd.Series(issuers[codes], index=df.index)
+    else:
+        keys = df[level]
+
+    rates, durations = df['Taxa Indicativa'], df['Duration']
+    weighted = rates * durations
+    frame = pd.DataFrame({
+        'data': df['data'], level: keys, **{column: df[column] for column in AGGREGATE_COLUMNS},
+        'rate_x_duration': weighted, 'duration_weight': durations.where(weighted.notna()),
+    })
+
+    grouped = frame.groupby(['data', level], observed=True, sort=True)
+    table = grouped[AGGREGATE_COLUMNS].agg(['count', 'sum', 'min', 'max'])
+    table.columns = [f"{column}_{field}" for column, field in table.columns]
+    table['rows'] = grouped.size()
+    table['rate_x_duration_sum'] = grouped['rate_x_duration'].sum()
+    table['duration_weight_sum'] = grouped['duration_weight'].sum()
+    return table.reset_index()
+
+def merge_aggregates(tables: list, level: str) -> pd.DataFrame:
+    """
+    Merges partial tables of aggregate_by_day (e.g. of several chunks holding parts of the same day) into one
+    row per day and key: counts and sums are added, minimums and maximums kept.
+
+    Args:
+        tables (list): Tables built by aggregate_by_day for the same level.
+        level (str): 'Indexer' or 'Issuer'.
+
+    Returns:
+        pd.DataFrame: The merged table.
+    """
+    combined = pd.concat(tables, ignore_index=True)
+    grouped = combined.groupby(['data', level], observed=True, sort=True)
+    merged = grouped[_SUM_FIELDS].sum()
+    for column in AGGREGATE_COLUMNS:
+        merged[f"{column}_min"] = grouped[f"{column}_min"].min()
+        merged[f"{column}_max"] = grouped[f"{column}_max"].max()
+    return merged.reset_index()
+
+def finalize(table: pd.DataFrame) -> pd.DataFrame:
+    """Adds the derived columns of a table: the mean of each AGGREGATE_COLUMNS and the duration-weighted rate."""
+    table = table.copy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for column in AGGREGATE_COLUMNS:
+            table[f"{column}_mean"] = table[f"{column}_sum"] / table[f"{column}_count"].replace(0, np.nan)
+        weights = table['duration_weight_sum'].replace(0, np.nan)
+        table['duration_weighted_rate'] = table['rate_x_duration_sum'] / weights
+    return table
+
+class DailyAggregates:
+    """
+    Materialized per-day aggregates of the cleaned quotes, by Indexer and by issuer, covering the full history.
+    Ingesting a dataset only replaces the rows of the days it holds, and rolling-window statistics are computed
+    from these tables (a few rows per day) instead of the quotes. The AGGREGATE_COLUMNS the tables were built
+    with are saved with them: when the setting changes, load() rebuilds every day from the cleaned dataset
+    instead of mixing days with different columns.
+    """
+
+    def __init__(self):
+        self.tables = {'Indexer': pd.DataFrame(), 'Issuer': pd.DataFrame()}
+        self.columns = list(AGGREGATE_COLUMNS)
+
+    def __len__(self) -> int:
+        """Number of days in the aggregates."""
+        table = self.tables['Indexer']
+        return 0 if table.empty else table['data'].nunique()
+
+    def days(self) -> list:
+        """Returns the days in the aggregates, in ascending order."""
+        table = self.tables['Indexer']
+        return [] if table.empty else sorted(table['data'].unique())
+
+    def replace_days(self, tables: dict) -> None:
+        """
+        Replaces the rows of the days present in new tables (level -> table of aggregate_by_day or
+        merge_aggregates), keeping the other days.
+        """
+        for level, new_table in tables.items():
+            current = self.tables[level]
+            if not current.empty:
+                current = current[~current['data'].isin(new_table['data'].unique())]
+            table = pd.concat([current, finalize(new_table)], ignore_index=True) if not current.empty \
+                else finalize(new_table)
+            self.tables[level] = table.sort_values(['data', level], kind='stable', ignore_index=True)
+
+    def update(self, df: pd.DataFrame) -> int:
+        """
+        Ingests a cleaned dataset holding whole days, replacing the aggregates of those days.
+
+        Args:
+            df (pd.DataFrame): Cleaned dataset.
+
+        Returns:
+            int: Number of days ingested.
+        """
+        if df.empty:
+            return 0
+        self.replace_days({level: aggregate_by_day(df, level) for level in self.tables})
+        return df['data'].nunique()
+
+    def table(self, level: str, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Returns the daily aggregates of a level.
+
+        Args:
+            level (str): 'Indexer', 'Issuer' or 'all'.
+            start_date: First day ('YYYYMMDD', 'DD/MM/YYYY' or datetime), inclusive. Default is unbounded.
+            end_date: Last day, inclusive. Default is unbounded.
+
+        Returns:
+            pd.DataFrame: One row per day and key (per day for 'all'), with counts, sums, means, minimums,
+                          maximums and the duration-weighted rate.
+        """
+        if level not in LEVELS:
+            raise ValueError(f"Unknown aggregate level '{level}', expected one of {LEVELS}.")
+        if level == 'all':
+            table = self.tables['Indexer']
+            if not table.empty:
+                table = finalize(merge_aggregates([table.assign(Indexer='all')], 'Indexer')).rename(
+                    columns={'Indexer': 'all'})
+        else:
+            table = self.tables[level]
+        if table.empty:
+            return table
+        return select_date_range(table, start_date, end_date).reset_index(drop=True)
+
+    def rolling(self, level: str, window: int, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Returns rolling-window statistics over the last 'window' business days ending on each day, computed from
+        the daily aggregates: counts and sums are added over the window, minimums and maximums taken over it,
+        and the means and duration-weighted rate derived from those totals. Windows are counted in business days
+        of the calendar, so a day missing from the aggregates does not stretch a window; it shortens it instead,
+        as do the days before the first one aggregated, and 'days_covered' tells how many days a window really has.
+
+        Args:
+            level (str): 'Indexer', 'Issuer' or 'all'.
+            window (int): Window length in business days (e.g. one of ROLLING_WINDOWS).
+            start_date: First window end day to return, inclusive. Default is unbounded.
+            end_date: Last window end day to return, inclusive. Default is unbounded.
+
+        Returns:
+            pd.DataFrame: One row per window end day (days in the aggregates) and key quoted in the window, with
+                          'days_covered', the business days of the window held by the aggregates (less than
+                          'window' when the history is too short or has missing days).
+        """
+        table = self.table(level)
+        if table.empty:
+            return table
+
+        days = pd.DatetimeIndex(get_calendar().business_days_between(table['data'].min(), table['data'].max()))
+        days = days.union(pd.DatetimeIndex(table['data'].unique()))
+
+        def wide(field: str) -> pd.DataFrame:
+            return table.pivot(index='data', columns=level, values=field).reindex(days)
+
+        covered = pd.Series(days.isin(table['data'].unique()), index=days).rolling(window, min_periods=1).sum()
+        rolled = {}
+        for field in _SUM_FIELDS:
+            rolled[field] = wide(field).fillna(0).rolling(window, min_periods=1).sum()
+        for column in AGGREGATE_COLUMNS:
+            rolled[f"{column}_min"] = wide(f"{column}_min").rolling(window, min_periods=1).min()
+            rolled[f"{column}_max"] = wide(f"{column}_max").rolling(window, min_periods=1).max()
+
+        result = pd.concat({field: frame.stack(future_stack=True) for field, frame in rolled.items()}, axis=1)
+        result.index.names = ['data', level]
+        result = result.reset_index()
+        result = result[result['data'].isin(table['data'].unique()) & (result['rows'] > 0)]
+        counts = ['rows'] + [f"{column}_count" for column in AGGREGATE_COLUMNS]
+        result[counts] = result[counts].astype('int64')
+        result = finalize(result).assign(window=window)
+        result['days_covered'] = covered.reindex(result['data']).to_numpy().astype('int64')
+        return select_date_range(result, start_date, end_date).reset_index(drop=True)
+
+    def window_summary(self, level: str, windows: list = ROLLING_WINDOWS, end_date=None) -> pd.DataFrame:
+        """
+        Returns the statistics of each window ending on 'end_date' (default the last day in the aggregates).
+
+        Args:
+            level (str): 'Indexer', 'Issuer' or 'all'.
+            windows (list): Window lengths in business days. Default is ROLLING_WINDOWS.
+            end_date: Last day of the windows. Default is the last day in the aggregates.
+
+        Returns:
+            pd.DataFrame: One row per window and key.
+        """
+        days = self.days()
+        if not days:
+            return pd.DataFrame()
+        end_date = end_date if end_date is not None else days[-1]
+        return pd.concat([self.rolling(level, window, end_date, end_date) for window in windows], ignore_index=True)
+
+    def save(self, file_path: str) -> None:
+        """Saves the aggregates (temporary file plus rename)."""
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, "wb") as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, file_path)
+
+    @staticmethod
+    def load(file_path: str) -> "DailyAggregates":
+        """
+        Loads saved aggregates, or returns empty ones if they do not exist or cannot be read. Aggregates built
+        with other AGGREGATE_COLUMNS (or saved before the columns were recorded) are rebuilt from the cleaned
+        dataset saved next to them.
+        """
+        try:
+            with open(file_path, "rb") as file:
+                aggregates = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError):
+            return DailyAggregates()
+        if getattr(aggregates, 'columns', None) != AGGREGATE_COLUMNS:
+            print(f"The daily aggregates in {file_path} were built with other columns, rebuilding them from the "
+                  f"cleaned dataset.")
+            aggregates = DailyAggregates.rebuild(os.path.dirname(file_path))
+        return aggregates
+
+    @staticmethod
+    def rebuild(destination_folder: str) -> "DailyAggregates":
+        """
+        Builds the aggregates of every day of the cleaned dataset of a folder.
+
+        Args:
+            destination_folder (str): Path to the folder where the cleaned dataset is stored.
+
+        Returns:
+            DailyAggregates: The aggregates (empty if the cleaned dataset could not be loaded).
+        """
+        aggregates = DailyAggregates()
+        columns = list(dict.fromkeys(['data', 'Indexer', 'Nome', 'Taxa Indicativa', 'Duration'] + AGGREGATE_COLUMNS))
+        df = load_dataset(destination_folder, CLEANED_DATA_STORE, CLEANED_DATA_FILE, columns=columns,
+                          dtype=CLEANED_DATA_DTYPES)
+        if df is not None:
+            aggregates.update(df)
+        return aggregates
+
+def update_daily_aggregates(df: pd.DataFrame, destination_folder: str) -> DailyAggregates:
+    """
+    Replaces the aggregates of the days of a cleaned dataset in the aggregates saved in a folder
+    (DAILY_AGGREGATES_FILE), keeping the days of previous runs so the tables cover the full history.
+
+    Args:
+        df (pd.DataFrame): Cleaned dataset holding whole days.
+        destination_folder (str): Path to the folder where the aggregates are stored.
+
+    Returns:
+        DailyAggregates: The updated aggregates.
+    """
+    file_path = os.path.join(destination_folder, DAILY_AGGREGATES_FILE)
+    aggregates = DailyAggregates.load(file_path)
+    days = aggregates.update(df)
+    aggregates.save(file_path)
+    print(f"Daily aggregates updated for {days} day(s), {len(aggregates)} day(s) in total: {file_path}")
+    return aggregates
@@ -1,5 +1,170 @@
+import numpy as np
 import pandas as pd
-import re
+
+# Declarative schema of the cleaned dataset: column -> rules checked by DatasetValidator
+DATASET_SCHEMA = {
+    'Código': {'required': True, 'pattern': r'[A-Za-z0-9]+'},
+    'Nome': {'required': True, 'non_empty_string': True},
+    'PU': {'required': True, 'numeric': True, 'max_decimals': 2, 'positive': True},
+    'Taxa Indicativa': {'required': True, 'numeric': True, 'max_decimals': 2, 'positive': True},
+    'data': {'required': True, 'date_format': '%d/%m/%Y'},
+    'Indexer': {'required': True, 'allowed_values': ['DI +', 'IPCA +', '% do DI']},
+    'Duration': {'numeric': True},
+    '% Pu Par': {'numeric': True},
+    'Spread': {'numeric': True},
+}
+
+# Columns identifying a row, used by the duplicate check
+DATASET_UNIQUE_KEY = ['Código', 'Nome', 'PU', 'Taxa Indicativa', 'data', 'Indexer']
+
+# Number of failing row indices kept as a sample for each rule
+REPORT_SAMPLE_SIZE = 5
+
+def _mask_from_unique_values(series: pd.Series, check) -> np.ndarray:
+    """
+    Evaluates a per-value check once per distinct value and broadcasts it back to the rows. Text columns
+    such as 'Código', 'Nome' or 'data' repeat the same values thousands of times, so this replaces a
+    per-row Python loop by a handful of calls and one NumPy take.
+
+    Args:
+        series (pd.Series): Column to check.
+        check (callable): Function receiving a Series of distinct values and returning a boolean failure mask.
+
+    Returns:
+        np.ndarray: Boolean failure mask aligned with the rows (missing values never fail here).
+    """
+    codes, uniques = pd.factorize(series)
+    if len(uniques) == 0:
+        return np.zeros(len(series), dtype=bool)
+    failed_uniques = np.asarray(check(pd.Series(uniques)), dtype=bool)
+    return np.where(codes >= 0, failed_uniques[np.maximum(codes, 0)], False)
+
+def _failed_pattern(values: pd.Series, pattern: str) -> pd.Series:
+    """Returns True for the values whose text does not fully match the pattern."""
+    return ~values.astype(str).str.fullmatch(pattern).fillna(False)
+
+def _failed_numeric(series: pd.Series, max_decimals: int = None) -> np.ndarray:
+    """Returns True for values that are not finite non-negative numbers with at most 'max_decimals' decimals."""
+    if not pd.api.types.is_numeric_dtype(series):
+        decimals = f"{{1,{max_decimals}}}" if max_decimals is not None else "+"
+        return _mask_from_unique_values(series, lambda values: _failed_pattern(values, rf"\d+(\.\d{decimals})?"))
+
+    values = series.to_numpy(dtype='float64', na_value=np.nan)
+    with np.errstate(invalid='ignore'):
+        failed = ~np.isfinite(values) | (values < 0)
+        if max_decimals is not None:
+            scaled = values * 10 ** max_decimals
+            failed |= np.abs(scaled - np.round(scaled)) > 1e-6 * np.maximum(1, np.abs(scaled))
+    return failed & ~np.isnan(values)
+
+def _failed_date(series: pd.Series, date_format: str) -> np.ndarray:
+    """Returns True for dates that are not valid dates in 'date_format' (datetime columns are always valid)."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return np.zeros(len(series), dtype=bool)
+    return _mask_from_unique_values(
+        series, lambda values: pd.to_datetime(values.astype(str), format=date_format, errors='coerce').isna())
+
+def compile_schema(schema: dict) -> list:
+    """
+    Compiles a declarative schema into a list of vectorized rules.
+
+    Args:
+        schema (dict): Column -> rules. Supported rules: 'required', 'pattern', 'non_empty_string', 'numeric',
+                       'max_decimals', 'positive', 'date_format' and 'allowed_values'.
+
+    Returns:
+        list: List of (rule_name, column, check) tuples, where check(df) returns a boolean failure mask.
+    """
+    rules = []
+    for column, spec in schema.items():
+        if spec.get('required'):
+            rules.append(('missing values', column, lambda df, c=column: df[c].isna().to_numpy()))
+        if 'pattern' in spec:
+            rules.append((f"does not match '{spec['pattern']}'", column,
+                          lambda df, c=column, p=spec['pattern']: _mask_from_unique_values(
+                              df[c], lambda values: _failed_pattern(values, p))))
+        if spec.get('non_empty_string'):
+            rules.append(('empty or non-string value', column,
+                          lambda df, c=column: _mask_from_unique_values(
+                              df[c], lambda values: ~values.map(lambda x: isinstance(x, str) and bool(x.strip())))))
+        if spec.get('numeric'):
+            rules.append(('not a valid number', column,
+                          lambda df, c=column, d=spec.get('max_decimals'): _failed_numeric(df[c], d)))
+        if spec.get('positive'):
+            rules.append(('not greater than 0', column,
+                          lambda df, c=column: (pd.to_numeric(df[c], errors='coerce') <= 0).to_numpy()))
+        if 'date_format' in spec:
+            rules.append((f"not a date in '{spec['date_format']}'", column,
+                          lambda df, c=column, f=spec['date_format']: _failed_date(df[c], f)))
+        if 'allowed_values' in spec:
+            rules.append((f"not one of {spec['allowed_values']}", column,
+                          lambda df, c=column, v=spec['allowed_values']: (~df[c].isin(v) & df[c].notna()).to_numpy()))
+    return rules
+
+class ValidationReport:
+    """
+    Result of a validation run: every failing rule with its number of failing rows and a sample of their indices.
+    """
+
+    def __init__(self, row_count: int):
+        self.row_count = row_count
+        self.failures = []
+        self.failed_rows = np.zeros(row_count, dtype=bool)
+        self._merged_failed_count = 0
+
+    @property
+    def passed(self) -> bool:
+        """True if no rule failed."""
+        return not self.failures
+
+    @property
+    def failed_row_count(self) -> int:
+        """Number of rows failing at least one rule (including merged reports)."""
+        return int(self.failed_rows.sum()) + self._merged_failed_count
+
+    def merge(self, other: "ValidationReport") -> None:
+        """
+        Adds the counts and samples of another report (e.g. of the next chunk of a streamed dataset).
+        Only the totals are kept, so merging never holds per-row data of the other report.
+        """
+        self.row_count += other.row_count
+        self._merged_failed_count += other.failed_row_count
+        for failure in other.failures:
+            existing = next((f for f in self.failures
+                             if f['rule'] == failure['rule'] and f['column'] == failure['column']), None)
+            if existing is None:
+                self.failures.append(dict(failure, sample_rows=list(failure['sample_rows'])))
+            else:
+                existing['count'] += failure['count']
+                existing['sample_rows'] = (existing['sample_rows'] + failure['sample_rows'])[:REPORT_SAMPLE_SIZE]
+
+    def add(self, rule: str, column: str, mask: np.ndarray, index: pd.Index) -> None:
+        """Records the rows failing a rule (does nothing if no row failed)."""
+        count = int(mask.sum())
+        if count:
+            self.failures.append({
+                'rule': rule,
+                'column': column,
+                'count': count,
+                'sample_rows': index[mask][:REPORT_SAMPLE_SIZE].tolist(),
+            })
+            self.failed_rows |= mask
+
+    def summary(self) -> str:
+        """Returns a readable summary of the report."""
+        if self.passed:
+            return f"✔ All validation rules passed for {self.row_count} rows."
+        lines = [f"✘ {len(self.failures)} validation rule(s) failed, "
+                 f"{self.failed_row_count} of {self.row_count} rows affected:"]
+        for failure in self.failures:
+            column = f"'{failure['column']}' " if failure['column'] else ''
+            lines.append(f"  - {column}{failure['rule']}: {failure['count']} row(s), e.g. rows {failure['sample_rows']}")
+        return "\n".join(lines)
+
+    def raise_if_failed(self) -> None:
+        """Raises a ValueError listing every failing rule."""
+        if not self.passed:
+            raise ValueError(self.summary())
 
 class DatasetValidator:
     """
@@ -16,18 +181,16 @@ class DatasetValidator:
 
     @staticmethod
     def validate_date_column(df: pd.DataFrame, date_column: str) -> None:
-        """Validate that the 'data' column matches the 'DD/MM/YYYY' format using regex."""
-        date_pattern = r'^(0[1-9]|[12][0-9]|3[01])/(0[1-9]|1[0-2])/\d{4}$'
-        if not df[date_column].apply(lambda x: bool(re.match(date_pattern, str(x)))).all():
-            raise TypeError(f"The '{date_column}' column should be in 'DD/MM/YYYY' format.")
-        print(f"✔ '{date_column}' column is in 'DD/MM/YYYY' format.")
+        """Validate that the 'data' column holds valid dates (datetime, or text in the 'DD/MM/YYYY' format)."""
+        if _failed_date(df[date_column], '%d/%m/%Y').any() or df[date_column].isna().any():
+            raise TypeError(f"The '{date_column}' column should hold dates (datetime or 'DD/MM/YYYY').")
+        print(f"✔ '{date_column}' column holds valid dates.")
 
     @staticmethod
     def validate_numeric_columns(df: pd.DataFrame, columns: list) -> None:
         """Validate that the specified columns contain numeric values (integer or decimal)."""
-        numeric_pattern = r'^\d+(\.\d{1,2})?$'
         for column in columns:
-            if not df[column].apply(lambda x: bool(re.match(numeric_pattern, str(x)))).all():
+            if _failed_numeric(df[column], max_decimals=2).any() or df[column].isna().any():
                 raise TypeError(f"The '{column}' column should contain numeric values in string format.")
         print(f"✔ {', '.join(columns)} columns contain valid numeric strings.")
 
@@ -48,14 +211,16 @@ class DatasetValidator:
     @staticmethod
     def validate_alphanumeric_column(df: pd.DataFrame, column: str) -> None:
         """Validate that the specified column contains only alphanumeric values."""
-        if not df[column].apply(lambda x: bool(re.match(r'^[A-Za-z0-9]+$', str(x)))).all():
+        if _mask_from_unique_values(df[column], lambda values: _failed_pattern(values, r'[A-Za-z0-9]+')).any():
             raise ValueError(f"Invalid values in '{column}': Must be alphanumeric.")
         print(f"✔ '{column}' column is alphanumeric.")
 
     @staticmethod
     def validate_string_column(df: pd.DataFrame, column: str) -> None:
         """Validate that the specified column contains non-empty strings."""
-        if not df[column].apply(lambda x: isinstance(x, str) and len(x.strip()) > 0).all():
+        failed = _mask_from_unique_values(
+            df[column], lambda values: ~values.map(lambda x: isinstance(x, str) and bool(x.strip())))
+        if failed.any() or df[column].isna().any():
             raise ValueError(f"Invalid values in '{column}': Must be a non-empty string.")
         print(f"✔ '{column}' column contains valid strings.")
 
@@ -75,24 +240,65 @@ class DatasetValidator:
         print(f"✔ {', '.join(columns)} columns contain valid positive values.")
 
     @staticmethod
-    def validate_dataset(df: pd.DataFrame) -> None:
+    def build_report(df: pd.DataFrame, schema: dict = None, unique_key: list = None) -> ValidationReport:
+        """
+        Evaluates every rule of the schema in a single vectorized pass and collects all failures.
+
+        Args:
+            df (pd.DataFrame): The dataset to validate.
+            schema (dict): Column -> rules. Default is DATASET_SCHEMA.
+            unique_key (list): Columns that must identify a row. Default is DATASET_UNIQUE_KEY.
+
+        Returns:
+            ValidationReport: Report with every failing rule, its row count and sample row indices.
+        """
+        schema = schema if schema is not None else DATASET_SCHEMA
+        unique_key = unique_key if unique_key is not None else DATASET_UNIQUE_KEY
+        report = ValidationReport(len(df))
+
+        missing_columns = [column for column in schema if column not in df.columns]
+        for column in missing_columns:
+            report.add('missing expected column', column, np.ones(len(df), dtype=bool), df.index)
+
+        present_schema = {column: spec for column, spec in schema.items() if column in df.columns}
+        for rule, column, check in compile_schema(present_schema):
+            report.add(rule, column, np.asarray(check(df), dtype=bool), df.index)
+
+        if unique_key and all(column in df.columns for column in unique_key):
+            report.add('duplicate rows', None, df.duplicated(subset=unique_key).to_numpy(), df.index)
+
+        return report
+
+    @staticmethod
+    def quarantine(df: pd.DataFrame, report: ValidationReport) -> tuple:
+        """
+        Splits the dataset into the rows passing every rule and the rows failing at least one.
+
+        Args:
+            df (pd.DataFrame): The validated dataset.
+            report (ValidationReport): Report produced by build_report for the same DataFrame.
+
+        Returns:
+            tuple: (valid rows, quarantined rows) DataFrames.
+        """
+        return df[~report.failed_rows], df[report.failed_rows]
+
+    @staticmethod
+    def validate_dataset(df: pd.DataFrame, raise_on_error: bool = True) -> ValidationReport:
         """
         Run a series of validation checks on the dataset to ensure it conforms to the expected structure.
+
+        Args:
+            df (pd.DataFrame): The dataset to validate.
+            raise_on_error (bool): Whether to raise a ValueError listing every failing rule. When False the
+                                   report is only returned, so the caller can quarantine the failing rows.
+
+        Returns:
+            ValidationReport: The validation report.
         """
-        expected_columns = ['Código', 'Nome', 'PU', 'Taxa Indicativa', 'data', 'Indexer']
-        numeric_columns = ['Taxa Indicativa', 'PU']
-        key_columns = ['Código', 'Nome', 'PU', 'Taxa Indicativa', 'data', 'Indexer']
-        subset_columns = ['Código', 'Nome', 'PU', 'Taxa Indicativa', 'data', 'Indexer']
-        valid_indexers = ['DI +', 'IPCA +', '% do DI']
-
-        DatasetValidator.check_expected_columns(df, expected_columns)
-        DatasetValidator.validate_date_column(df, 'data')
-        DatasetValidator.validate_numeric_columns(df, numeric_columns)
-        DatasetValidator.check_for_missing_values(df, key_columns)
-        DatasetValidator.check_for_duplicates(df, subset_columns)
-        DatasetValidator.validate_alphanumeric_column(df, 'Código')
-        DatasetValidator.validate_string_column(df, 'Nome')
-        DatasetValidator.validate_indexer_column(df, 'Indexer', valid_indexers)
-        DatasetValidator.validate_positive_values(df, numeric_columns)
-
-        print("✔ Dataset validation passed successfully.")
+        report = DatasetValidator.build_report(df)
+        print(report.summary())
+        if raise_on_error:
+            report.raise_if_failed()
+            print("✔ Dataset validation passed successfully.")
+        return report
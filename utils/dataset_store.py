@@ -0,0 +1,464 @@
+import os
+import shutil
+from urllib.parse import quote, unquote
+import numpy as np
+import pandas as pd
+from utils.file_utilities import save_dataframe_to_csv
+from config import (
+    DATASET_STORE_FORMAT, EXPORT_CSV, NUMERIC_COLUMNS, CATEGORICAL_COLUMNS, DATE_COLUMN, EXPORT_DATE_FORMAT
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:  # Optional dependency, the pipeline falls back to CSV files
+    PARQUET_AVAILABLE = False
+
+PARTITION_FILE_NAME = "part-0.parquet"  # Default file of a partition, further parts are appended as 'part-N.parquet'
+
+def store_enabled() -> bool:
+    """Returns True if the columnar store is configured and pyarrow is installed."""
+    return DATASET_STORE_FORMAT == "parquet" and PARQUET_AVAILABLE
+
+def parse_dates(dates: pd.Series) -> pd.Series:
+    """
+    Converts a date column ('YYYYMMDD', 'DD/MM/YYYY', 'YYYY-MM-DD' or already datetime) into datetime64.
+
+    Args:
+        dates (pd.Series): Date column.
+
+    Returns:
+        pd.Series: Dates as datetime64 (NaT for invalid dates).
+    """
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates
+
+    # A dataset holds few distinct dates, so each one is parsed once and broadcast to the rows
+    codes, unique_dates = pd.factorize(dates)
+    as_text = pd.Series(unique_dates, dtype=object).astype(str)
+    parsed = pd.to_datetime(as_text, format='%Y%m%d', errors='coerce')
+    for date_format in ('%d/%m/%Y', '%Y-%m-%d'):
+        parsed = parsed.fillna(pd.to_datetime(as_text, format=date_format, errors='coerce'))
+    unique_values = np.append(parsed.to_numpy(dtype='datetime64[ns]'), np.datetime64('NaT', 'ns'))
+    return pd.Series(unique_values[codes], index=dates.index, name=dates.name)  # Code -1 maps to the trailing NaT
+
+def to_date_keys(dates: pd.Series) -> pd.Series:
+    """
+    Converts a date column ('YYYYMMDD', 'DD/MM/YYYY' or datetime) into 'YYYYMMDD' partition keys.
+
+    Args:
+        dates (pd.Series): Date column.
+
+    Returns:
+        pd.Series: Date keys as strings in the format 'YYYYMMDD' (NaN for invalid dates).
+    """
+    # Each distinct date is formatted once and broadcast to the rows
+    codes, unique_dates = pd.factorize(dates)
+    unique_dates = parse_dates(pd.Series(unique_dates))
+    unique_keys = np.append(unique_dates.dt.strftime('%Y%m%d').to_numpy(dtype=object), np.nan)
+    return pd.Series(unique_keys[codes], index=dates.index)  # Code -1 (missing date) maps to the trailing NaN
+
+def _to_date_key(value) -> str:
+    """Converts a single date ('YYYYMMDD', 'DD/MM/YYYY' or datetime) into a 'YYYYMMDD' key."""
+    if value is None:
+        return None
+    return to_date_keys(pd.Series([value])).iloc[0]
+
+def _to_datetime64(value) -> np.datetime64:
+    """Converts a single date ('YYYYMMDD', 'DD/MM/YYYY', 'YYYY-MM-DD' or datetime) into a datetime64."""
+    return parse_dates(pd.Series([value])).to_numpy(dtype='datetime64[ns]')[0]
+
+def select_date_range(df: pd.DataFrame, start_date=None, end_date=None,
+                      date_column: str = DATE_COLUMN) -> pd.DataFrame:
+    """
+    Selects the rows between two dates with a binary search over the date column. Cleaned datasets are kept
+    sorted by date, so no row is scanned; an unsorted DataFrame is sorted first (stable, keeping the order of
+    each day).
+
+    Args:
+        df (pd.DataFrame): DataFrame with a datetime date column.
+        start_date: First date to select ('YYYYMMDD', 'DD/MM/YYYY' or datetime), inclusive. Default is unbounded.
+        end_date: Last date to select, inclusive. Default is unbounded.
+        date_column (str): Name of the date column. Default is DATE_COLUMN.
+
+    Returns:
+        pd.DataFrame: The rows inside the range, sorted by date.
+    """
+    if not df[date_column].is_monotonic_increasing:
+        df = df.sort_values(date_column, kind='stable')
+    dates = df[date_column].to_numpy()
+    start = 0 if start_date is None else dates.searchsorted(_to_datetime64(start_date), side='left')
+    end = len(dates) if end_date is None else dates.searchsorted(_to_datetime64(end_date), side='right')
+    return df.iloc[start:end]
+
+def _partition_path(store_folder: str, partition_columns: list, values: tuple) -> str:
+    """Builds the 'column=value' directory of a partition, URL-quoting values such as '% do DI'."""
+    parts = [f"{column}={quote(str(value), safe='')}" for column, value in zip(partition_columns, values)]
+    return os.path.join(store_folder, *parts)
+
+def _arrow_schema(df: pd.DataFrame) -> "pa.Schema":
+    """Returns an explicit schema, so an all-empty column never changes type between partitions."""
+    fields = []
+    for column, dtype in df.dtypes.items():
+        if pd.api.types.is_integer_dtype(dtype):
+            # NumPy integers keep their width (e.g. the uint8 'Flags' bitmask), nullable ones are stored as int64
+            fields.append(pa.field(column, pa.from_numpy_dtype(dtype) if isinstance(dtype, np.dtype) else pa.int64()))
+        elif pd.api.types.is_float_dtype(dtype):
+            fields.append(pa.field(column, pa.float64()))
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            fields.append(pa.field(column, pa.timestamp('ns')))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+def prepare_column_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Types the columns before storing them: NUMERIC_COLUMNS become floats (placeholders such as '--' or 'N/D'
+    become NaN) and the remaining object columns become strings.
+
+    Args:
+        df (pd.DataFrame): DataFrame to be stored.
+
+    Returns:
+        pd.DataFrame: A typed copy of the DataFrame.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if column in NUMERIC_COLUMNS:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
+        elif df[column].dtype == object:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return df
+
+def save_partitioned_dataset(df: pd.DataFrame, store_folder: str, partition_columns: list,
+                             overwrite_all: bool = False, part_name: str = None) -> None:
+    """
+    Saves the DataFrame as Parquet files partitioned by date and a second column (e.g. 'Indexer'), with one
+    directory per partition ('data=YYYYMMDD/Indexer=DI%20%2B/part-0.parquet'). Only the partitions present
+    in the DataFrame are replaced, unless 'overwrite_all' is set: the whole store is then written next to the
+    current one and swapped in (replace_folder), so readers never find it empty or half-written. With a
+    'part_name' the data is added to the partitions as an extra file instead, which lets a dataset be written
+    chunk by chunk.
+
+    Args:
+        df (pd.DataFrame): DataFrame to store. The first partition column must be the date column.
+        store_folder (str): Root folder of the partitioned dataset.
+        partition_columns (list): Columns used to partition the data, e.g. ['data', 'Indexer'].
+        overwrite_all (bool): Whether to remove all existing partitions first. Default is False.
+        part_name (str): Name of the file to add to each partition (e.g. 'part-3'). Default replaces the partitions.
+    """
+    recover_folder(store_folder)  # Partitions are only replaced in a complete store
+    if overwrite_all:
+        temp_folder = f"{store_folder}.tmp"
+        if os.path.exists(temp_folder):
+            shutil.rmtree(temp_folder)
+        save_partitioned_dataset(df, temp_folder, partition_columns, part_name=part_name)
+        replace_folder(temp_folder, store_folder)
+        return
+
+    os.makedirs(store_folder, exist_ok=True)
+    if df.empty:
+        return
+
+    date_column = partition_columns[0]
+    typed_df = prepare_column_types(df)
+    typed_df[date_column] = to_date_keys(typed_df[date_column])
+    typed_df = typed_df.dropna(subset=[date_column])
+
+    data_columns = [column for column in typed_df.columns if column not in partition_columns]
+    schema = _arrow_schema(typed_df[data_columns])
+
+    for values, partition_df in typed_df.groupby(partition_columns, sort=False, observed=True):
+        values = values if isinstance(values, tuple) else (values,)
+        partition_folder = _partition_path(store_folder, partition_columns, values)
+        if part_name is None and os.path.exists(partition_folder):
+            shutil.rmtree(partition_folder)
+        os.makedirs(partition_folder, exist_ok=True)
+
+        table = pa.Table.from_pandas(partition_df[data_columns], schema=schema, preserve_index=False)
+        file_name = f"{part_name}.parquet" if part_name is not None else PARTITION_FILE_NAME
+        file_path = os.path.join(partition_folder, file_name)
+        temp_path = f"{file_path}.tmp"
+        pq.write_table(table, temp_path)
+        os.replace(temp_path, file_path)
+
+def replace_folder(temp_folder: str, folder: str) -> None:
+    """
+    Swaps a folder written next to its final path into place with two renames: the previous content is moved
+    aside to '<folder>.old', then the new one takes its place. Between the two renames the folder is missing:
+    readers fall back to '<folder>.old' (resolve_folder), and a crash there leaves the previous content in it.
+    That copy is kept until the next swap finds a complete folder in place, so it is never removed before the
+    content replacing it exists.
+
+    Args:
+        temp_folder (str): Folder holding the new content.
+        folder (str): Final path of the folder.
+    """
+    old_folder = f"{folder}.old"
+    if os.path.exists(folder):
+        if os.path.exists(old_folder):
+            shutil.rmtree(old_folder)
+        os.replace(folder, old_folder)
+    os.replace(temp_folder, folder)
+
+def resolve_folder(folder: str) -> str:
+    """
+    Returns the folder to read: the folder itself, or the previous content kept by replace_folder when the
+    folder is missing (in the middle of a swap, or after a crash between its two renames).
+    """
+    old_folder = f"{folder}.old"
+    return old_folder if not os.path.isdir(folder) and os.path.isdir(old_folder) else folder
+
+def recover_folder(folder: str) -> None:
+    """Moves the previous content kept by replace_folder back in place if a crash left the folder missing."""
+    if resolve_folder(folder) != folder:
+        os.replace(f"{folder}.old", folder)
+
+def remove_partitions(store_folder: str, partition_columns: list, partition_values: list) -> None:
+    """
+    Removes the given partitions from the store (e.g. the day and sheet of a deleted source file).
+
+    Args:
+        store_folder (str): Root folder of the partitioned dataset.
+        partition_columns (list): Columns used to partition the data.
+        partition_values (list): List of tuples with the values of each partition to remove.
+    """
+    recover_folder(store_folder)
+    for values in partition_values:
+        values = (_to_date_key(values[0]),) + tuple(values[1:])
+        partition_folder = _partition_path(store_folder, partition_columns, values)
+        if os.path.exists(partition_folder):
+            shutil.rmtree(partition_folder)
+
+def list_partitions(store_folder: str) -> list:
+    """
+    Lists the partitions of the store.
+
+    Args:
+        store_folder (str): Root folder of the partitioned dataset.
+
+    Returns:
+        list: List of (file_path, {column: value}) tuples, one per partition file, sorted by path.
+    """
+    store_folder = resolve_folder(store_folder)
+    partitions = []
+    for root, _, files in os.walk(store_folder):
+        part_files = [name for name in files if name.startswith('part-') and name.endswith('.parquet')]
+        if not part_files:
+            continue
+        relative = os.path.relpath(root, store_folder)
+        values = {k: unquote(v) for k, v in (part.split('=', 1) for part in relative.split(os.sep))}
+        partitions.extend((os.path.join(root, name), values) for name in part_files)
+    return sorted(partitions, key=lambda partition: partition[0])
+
+def _select_partitions(partitions: list, start_date=None, end_date=None, filters: dict = None) -> list:
+    """Keeps the partitions inside the date range and matching the filters (partition pruning)."""
+    start_key, end_key = _to_date_key(start_date), _to_date_key(end_date)
+    selected = []
+    for file_path, values in partitions:
+        date_key = next(iter(values.values()))
+        if (start_key and date_key < start_key) or (end_key and date_key > end_key):
+            continue
+        if filters and any(values.get(column) not in accepted for column, accepted in filters.items()):
+            continue
+        selected.append((file_path, values))
+    return selected
+
+def _read_partitions(selected: list, columns: list = None) -> pd.DataFrame:
+    """Reads the selected partition files (only the requested columns) and rebuilds the partition columns."""
+    partition_columns = list(selected[0][1].keys())
+    date_column = partition_columns[0]
+
+    file_columns = None
+    if columns is not None:
+        file_columns = [column for column in columns if column not in partition_columns]
+
+    # Categorical columns are read as dictionaries, so pandas gets categoricals without building Python strings
+    tables = [pq.read_table(file_path, columns=file_columns, read_dictionary=CATEGORICAL_COLUMNS)
+              for file_path, _ in selected]
+    df = pa.concat_tables(tables, promote_options="permissive").to_pandas()
+
+    # Rebuild the partition columns from the directory names
+    lengths = [table.num_rows for table in tables]
+    for column in partition_columns:
+        if columns is not None and column not in columns:
+            continue
+        values = [partition_values[column] for _, partition_values in selected]
+        if column == date_column:
+            df[column] = pd.to_datetime(np.repeat(values, lengths), format='%Y%m%d')
+        else:
+            categories = sorted(set(values))
+            codes = np.repeat([categories.index(value) for value in values], lengths)
+            df[column] = pd.Categorical.from_codes(codes, categories=categories)
+
+    return df[columns] if columns is not None else df
+
+def load_partitioned_dataset(store_folder: str, columns: list = None, start_date=None, end_date=None,
+                             filters: dict = None) -> pd.DataFrame:
+    """
+    Loads a partitioned dataset reading only the requested columns (column projection) from the partitions
+    inside the date range and matching the filters (partition pruning).
+
+    Args:
+        store_folder (str): Root folder of the partitioned dataset.
+        columns (list): Columns to load (data and partition columns). Default loads all columns.
+        start_date: First date to load ('YYYYMMDD', 'DD/MM/YYYY' or datetime), inclusive. Default is unbounded.
+        end_date: Last date to load, inclusive. Default is unbounded.
+        filters (dict): Partition column -> list of accepted values, e.g. {'Indexer': ['DI +']}.
+
+    Returns:
+        pd.DataFrame: The loaded data, with the date partition column as datetime, or None if the store is empty.
+    """
+    for attempt in range(3):
+        partitions = list_partitions(store_folder)
+        if not partitions:
+            return None
+
+        selected = _select_partitions(partitions, start_date, end_date, filters)
+        if not selected:
+            return pd.DataFrame(columns=columns) if columns else pd.DataFrame()
+
+        try:
+            return _read_partitions(selected, columns)
+        except FileNotFoundError:
+            # The store was swapped in (replace_folder) after it was listed: list the new one
+            if attempt == 2:
+                raise
+
+def iter_partitioned_dataset(store_folder: str, columns: list = None, chunksize: int = 100_000,
+                             start_date=None, end_date=None, filters: dict = None):
+    """
+    Iterates over a partitioned dataset in chunks of whole partitions holding about 'chunksize' rows,
+    so that only one chunk is in memory at a time.
+
+    Args:
+        store_folder (str): Root folder of the partitioned dataset.
+        columns (list): Columns to load. Default loads all columns.
+        chunksize (int): Approximate number of rows per chunk (a single partition is never split).
+        start_date: First date to load, inclusive. Default is unbounded.
+        end_date: Last date to load, inclusive. Default is unbounded.
+        filters (dict): Partition column -> list of accepted values.
+
+    Yields:
+        pd.DataFrame: The next chunk, in date order.
+    """
+    batch, batch_rows = [], 0
+    for partition in _select_partitions(list_partitions(store_folder), start_date, end_date, filters):
+        batch.append(partition)
+        batch_rows += pq.ParquetFile(partition[0]).metadata.num_rows
+        if batch_rows >= chunksize:
+            yield _read_partitions(batch, columns)
+            batch, batch_rows = [], 0
+    if batch:
+        yield _read_partitions(batch, columns)
+
+def load_dataset(destination_folder: str, store_name: str, csv_file_name: str, columns: list = None,
+                 start_date=None, end_date=None, filters: dict = None, dtype: dict = None) -> pd.DataFrame:
+    """
+    Loads a dataset from the columnar store when available, otherwise from its CSV file.
+
+    Args:
+        destination_folder (str): Path to the folder where the datasets are stored.
+        store_name (str): Name of the partitioned dataset folder.
+        csv_file_name (str): Name of the CSV file, used when the store is disabled or empty.
+        columns (list): Columns to load. Default loads all columns.
+        start_date: First date to load (store only), inclusive.
+        end_date: Last date to load (store only), inclusive.
+        filters (dict): Partition column -> list of accepted values (store only).
+        dtype (dict): Column -> dtype declared when loading from CSV (the store is already typed).
+
+    Returns:
+        pd.DataFrame: The loaded DataFrame, or None if it could not be loaded.
+    """
+    from utils.csv_utilities import load_csv  # Imported here, csv_utilities itself writes to the store
+
+    store_folder = os.path.join(destination_folder, store_name)
+    if store_enabled() and os.path.isdir(resolve_folder(store_folder)):
+        df = load_partitioned_dataset(store_folder, columns, start_date, end_date, filters)
+        if df is not None:
+            return df
+
+    df = load_csv(os.path.join(destination_folder, csv_file_name), dtype=dtype, usecols=columns)
+    if df is None:
+        return None
+    if columns is not None:
+        df = df.loc[:, columns]
+    if DATE_COLUMN in df.columns:
+        # Dates are only text in the CSV export, as in the store they are datetime once loaded
+        df[DATE_COLUMN] = parse_dates(df[DATE_COLUMN])
+        if start_date is not None or end_date is not None:
+            df = select_date_range(df, start_date, end_date)
+    return df
+
+def dataset_outputs(destination_folder: str, store_name: str, csv_file_name: str) -> list:
+    """Returns the paths written by save_dataset for a dataset (its store folder and/or CSV file)."""
+    outputs = []
+    if store_enabled():
+        outputs.append(os.path.join(destination_folder, store_name))
+    if EXPORT_CSV or not store_enabled():
+        outputs.append(os.path.join(destination_folder, csv_file_name))
+    return outputs
+
+def save_dataset(df: pd.DataFrame, destination_folder: str, store_name: str, csv_file_name: str,
+                 partition_columns: list) -> None:
+    """
+    Saves a full dataset to the columnar store (written aside and swapped in for its previous content) and,
+    if EXPORT_CSV is set or the store is not available, to its CSV file (also replaced atomically).
+
+    Args:
+        df (pd.DataFrame): DataFrame to save.
+        destination_folder (str): Path to the folder where the datasets are stored.
+        store_name (str): Name of the partitioned dataset folder.
+        csv_file_name (str): Name of the CSV export.
+        partition_columns (list): Columns used to partition the data.
+    """
+    if store_enabled():
+        store_folder = os.path.join(destination_folder, store_name)
+        save_partitioned_dataset(df, store_folder, partition_columns, overwrite_all=True)
+        print(f"Dataset stored in: {store_folder}")
+
+    if EXPORT_CSV or not store_enabled():
+        save_dataframe_to_csv(df, os.path.join(destination_folder, csv_file_name))
+
+def update_dataset(df: pd.DataFrame, destination_folder: str, store_name: str, csv_file_name: str,
+                   partition_columns: list) -> None:
+    """
+    Replaces the days present in 'df' in a dataset (its columnar store and, if EXPORT_CSV is set or the store is
+    not available, its CSV file), keeping every other day. This is the counterpart of save_dataset for a run that
+    covers a window of the history, which must never drop the days outside it.
+
+    Args:
+        df (pd.DataFrame): Rows of the days to replace.
+        destination_folder (str): Path to the folder where the datasets are stored.
+        store_name (str): Name of the partitioned dataset folder.
+        csv_file_name (str): Name of the CSV export.
+        partition_columns (list): Columns used to partition the data, the date column first.
+    """
+    date_column = partition_columns[0]
+    days = set(to_date_keys(df[date_column]).dropna())
+
+    if store_enabled():
+        store_folder = os.path.join(destination_folder, store_name)
+        # Partitions of those days missing from 'df' (e.g. a sheet no longer published) are dropped as well
+        keys = df[partition_columns].assign(**{date_column: to_date_keys(df[date_column])}).drop_duplicates()
+        written = set(keys.astype(str).itertuples(index=False, name=None))
+        stale = [tuple(values.values()) for _, values in list_partitions(store_folder)
+                 if next(iter(values.values())) in days and tuple(values.values()) not in written]
+        remove_partitions(store_folder, partition_columns, stale)
+        save_partitioned_dataset(df, store_folder, partition_columns)
+        print(f"Dataset updated with {len(days)} day(s) in: {store_folder}")
+
+    if EXPORT_CSV or not store_enabled():
+        csv_path = os.path.join(destination_folder, csv_file_name)
+        if os.path.exists(csv_path):
+            # The other days are kept as the text they were exported as, and the new rows are formatted alike
+            existing = pd.read_csv(csv_path, dtype=str, keep_default_na=False, na_values=[''])
+            new_rows = df.copy()
+            for column in new_rows.columns:
+                if pd.api.types.is_datetime64_any_dtype(new_rows[column]):
+                    new_rows[column] = new_rows[column].dt.strftime(EXPORT_DATE_FORMAT)
+            kept = existing[~to_date_keys(existing[date_column]).isin(days)]
+            df = pd.concat([kept, new_rows], ignore_index=True)
+            df = df.iloc[np.argsort(to_date_keys(df[date_column]).fillna('').to_numpy(), kind='stable')]
+        save_dataframe_to_csv(df, csv_path)
@@ -1,8 +1,10 @@
 from datetime import datetime, timedelta
+from utils.business_calendar import get_calendar
 
 def get_business_days(count: int) -> list:
     """
-    Returns a list of dates for the last 'count' business days.
+    Returns a list of dates for the last 'count' business days, skipping weekends and the Brazilian
+    national holidays of the business calendar.
     
     Args:
         count (int): Number of business days to return.
@@ -10,15 +12,22 @@ def get_business_days(count: int) -> list:
     Returns:
         list: A list of strings containing the dates in the format 'yyyymmdd'.
     """
-    business_days = []
-    current_date = datetime.now() - timedelta(days=1)  # Subtract 1 day to use "yesterday" as the reference
-    
-    # Loop to get the last 'count' business days
-    while len(business_days) < count:
-        if current_date.weekday() < 5:  # If it's not Saturday (5) or Sunday (6), it's a business day
-            business_days.append(current_date)
-        current_date -= timedelta(days=1)
+    reference_date = datetime.now() - timedelta(days=1)  # Subtract 1 day to use "yesterday" as the reference
+    business_days = get_calendar().last_business_days(count, reference_date)
 
     # Return dates in 'yyyymmdd' format
     return [day.strftime("%Y%m%d") for day in business_days]
 
+def get_business_days_between(start_date: str, end_date: str) -> list:
+    """
+    Returns the business days between two dates (both inclusive), for backfills of arbitrary ranges.
+
+    Args:
+        start_date (str): First date in the format 'yyyymmdd'.
+        end_date (str): Last date in the format 'yyyymmdd'.
+
+    Returns:
+        list: A list of strings containing the dates in the format 'yyyymmdd', most recent first.
+    """
+    business_days = get_calendar().business_days_between(start_date, end_date)
+    return [day.strftime("%Y%m%d") for day in reversed(business_days)]
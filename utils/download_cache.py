@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import time
+from config import DOWNLOAD_CACHE_FOLDER, DOWNLOAD_CACHE_NEGATIVE_TTL
+
+class DownloadCache:
+    """
+    On-disk cache of downloaded workbooks keyed by their URL.
+
+    Each entry keeps the raw bytes ('<key>.xls') next to a small JSON metadata file ('<key>.json') with
+    the ETag/Last-Modified validators, the HTTP status and whether the workbook was already final when fetched.
+    Missing files (404/410 on holidays or not yet published dates) are remembered for a short TTL.
+    """
+
+    def __init__(self, cache_folder: str = DOWNLOAD_CACHE_FOLDER, negative_ttl: int = DOWNLOAD_CACHE_NEGATIVE_TTL):
+        """
+        Args:
+            cache_folder (str): Path to the folder where the cache entries are stored.
+            negative_ttl (int): Number of seconds a missing-file answer is trusted before asking again.
+        """
+        self.cache_folder = cache_folder
+        self.negative_ttl = negative_ttl
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def _paths(self, url: str) -> tuple:
+        """Returns the (content, metadata) file paths of the entry for the given URL."""
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_folder, f"{key}.xls"), os.path.join(self.cache_folder, f"{key}.json")
+
+    @staticmethod
+    def _write_atomic(file_path: str, data: bytes) -> None:
+        """Writes the data to a temporary file and renames it, so a partial entry is never visible."""
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, file_path)
+
+    def lookup(self, url: str) -> dict:
+        """
+        Returns the metadata of the cached entry for the URL.
+
+        Args:
+            url (str): URL of the workbook.
+
+        Returns:
+            dict: The entry metadata, or None if the URL is not cached (or its content is gone).
+        """
+        content_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if entry.get("status") == 200 and not os.path.exists(content_path):
+            return None
+        return entry
+
+    def is_missing(self, entry: dict) -> bool:
+        """Returns True if the entry records a missing file whose TTL has not expired yet."""
+        return entry is not None and entry.get("status") != 200 and time.time() < entry.get("expires_at", 0)
+
+    def is_final(self, entry: dict) -> bool:
+        """Returns True if the entry holds a workbook that will not be republished and can be used without a request."""
+        return entry is not None and entry.get("status") == 200 and entry.get("final", False)
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> dict:
+        """
+        Builds the If-None-Match/If-Modified-Since headers from the validators stored in the entry.
+
+        Args:
+            entry (dict): Cached entry metadata, or None.
+
+        Returns:
+            dict: Request headers (empty if there is nothing to revalidate).
+        """
+        headers = {}
+        if entry is None or entry.get("status") != 200:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def read_content(self, url: str) -> bytes:
+        """Returns the cached bytes for the URL, or None if they are not available."""
+        content_path, _ = self._paths(url)
+        try:
+            with open(content_path, "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def store(self, url: str, content: bytes, headers: dict, final: bool) -> None:
+        """
+        Stores a successfully downloaded workbook with its validators.
+
+        Args:
+            url (str): URL of the workbook.
+            content (bytes): Raw bytes of the workbook.
+            headers (dict): Response headers, used to keep the ETag and Last-Modified validators.
+            final (bool): Whether the workbook will no longer change (e.g. its date is old enough).
+        """
+        content_path, meta_path = self._paths(url)
+        self._write_atomic(content_path, content)
+        entry = {
+            "url": url,
+            "status": 200,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "final": final,
+            "size": len(content),
+            "fetched_at": time.time(),
+        }
+        self._write_atomic(meta_path, json.dumps(entry).encode("utf-8"))
+
+    def revalidated(self, url: str, entry: dict, final: bool) -> bytes:
+        """
+        Refreshes an entry after a '304 Not Modified' answer and returns its cached bytes.
+
+        Args:
+            url (str): URL of the workbook.
+            entry (dict): Cached entry metadata.
+            final (bool): Whether the workbook will no longer change.
+
+        Returns:
+            bytes: The cached content of the workbook.
+        """
+        _, meta_path = self._paths(url)
+        entry = dict(entry, final=final, fetched_at=time.time())
+        self._write_atomic(meta_path, json.dumps(entry).encode("utf-8"))
+        return self.read_content(url)
+
+    def store_missing(self, url: str, status_code: int) -> None:
+        """
+        Remembers that the URL does not exist (yet), so it is not requested again until the TTL expires.
+
+        Args:
+            url (str): URL of the workbook.
+            status_code (int): HTTP status code received (e.g. 404).
+        """
+        _, meta_path = self._paths(url)
+        now = time.time()
+        entry = {"url": url, "status": status_code, "fetched_at": now, "expires_at": now + self.negative_ttl}
+        self._write_atomic(meta_path, json.dumps(entry).encode("utf-8"))
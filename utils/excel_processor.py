@@ -1,41 +1,141 @@
+import os
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 from io import BytesIO
-from config import *
+from utils.parse_cache import ParsedWorkbookCache
+from config import COLUMNS, SOURCE_COLUMNS, NUMERIC_COLUMNS, EXCEL_HEADER_ROWS, EXCEL_NA_VALUES
 
-def process_sheets(file_data: bytes, date_str: str) -> dict:
+def _column_dtypes(positions: list, names: list, numeric: bool) -> dict:
+    """Returns the dtype of each parsed column, keyed by its position in the sheet."""
+    return {
+        position: ('float64' if numeric and name in NUMERIC_COLUMNS else str)
+        for position, name in zip(positions, names)
+    }
+
+def process_sheets(file_data: bytes, date_str: str, columns: list = None) -> dict:
     """
     Processes each sheet of the Excel file and returns a dictionary with the sheet name as the key and the processed DataFrame as the value.
 
+    The header rows are skipped and only the requested columns are decoded, with their dtypes declared up front
+    (NUMERIC_COLUMNS as floats, the remaining ones as strings). The last header row of each sheet must be the
+    column header ('Código' in the first column): a workbook whose header no longer has EXCEL_HEADER_ROWS rows
+    is rejected instead of being parsed with its rows shifted.
+
     Args:
         file_data (bytes): Excel file in bytes format.
         date_str (str): Date in the format 'yyyymmdd', used as a reference for processing.
+        columns (list): Columns to keep, in the names of COLUMNS. Default is SOURCE_COLUMNS. 'Nome' is always parsed.
 
     Returns:
         dict: A dictionary where the key is the sheet name and the value is the processed DataFrame.
     """
+    columns = columns if columns is not None else SOURCE_COLUMNS
+    names = [name for name in COLUMNS if name in columns or name == 'Nome']
+    positions = [COLUMNS.index(name) for name in names]
+
     try:
-        # Wrap file_data in BytesIO to read it correctly
-        file_like_object = BytesIO(file_data)
-        
-        # Read all sheets from the Excel file
-        sheets = pd.read_excel(file_like_object, sheet_name=None)  
+        # The workbook is decoded once, then each read below only converts its cells
+        workbook = pd.ExcelFile(BytesIO(file_data))
+
+        # The row above the data must be the column header, or the header rows changed
+        headers = pd.read_excel(workbook, sheet_name=None, header=None, skiprows=EXCEL_HEADER_ROWS - 1, nrows=1,
+                                usecols=[0], dtype=str)
+        for sheet_name, header in headers.items():
+            if header.empty:
+                continue  # Sheet shorter than its header, parsed as empty below
+            label = str(header.iat[0, 0]).strip()
+            if label != COLUMNS[0]:
+                raise ValueError(f"sheet '{sheet_name}' has no '{COLUMNS[0]}' header in row {EXCEL_HEADER_ROWS} "
+                                 f"(found {label!r}), its layout changed")
+
+        read_options = dict(sheet_name=None, header=None, skiprows=EXCEL_HEADER_ROWS, usecols=positions,
+                            na_values=EXCEL_NA_VALUES)
+        try:
+            # Read all sheets from the Excel file, decoding only the selected columns
+            sheets = pd.read_excel(workbook, dtype=_column_dtypes(positions, names, numeric=True), **read_options)
+        except ValueError:
+            # A text value in a numeric column: parse as text and coerce the numeric columns afterwards
+            sheets = pd.read_excel(workbook, dtype=_column_dtypes(positions, names, numeric=False), **read_options)
+            for df in sheets.values():
+                for position, name in zip(positions, names):
+                    if name in NUMERIC_COLUMNS:
+                        df[position] = pd.to_numeric(df[position], errors='coerce')
+
         processed_sheets = {}
 
         for sheet_name, df in sheets.items():
-            # Skip the first 8 rows and adjust the headers
-            df = df.iloc[8:].reset_index(drop=True)
-            
-            # Set the new column names
-            df.columns = COLUMNS
-            
+            # Set the column names
+            df.columns = names
+
             # Remove rows where 'Nome' is NaN and rows where all columns are NaN
             df = df.dropna(subset=['Nome']).dropna(how='all').reset_index(drop=True)
 
             # Add the processed sheet to the dictionary
-            processed_sheets[sheet_name] = df
+            processed_sheets[sheet_name] = df.loc[:, [name for name in names if name in columns]]
 
         return processed_sheets
 
     except Exception as error:
-        print(f"Error processing the spreadsheet: {error}")
+        print(f"Error processing the spreadsheet for {date_str}: {error}")
         return {}
+
+def process_workbooks(workbooks: dict, max_workers: int = 1, columns: list = None,
+                      cache: ParsedWorkbookCache = None, on_parsed=None) -> dict:
+    """
+    Processes the workbooks of several business days. Decoding .xls files is CPU-bound, so when 'max_workers'
+    is greater than 1 the workbooks are parsed in parallel by a process pool. Workbooks found in the cache
+    are not decoded at all, and newly parsed ones are added to it.
+
+    Args:
+        workbooks (dict): Mapping of business day ('yyyymmdd') to the Excel file in bytes format.
+        max_workers (int): Maximum number of worker processes. Default is 1 (parse in the current process).
+        columns (list): Columns to keep, in the names of COLUMNS. Default is SOURCE_COLUMNS.
+        cache (ParsedWorkbookCache): Optional cache of parsed workbooks, created with the same 'columns'.
+        on_parsed: Optional function called with (date_str, sheets) as soon as each workbook is processed, e.g.
+                   to queue its writes while the next workbooks are still being parsed.
+
+    Returns:
+        dict: Mapping of business day to the dictionary of processed sheets returned by process_sheets.
+              A day whose workbook could not be processed maps to an empty dictionary.
+    """
+    processed = {}
+    pending = {}
+    for date_str, file_data in workbooks.items():
+        sheets = cache.get(file_data) if cache is not None else None
+        if sheets is not None:
+            processed[date_str] = sheets
+        else:
+            pending[date_str] = file_data
+
+    if cache is not None:
+        print(f"Parsed workbook cache: {len(processed)} hit(s), {len(pending)} workbook(s) to decode.")
+
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(pending)))
+    parse = partial(process_sheets, columns=columns)
+
+    def done(date_str: str, sheets: dict) -> None:
+        if cache is not None and sheets and date_str in pending:
+            cache.put(pending[date_str], sheets)
+        processed[date_str] = sheets
+        if on_parsed is not None:
+            on_parsed(date_str, sheets)
+
+    for date_str in list(processed):
+        done(date_str, processed[date_str])
+
+    if max_workers == 1:
+        for date_str, file_data in pending.items():
+            done(date_str, parse(file_data, date_str))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(parse, file_data, date_str): date_str for date_str, file_data in pending.items()}
+            for future in as_completed(futures):
+                try:
+                    sheets = future.result()
+                except Exception as error:
+                    print(f"Error processing the spreadsheet for {futures[future]}: {error}")
+                    sheets = {}
+                done(futures[future], sheets)
+
+    return processed
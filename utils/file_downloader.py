@@ -1,7 +1,16 @@
+import random
 import requests
 import time
 from datetime import datetime
-from config import BASE_URL, MONTHS_PT_BR  # Static values from config.py
+from requests.adapters import HTTPAdapter
+from config import (  # Static values from config.py
+    BASE_URL, MONTHS_PT_BR, DOWNLOAD_MAX_WORKERS, DOWNLOAD_MAX_RETRIES,
+    DOWNLOAD_TIMEOUT, DOWNLOAD_BACKOFF_BASE, DOWNLOAD_BACKOFF_MAX
+)
+from utils.download_cache import DownloadCache
+
+# HTTP status codes meaning the workbook does not exist for the requested date
+MISSING_FILE_STATUS_CODES = (404, 410)
 
 def build_url(date: datetime) -> str:
     """
@@ -17,7 +26,7 @@ def build_url(date: datetime) -> str:
     month_abbr = date.strftime("%b").upper()  # Get the abbreviated month in uppercase
     month_abbr_pt = MONTHS_PT_BR.get(month_abbr, '').lower()  # Convert to the Portuguese month in lowercase
     year_abbr = date.strftime("%y")  # Abbreviated year with two digits
-    
+
     if not month_abbr_pt:
         raise ValueError(f"Month '{month_abbr}' not found in the mapping.")
 
@@ -25,31 +34,99 @@ def build_url(date: datetime) -> str:
     return f"{BASE_URL}d{year_abbr}{month_abbr_pt}{day}.xls"
 
 
-def download_file(url: str, max_retries: int = 3, delay: int = 5) -> bytes:
+def create_session(pool_size: int = DOWNLOAD_MAX_WORKERS) -> requests.Session:
+    """
+    Creates a keep-alive HTTP session whose connection pool can serve 'pool_size' concurrent downloads.
+
+    Args:
+        pool_size (int): Maximum number of pooled connections per host. Default is DOWNLOAD_MAX_WORKERS.
+
+    Returns:
+        requests.Session: Session to be shared by all downloads of a run.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def backoff_delay(attempt: int, base: float = DOWNLOAD_BACKOFF_BASE, cap: float = DOWNLOAD_BACKOFF_MAX) -> float:
+    """
+    Returns the wait time before the next retry using exponential backoff with full jitter,
+    so that concurrent downloads failing together do not retry in lockstep.
+
+    Args:
+        attempt (int): Zero-based number of the attempt that just failed.
+        base (float): Base wait time (in seconds), doubled on every attempt.
+        cap (float): Upper bound (in seconds) for the exponential wait.
+
+    Returns:
+        float: Number of seconds to wait.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def download_file(url: str, max_retries: int = DOWNLOAD_MAX_RETRIES, delay: float = DOWNLOAD_BACKOFF_BASE,
+                  session: requests.Session = None, cache: DownloadCache = None, final: bool = False) -> bytes:
     """
     Downloads a file from a URL with retry logic.
 
+    When a cache is given, a final cached workbook or a recently missing URL is answered without any request,
+    other cached workbooks are revalidated with a conditional GET, and missing files (404/410) are not retried.
+
     Args:
         url (str): The URL of the file to be downloaded.
-        max_retries (int): Maximum number of retry attempts before failing. Default is 3.
-        delay (int): Wait time (in seconds) between retries. Default is 5 seconds.
+        max_retries (int): Maximum number of retry attempts before failing. Default is DOWNLOAD_MAX_RETRIES.
+        delay (float): Base wait time (in seconds) of the jittered exponential backoff between retries.
+        session (requests.Session): Optional shared session, reusing its keep-alive connections.
+                                    A plain 'requests.get' is used when omitted.
+        cache (DownloadCache): Optional on-disk cache of previous downloads.
+        final (bool): Whether the file for this URL will no longer change, allowing the cache to skip the request.
 
     Returns:
         bytes: The content of the file, or None if the download fails after all attempts.
     """
+    http = session if session is not None else requests
+    entry = cache.lookup(url) if cache is not None else None
+
+    if cache is not None and cache.is_missing(entry):
+        print(f"Skipping download, file recently reported as missing: {url}")
+        return None
+    if cache is not None and cache.is_final(entry):
+        print(f"File loaded from cache: {url}")
+        return cache.read_content(url)
+
+    headers = DownloadCache.conditional_headers(entry)
+
     for attempt in range(max_retries):
         try:
             print(f"Attempting to download file (Attempt {attempt + 1}/{max_retries}): {url}")
-            response = requests.get(url, timeout=10)
+            response = http.get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+
+            if response.status_code == 304 and cache is not None:
+                print(f"File not modified, loaded from cache: {url}")
+                return cache.revalidated(url, entry, final)
+
+            if response.status_code in MISSING_FILE_STATUS_CODES:
+                # The file does not exist (holiday or not yet published): retrying will not help
+                print(f"File not available ({response.status_code}): {url}")
+                if cache is not None:
+                    cache.store_missing(url, response.status_code)
+                return None
+
             response.raise_for_status()  # Check for HTTP errors
             print(f"File successfully downloaded: {url}")
+            if cache is not None:
+                cache.store(url, response.content, response.headers, final)
             return response.content  # Return the file content
         except (requests.exceptions.RequestException, requests.exceptions.Timeout) as error:
             print(f"Error downloading file from {url}: {error}")
             if attempt < max_retries - 1:  # If it's not the last attempt
-                print(f"Waiting {delay} seconds before retrying...")
-                time.sleep(delay)
+                wait = backoff_delay(attempt, delay)
+                print(f"Waiting {wait:.1f} seconds before retrying...")
+                time.sleep(wait)
             else:
                 print(f"Failed to download the file after {max_retries} attempts.")
-    
+
     return None  # Return None if all attempts fail
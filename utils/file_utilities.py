@@ -1,5 +1,6 @@
 import os
 import pandas as pd
+from config import EXPORT_DATE_FORMAT, OUTPUT_FSYNC
 
 def ensure_folder_exists(folder_path: str) -> None:
     """
@@ -14,16 +15,31 @@ def ensure_folder_exists(folder_path: str) -> None:
     else:
         print(f"Folder already exists: {folder_path}")
 
-def save_dataframe_to_csv(df: pd.DataFrame, file_path: str) -> None:
+def save_dataframe_to_csv(df: pd.DataFrame, file_path: str, raise_on_error: bool = False) -> None:
     """
-    Saves a DataFrame to a CSV file.
+    Saves a DataFrame to a CSV file. Datetime columns are written in EXPORT_DATE_FORMAT ('DD/MM/YYYY').
+
+    The file is written to a temporary file in the same folder and renamed over 'file_path', so readers only
+    ever see a complete file (or the previous one). A path ending with '.gz' is written gzip-compressed.
     
     Args:
         df (pd.DataFrame): The DataFrame to save.
         file_path (str): The path to the file to save the DataFrame in.
+        raise_on_error (bool): Raise the error instead of printing it. Default is False.
     """
+    temp_path = f"{file_path}.tmp"
     try:
-        df.to_csv(file_path, index=False, encoding='utf-8')
+        with open(temp_path, 'wb') as file:
+            df.to_csv(file, index=False, encoding='utf-8', date_format=EXPORT_DATE_FORMAT,
+                      compression='gzip' if file_path.endswith('.gz') else None)
+            if OUTPUT_FSYNC:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temp_path, file_path)
         print(f"File saved: {file_path}")
     except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        if raise_on_error:
+            raise
         print(f"Failed to save file {file_path}: {e}")
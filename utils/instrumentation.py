@@ -0,0 +1,272 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+try:
+    import resource  # Unix only, used for the peak resident set size
+except ImportError:  # On Windows the RSS is not reported
+    resource = None
+
+# Counters every stage may report, besides any extra counter passed to StageMetrics.count
+STANDARD_COUNTERS = ['rows_in', 'rows_out', 'bytes_read', 'bytes_written']
+
+def _peak_rss_mb() -> float:
+    """Returns the peak resident set size of the process in MB, or None where it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1_048_576 if os.uname().sysname == 'Darwin' else 1024), 1)  # Bytes on macOS, KB on Linux
+
+def _rss_mb() -> float:
+    """Returns the current resident set size of the process in MB, or None where it is not available (Linux only)."""
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            resident_pages = int(file.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(resident_pages * os.sysconf('SC_PAGE_SIZE') / 1_048_576, 1)
+
+class _NullStage:
+    """Stage returned while instrumentation is off: entering, leaving and counting do nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def count(self, **counters) -> None:
+        pass
+
+NULL_STAGE = _NullStage()
+
+class StageMetrics:
+    """
+    Measurements of one run of a stage: wall time, CPU time of the thread running it, resident set size at
+    entry and exit, growth of the process peak RSS during the stage, peak traced Python memory (when memory
+    tracing is on) and the counters reported by the stage (rows in/out, bytes read/written).
+
+    The CPU time is that of the stage's own thread, so stages running at the same time in other threads (the
+    downloads of several days) are not counted twice; work done in child processes (workbook decoding, plot
+    rendering) is not included. The RSS is process-wide: stages running at the same time share it.
+    """
+
+    def __init__(self, recorder: "RunRecorder", name: str, labels: dict):
+        self.recorder = recorder
+        self.name = name
+        self.labels = labels
+        self.counters = {}
+        self.parent = None
+        self._traced_peak = 0
+
+    def count(self, **counters) -> None:
+        """Adds to the counters of the stage, e.g. count(rows_in=len(df), bytes_read=len(file_data))."""
+        for counter, value in counters.items():
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def __enter__(self):
+        stack = self.recorder._stack()
+        self.parent = stack[-1] if stack else None
+        if self.recorder.trace_memory:
+            if self.parent is not None:
+                self.parent._traced_peak = max(self.parent._traced_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        stack.append(self)
+        self._start_rss = _rss_mb()
+        self._start_peak_rss = _peak_rss_mb()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self._start_wall
+        cpu = time.thread_time() - self._start_cpu
+        self.recorder._stack().pop()
+        peak_rss = _peak_rss_mb()
+
+        record = {
+            'stage': self.name,
+            **self.labels,
+            'parent': self.parent.name if self.parent is not None else None,
+            'wall_seconds': round(wall, 6),
+            'cpu_seconds': round(cpu, 6),
+            'rss_start_mb': self._start_rss,
+            'rss_end_mb': _rss_mb(),
+            # The process peak only ever grows: its growth is what this stage (or one running with it) added
+            'peak_rss_growth_mb': round(peak_rss - self._start_peak_rss, 1) if peak_rss is not None else None,
+        }
+        if self.recorder.trace_memory:
+            self._traced_peak = max(self._traced_peak, tracemalloc.get_traced_memory()[1])
+            record['peak_traced_mb'] = round(self._traced_peak / 1_048_576, 3)
+            if self.parent is not None:
+                self.parent._traced_peak = max(self.parent._traced_peak, self._traced_peak)
+        record.update(self.counters)
+        if 'rows_in' in self.counters and 'rows_out' in self.counters:
+            record['rows_dropped'] = self.counters['rows_in'] - self.counters['rows_out']
+        if exc_type is not None:
+            record['error'] = f"{exc_type.__name__}: {exc_value}"
+        self.recorder._add(record)
+        return False
+
+class RunRecorder:
+    """
+    Collects the StageMetrics of a run and writes them as a JSON run report. Stages may run in several
+    threads (e.g. one per day being downloaded): each thread keeps its own stack of open stages.
+    """
+
+    def __init__(self, trace_memory: bool = False, profile: bool = False):
+        """
+        Args:
+            trace_memory (bool): Whether to trace Python allocations with tracemalloc (slows the run down).
+            profile (bool): Whether to capture a cProfile profile of the whole run.
+        """
+        self.trace_memory = trace_memory
+        self.records = []
+        self.started = datetime.now()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.profiler = cProfile.Profile() if profile else None
+
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def _stack(self) -> list:
+        """Returns the stack of open stages of the current thread."""
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _add(self, record: dict) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def totals(self) -> dict:
+        """
+        Returns the runs, wall time, thread CPU time and counters of each stage, summed over its runs (e.g. days).
+        """
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {'runs': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+            total['runs'] += 1
+            total['wall_seconds'] = round(total['wall_seconds'] + record['wall_seconds'], 6)
+            total['cpu_seconds'] = round(total['cpu_seconds'] + record['cpu_seconds'], 6)
+            for counter in STANDARD_COUNTERS + ['rows_dropped']:
+                if counter in record:
+                    total[counter] = total.get(counter, 0) + record[counter]
+        return totals
+
+    def _profile_summary(self, limit: int = 30) -> list:
+        """Returns the functions with the highest cumulative time in the cProfile capture."""
+        stats = pstats.Stats(self.profiler, stream=io.StringIO()).sort_stats('cumulative')
+        summary = []
+        for (file_name, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+            summary.append({'function': f"{file_name}:{line}({function})", 'calls': calls,
+                            'own_seconds': round(own, 6), 'cumulative_seconds': round(cumulative, 6)})
+        return sorted(summary, key=lambda item: -item['cumulative_seconds'])[:limit]
+
+    def write_report(self, report_path: str) -> dict:
+        """
+        Writes the run report as JSON (and the raw profile next to it as '<report>.prof' when profiling).
+
+        Args:
+            report_path (str): Path of the JSON report.
+
+        Returns:
+            dict: The report.
+        """
+        report = {
+            'started': self.started.isoformat(timespec='seconds'),
+            'wall_seconds': round(time.perf_counter() - self._start_wall, 6),
+            'cpu_seconds': round(time.process_time() - self._start_cpu, 6),  # Every thread of the process
+            'peak_rss_mb': _peak_rss_mb(),  # Peak of the whole process
+            'totals': self.totals(),
+            'stages': self.records,
+        }
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(f"{os.path.splitext(report_path)[0]}.prof")
+            report['profile'] = self._profile_summary()
+
+        folder = os.path.dirname(report_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        temp_path = f"{report_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+        os.replace(temp_path, report_path)
+        return report
+
+    def print_summary(self) -> None:
+        """Prints the totals of each stage."""
+        for name, total in self.totals().items():
+            counters = ", ".join(f"{counter}={total[counter]}" for counter in STANDARD_COUNTERS + ['rows_dropped']
+                                 if counter in total)
+            print(f"  {name:<20} {total['runs']:>4} run(s) {total['wall_seconds']:>9.3f}s wall "
+                  f"{total['cpu_seconds']:>9.3f}s CPU  {counters}")
+
+# Recorder of the current run, None while instrumentation is off
+_recorder = None
+
+def start_run(trace_memory: bool = False, profile: bool = False) -> RunRecorder:
+    """
+    Turns instrumentation on for a new run.
+
+    Args:
+        trace_memory (bool): Whether to trace Python allocations with tracemalloc.
+        profile (bool): Whether to capture a cProfile profile of the run.
+
+    Returns:
+        RunRecorder: The recorder of the run.
+    """
+    global _recorder
+    _recorder = RunRecorder(trace_memory, profile)
+    return _recorder
+
+def finish_run(report_path: str) -> dict:
+    """
+    Writes the report of the current run, prints its summary and turns instrumentation off.
+
+    Args:
+        report_path (str): Path of the JSON report.
+
+    Returns:
+        dict: The report, or None if instrumentation was off.
+    """
+    global _recorder
+    if _recorder is None:
+        return None
+    recorder, _recorder = _recorder, None
+    report = recorder.write_report(report_path)
+    if recorder.trace_memory:
+        tracemalloc.stop()
+    print(f"Run report saved to: {report_path}")
+    recorder.print_summary()
+    return report
+
+def stage(name: str, **labels):
+    """
+    Context manager measuring a stage of the run, e.g.:
+
+        with stage("download", day=date_str) as metrics:
+            file_data = download_file(url)
+            metrics.count(bytes_read=len(file_data))
+
+    While instrumentation is off it returns a shared object whose methods do nothing.
+
+    Args:
+        name (str): Name of the stage.
+        **labels: Extra fields identifying this run of the stage (e.g. day='20240927').
+    """
+    if _recorder is None:
+        return NULL_STAGE
+    return StageMetrics(_recorder, name, labels)
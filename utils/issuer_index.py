@@ -0,0 +1,211 @@
+import os
+import pickle
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+import pandas as pd
+from config import ISSUER_INDEX_FILE, ISSUER_FUZZY_THRESHOLD
+
+# Footnote markers appended to the names in the workbooks, e.g. 'MAGAZINE LUIZA S/A (*) (**)'
+FOOTNOTE_PATTERN = re.compile(r"\(\s*\*+\s*\)")
+# Spellings of 'sociedade anônima' ('S/A', 'S.A.', 'S.A', 'S A'), all normalized to 'SA'
+SOCIEDADE_ANONIMA_PATTERN = re.compile(r"\bS\s*[/.]?\s*A\b\.?")
+NON_ALPHANUMERIC_PATTERN = re.compile(r"[^A-Z0-9]+")
+
+def normalize_name(name: str) -> str:
+    """
+    Normalizes an issuer name so that the variants found across days map to the same key: uppercase, without
+    accents, footnote markers or punctuation, and with 'S/A', 'S.A.' and similar spelled as 'SA'.
+
+    Args:
+        name (str): Name as found in the 'Nome' column, e.g. 'OMEGA GERAÇÃO S/A (*)'.
+
+    Returns:
+        str: Normalized name, e.g. 'OMEGA GERACAO SA'.
+    """
+    name = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode('ascii').upper()
+    name = FOOTNOTE_PATTERN.sub(' ', name)
+    name = SOCIEDADE_ANONIMA_PATTERN.sub(' SA ', name)
+    return NON_ALPHANUMERIC_PATTERN.sub(' ', name).strip()
+
+def trigrams(text: str) -> set:
+    """Returns the trigrams of each word of a normalized text, padded so word starts and ends count."""
+    return {f"  {word} "[i:i + 3] for word in text.split() for i in range(len(word) + 1)}
+
+class IssuerIndex:
+    """
+    Search index over the issuer names of the full history: each normalized issuer name maps to the set of
+    its debenture codes and to the raw names seen for it, with inverted indexes from words and trigrams to
+    issuers and a sorted list of issuers for prefix searches. Lookups never scan the quotes.
+    """
+
+    def __init__(self):
+        self.codes = {}  # Normalized issuer -> set of 'Código'
+        self.names = {}  # Normalized issuer -> set of raw 'Nome' values
+        self.tokens = {}  # Word -> set of normalized issuers
+        self.trigrams = {}  # Trigram -> set of normalized issuers
+        self.trigram_counts = {}  # Normalized issuer -> number of distinct trigrams
+        self._sorted_issuers = []
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def _add_issuer(self, issuer: str) -> None:
+        """Adds a new normalized issuer to the inverted indexes."""
+        self.codes[issuer] = set()
+        self.names[issuer] = set()
+        for token in issuer.split():
+            self.tokens.setdefault(token, set()).add(issuer)
+        issuer_trigrams = trigrams(issuer)
+        for trigram in issuer_trigrams:
+            self.trigrams.setdefault(trigram, set()).add(issuer)
+        self.trigram_counts[issuer] = len(issuer_trigrams)
+
+    def update(self, df: pd.DataFrame) -> bool:
+        """
+        Adds the issuers and codes of a cleaned dataset (or chunk) to the index. Names are normalized once per
+        distinct value.
+
+        Args:
+            df (pd.DataFrame): DataFrame with the 'Nome' and 'Código' columns.
+
+        Returns:
+            bool: True if the index changed.
+        """
+        pairs = df[['Nome', 'Código']].dropna().drop_duplicates()
+        normalized = {name: normalize_name(name) for name in pairs['Nome'].unique()}
+        changed = False
+
+        for name, code in pairs.itertuples(index=False, name=None):
+            issuer = normalized[name]
+            if not issuer:
+                continue
+            if issuer not in self.codes:
+                self._add_issuer(issuer)
+            if code not in self.codes[issuer] or name not in self.names[issuer]:
+                self.codes[issuer].add(code)
+                self.names[issuer].add(name)
+                changed = True
+
+        if changed:
+            self._sorted_issuers = sorted(self.codes)
+        return changed
+
+    def lookup(self, issuer: str) -> list:
+        """
+        Returns the codes of an issuer, matched by its normalized name.
+
+        Args:
+            issuer (str): Issuer name, e.g. 'VALE S/A' or 'Vale S.A.'.
+
+        Returns:
+            list: Sorted codes (empty if the issuer is unknown).
+        """
+        return sorted(self.codes.get(normalize_name(issuer), ()))
+
+    def search_prefix(self, prefix: str) -> list:
+        """Returns the normalized issuers starting with the (normalized) prefix, in alphabetical order."""
+        prefix = normalize_name(prefix)
+        start = bisect_left(self._sorted_issuers, prefix)
+        matches = []
+        for issuer in self._sorted_issuers[start:]:
+            if not issuer.startswith(prefix):
+                break
+            matches.append(issuer)
+        return matches
+
+    def search_tokens(self, query: str) -> list:
+        """Returns the normalized issuers containing every word of the query, in alphabetical order."""
+        postings = [self.tokens.get(token, set()) for token in normalize_name(query).split()]
+        if not postings:
+            return []
+        return sorted(set.intersection(*sorted(postings, key=len)))
+
+    def search_fuzzy(self, query: str, limit: int = 10, threshold: float = ISSUER_FUZZY_THRESHOLD) -> list:
+        """
+        Returns the issuers whose names best contain the query, tolerating misspellings. The similarity is the
+        share of the query's trigrams found in the issuer name (so 'PETROBRAZ' finds 'PETROLEO BRASILEIRO SA
+        PETROBRAS'), ties being broken by the similarity of the whole names.
+
+        Args:
+            query (str): Issuer name, or part of it, to look for.
+            limit (int): Maximum number of issuers returned. Default is 10.
+            threshold (float): Minimum similarity, between 0 and 1. Default is ISSUER_FUZZY_THRESHOLD.
+
+        Returns:
+            list: (normalized issuer, similarity) pairs, most similar first.
+        """
+        query_trigrams = trigrams(normalize_name(query))
+        if not query_trigrams:
+            return []
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self.trigrams.get(trigram, ()))
+
+        minimum_shared = threshold * len(query_trigrams)
+        scores = []
+        for issuer, count in shared.items():
+            if count >= minimum_shared:
+                name_similarity = count / (len(query_trigrams) + self.trigram_counts[issuer] - count)
+                scores.append((issuer, round(count / len(query_trigrams), 3), name_similarity))
+        scores.sort(key=lambda item: (-item[1], -item[2], item[0]))
+        return [(issuer, similarity) for issuer, similarity, _ in scores[:limit]]
+
+    def codes_for(self, query: str, mode: str = 'exact') -> list:
+        """
+        Returns every code of the issuers matching the query.
+
+        Args:
+            query (str): Issuer name, prefix or words to look for.
+            mode (str): 'exact', 'prefix', 'tokens' or 'fuzzy'. Default is 'exact'.
+
+        Returns:
+            list: Sorted distinct codes.
+        """
+        if mode == 'exact':
+            return self.lookup(query)
+        if mode == 'prefix':
+            issuers = self.search_prefix(query)
+        elif mode == 'tokens':
+            issuers = self.search_tokens(query)
+        elif mode == 'fuzzy':
+            issuers = [issuer for issuer, _ in self.search_fuzzy(query)]
+        else:
+            raise ValueError(f"Unknown search mode '{mode}', expected 'exact', 'prefix', 'tokens' or 'fuzzy'.")
+        return sorted(set().union(*(self.codes[issuer] for issuer in issuers)))
+
+    def save(self, file_path: str) -> None:
+        """Saves the index (temporary file plus rename)."""
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, "wb") as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, file_path)
+
+    @staticmethod
+    def load(file_path: str) -> "IssuerIndex":
+        """Loads a saved index, or returns an empty one if it does not exist or cannot be read."""
+        try:
+            with open(file_path, "rb") as file:
+                return pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError):
+            return IssuerIndex()
+
+def update_issuer_index(df: pd.DataFrame, destination_folder: str) -> IssuerIndex:
+    """
+    Adds the issuers of a cleaned dataset to the index saved in a folder (ISSUER_INDEX_FILE), keeping the
+    issuers of previous runs so the index covers the full history.
+
+    Args:
+        df (pd.DataFrame): Cleaned dataset.
+        destination_folder (str): Path to the folder where the index is stored.
+
+    Returns:
+        IssuerIndex: The updated index.
+    """
+    file_path = os.path.join(destination_folder, ISSUER_INDEX_FILE)
+    index = IssuerIndex.load(file_path)
+    if index.update(df) or not os.path.exists(file_path):
+        index.save(file_path)
+        print(f"Issuer index saved with {len(index)} issuers: {file_path}")
+    return index
@@ -0,0 +1,41 @@
+import pandas as pd
+
+def memory_usage_report(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Builds a per-column memory report comparing the current dtypes with plain Python object storage
+    (how the columns were held before categoricals and declared dtypes).
+
+    Args:
+        df (pd.DataFrame): The DataFrame to inspect.
+
+    Returns:
+        pd.DataFrame: One row per column with its 'dtype', the 'bytes' it uses, the 'object_bytes' it would use
+                      as Python objects and the 'savings' factor, plus a 'TOTAL' row.
+    """
+    rows = []
+    for column in df.columns:
+        used = int(df[column].memory_usage(index=False, deep=True))
+        as_object = int(df[column].astype(object).memory_usage(index=False, deep=True))
+        rows.append({'column': column, 'dtype': str(df[column].dtype), 'bytes': used, 'object_bytes': as_object})
+
+    report = pd.DataFrame(rows, columns=['column', 'dtype', 'bytes', 'object_bytes'])
+    total = {'column': 'TOTAL', 'dtype': '', 'bytes': report['bytes'].sum(), 'object_bytes': report['object_bytes'].sum()}
+    report = pd.concat([report, pd.DataFrame([total])], ignore_index=True)
+    report['savings'] = (report['object_bytes'] / report['bytes'].where(report['bytes'] > 0)).round(1)
+    return report.set_index('column')
+
+def print_memory_usage(df: pd.DataFrame, label: str, detailed: bool = False) -> None:
+    """
+    Prints the memory used by a DataFrame and the savings over plain Python object storage.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to inspect.
+        label (str): Name of the DataFrame in the message.
+        detailed (bool): Whether to print the per-column report. Default is False (total only).
+    """
+    report = memory_usage_report(df)
+    total = report.loc['TOTAL']
+    print(f"Memory usage of {label}: {total['bytes'] / 1_048_576:.2f} MB "
+          f"({total['object_bytes'] / 1_048_576:.2f} MB as Python objects, {total['savings']}x smaller).")
+    if detailed:
+        print(report.to_string())
@@ -0,0 +1,95 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+import pandas as pd
+from utils.file_utilities import save_dataframe_to_csv
+from utils.instrumentation import stage
+from config import OUTPUT_WRITER_WORKERS, OUTPUT_WRITER_QUEUE_SIZE
+
+class OutputWriter:
+    """
+    Write-behind writer of the outputs: DataFrames (or any write function) are queued and written by a
+    background thread pool, so parsing and cleaning carry on while the previous outputs reach the disk.
+
+    The queue is bounded: once 'max_pending' writes are waiting, submitting blocks until one finishes, so the
+    producer never holds more than that many DataFrames in memory. CSVs are written with save_dataframe_to_csv,
+    i.e. to a temporary file renamed over the final one, so a crash can never leave a partial file in place.
+    flush() is the barrier a stage calls before depending on its outputs being on disk.
+    """
+
+    def __init__(self, max_workers: int = OUTPUT_WRITER_WORKERS, max_pending: int = OUTPUT_WRITER_QUEUE_SIZE):
+        """
+        Args:
+            max_workers (int): Number of writer threads. Default is OUTPUT_WRITER_WORKERS.
+            max_pending (int): Maximum number of queued or running writes. Default is OUTPUT_WRITER_QUEUE_SIZE.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="output-writer")
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._errors = []
+
+    def submit(self, function, *args, **kwargs) -> Future:
+        """
+        Queues a write, blocking while the queue is full.
+
+        Args:
+            function: Function doing the write, called with 'args' and 'kwargs' on a writer thread.
+
+        Returns:
+            Future: Future of the write, whose exception is also reported by flush().
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(function, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def write_csv(self, df: pd.DataFrame, file_path: str) -> Future:
+        """Queues an atomic write of a DataFrame to a CSV file (gzip-compressed if the path ends with '.gz')."""
+        return self.submit(_write_csv, df, file_path)
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+            if not future.cancelled() and future.exception() is not None:
+                self._errors.append(future.exception())
+        self._slots.release()
+
+    def flush(self) -> list:
+        """
+        Waits until every write submitted so far has finished.
+
+        Returns:
+            list: Exceptions of the writes that failed since the previous flush (empty if all succeeded).
+        """
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+        with self._lock:
+            errors, self._errors = self._errors, []
+        return errors
+
+    def close(self) -> list:
+        """Flushes the pending writes and stops the writer threads. Returns the exceptions of failed writes."""
+        errors = self.flush()
+        self._executor.shutdown(wait=True)
+        return errors
+
+    def __enter__(self) -> "OutputWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def _write_csv(df: pd.DataFrame, file_path: str) -> None:
+    """Writes a CSV on a writer thread, recorded as a 'write_csv' stage."""
+    with stage("write_csv", file=os.path.basename(file_path)) as metrics:
+        save_dataframe_to_csv(df, file_path, raise_on_error=True)
+        metrics.count(rows_out=len(df), bytes_written=os.path.getsize(file_path))
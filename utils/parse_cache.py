@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import pickle
+from config import (
+    PARSE_CACHE_FOLDER, PARSE_RULES_VERSION, COLUMNS, SOURCE_COLUMNS, NUMERIC_COLUMNS, EXCEL_HEADER_ROWS,
+    EXCEL_NA_VALUES
+)
+
+def parse_version(columns: list = None) -> str:
+    """
+    Returns a fingerprint of everything that affects the output of process_sheets: the sheet layout
+    (COLUMNS, header rows, placeholders, numeric columns), the selected columns and PARSE_RULES_VERSION.
+
+    Args:
+        columns (list): Columns selected when parsing. Default is SOURCE_COLUMNS.
+
+    Returns:
+        str: Short hexadecimal fingerprint of the parse rules.
+    """
+    rules = {
+        "version": PARSE_RULES_VERSION,
+        "columns": COLUMNS,
+        "selected": columns if columns is not None else SOURCE_COLUMNS,
+        "numeric": NUMERIC_COLUMNS,
+        "header_rows": EXCEL_HEADER_ROWS,
+        "na_values": EXCEL_NA_VALUES,
+    }
+    return hashlib.sha1(json.dumps(rules, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+class ParsedWorkbookCache:
+    """
+    On-disk cache of the sheets parsed from a workbook, keyed by the SHA-256 of the workbook bytes and the
+    version of the parse rules. Entries are pickled dictionaries of DataFrames, which load far faster than
+    decoding the .xls again. Changing the parse rules changes the key, so stale entries are never used.
+    """
+
+    def __init__(self, cache_folder: str = PARSE_CACHE_FOLDER, columns: list = None):
+        """
+        Args:
+            cache_folder (str): Path to the folder where the parsed workbooks are stored.
+            columns (list): Columns selected when parsing. Default is SOURCE_COLUMNS.
+        """
+        self.cache_folder = cache_folder
+        self.version = parse_version(columns)
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def _path(self, file_data: bytes) -> str:
+        """Returns the path of the entry for the given workbook bytes."""
+        key = hashlib.sha256(file_data).hexdigest()
+        return os.path.join(self.cache_folder, f"{key}-{self.version}.pkl")
+
+    def contains(self, file_data: bytes) -> bool:
+        """Returns True if the workbook has already been parsed with the current rules."""
+        return os.path.exists(self._path(file_data))
+
+    def get(self, file_data: bytes) -> dict:
+        """
+        Returns the parsed sheets of the workbook.
+
+        Args:
+            file_data (bytes): Excel file in bytes format.
+
+        Returns:
+            dict: Sheet name -> processed DataFrame, or None if the workbook is not cached.
+        """
+        try:
+            with open(self._path(file_data), "rb") as file:
+                return pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, file_data: bytes, sheets: dict) -> None:
+        """
+        Stores the parsed sheets of the workbook (temporary file plus rename).
+
+        Args:
+            file_data (bytes): Excel file in bytes format.
+            sheets (dict): Sheet name -> processed DataFrame, as returned by process_sheets.
+        """
+        file_path = self._path(file_data)
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, "wb") as file:
+            pickle.dump(sheets, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, file_path)
@@ -1,64 +1,55 @@
-import matplotlib.pyplot as plt
 import os
-from utils.csv_utilities import load_csv, validate_date_column
-from config import CLEANED_DATA_FILE
-
-def plot_indicative_rate_by_indexer(destination_folder: str) -> None:
+import pandas as pd
+from utils.csv_utilities import validate_date_column
+from utils.dataset_store import load_dataset
+from utils.plot_rendering import line_plot_job, render_plots
+from config import (
+    CLEANED_DATA_FILE, CLEANED_DATA_STORE, CLEANED_DATA_DTYPES, PLOT_MANIFEST_FILE, PLOT_MAX_WORKERS, EXPORT_DATE_FORMAT
+)
+
+def plot_indicative_rate_by_indexer(destination_folder: str, df: pd.DataFrame = None,
+                                    max_workers: int = PLOT_MAX_WORKERS) -> list:
     """
     Plots the average indicative rate (Taxa Indicativa Média) by date for each indexer.
 
+    The plots are rendered as a batch by render_plots: headless, in parallel across processes, and only for
+    the indexers whose averages changed since their plot was last rendered.
+
     Args:
-        destination_folder (str): Path to the folder where the CSV file is stored.
-    """
-    # Construct the file path
-    file_path = os.path.join(destination_folder, CLEANED_DATA_FILE)
+        destination_folder (str): Path to the folder where the cleaned dataset is stored.
+        df (pd.DataFrame): Optional cleaned dataset already in memory (its dates already validated by
+                           clean_dataset). Default loads it from 'destination_folder'.
+        max_workers (int): Maximum number of rendering processes. Default is PLOT_MAX_WORKERS.
 
-    # Load the CSV file with error handling
-    df = load_csv(file_path)
+    Returns:
+        list: Paths of the plots of every indexer.
+    """
     if df is None:
-        return  # Exit if the file couldn't be loaded
+        # Load only the columns needed for the plots (from the columnar store when available)
+        df = load_dataset(destination_folder, CLEANED_DATA_STORE, CLEANED_DATA_FILE,
+                          columns=['data', 'Indexer', 'Taxa Indicativa'], dtype=CLEANED_DATA_DTYPES)
+        if df is None:
+            return []  # Exit if the file couldn't be loaded
 
-    # Validate the 'data' (date) column
-    df = validate_date_column(df, 'data')
+        # Validate the 'data' (date) column
+        df = validate_date_column(df, 'data')
 
-    # Group by 'data' and 'Indexer' and calculate the average 'Taxa Indicativa'
+    # Group by 'data' and 'Indexer' and calculate the average 'Taxa Indicativa' ('data' is datetime, so the
+    # groups and the plotted series are in chronological order)
     try:
-        df_grouped = df.groupby(['data', 'Indexer'])['Taxa Indicativa'].mean().reset_index()
+        df_grouped = df.groupby(['data', 'Indexer'], observed=True)['Taxa Indicativa'].mean().reset_index()
     except KeyError as e:
         print(f"Error: Missing expected column {e} in the dataset.")
-        return
-
-    # List of unique indexers
-    indexers = df_grouped['Indexer'].unique()
-
-    for indexer in indexers:
-        # Filter the dataframe for the current indexer
-        df_indexer = df_grouped[df_grouped['Indexer'] == indexer]
-
-        # Plotting
-        plt.figure(figsize=(10, 6))
-        plt.plot(df_indexer['data'], df_indexer['Taxa Indicativa'], marker='o')
-
-        # Format the x-axis for better readability
-        plt.xticks(rotation=45)
-        plt.xlabel("Date (DD-MM-YYYY)")
-        plt.ylabel("Average Indicative Rate (%)")
-
-        # Set the title
-        plt.title(f"Average Indicative Rate by Date - {indexer}")
-
-        # Add gridlines for better visual clarity
-        plt.grid(True)
-
-        # Ensure the output file path exists
-        output_file = os.path.join(destination_folder, f"indicative_rate_{indexer}.png")
-        try:
-            plt.savefig(output_file)
-            print(f"Plot saved as: {output_file}")
-        except Exception as e:
-            print(f"Error saving plot for {indexer}: {e}")
-        finally:
-            plt.close()  # Close the plot to free memory
-
-        # Optionally display the plot
-        plt.show()
+        return []
+
+    # One plot job per indexer
+    jobs = []
+    for indexer, df_indexer in df_grouped.groupby('Indexer', observed=True, sort=False):
+        jobs.append(line_plot_job(
+            output_file=os.path.join(destination_folder, f"indicative_rate_{indexer}.png"),
+            x=df_indexer['data'], y=df_indexer['Taxa Indicativa'],
+            title=f"Average Indicative Rate by Date - {indexer}",
+            xlabel="Date (DD/MM/YYYY)", ylabel="Average Indicative Rate (%)", x_date_format=EXPORT_DATE_FORMAT,
+        ))
+
+    return render_plots(jobs, os.path.join(destination_folder, PLOT_MANIFEST_FILE), max_workers)
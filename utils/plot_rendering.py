@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use("Agg")  # Non-interactive backend: figures are only ever written to files
+from matplotlib.dates import AutoDateLocator, DateFormatter
+from matplotlib.figure import Figure
+from utils.csv_utilities import load_manifest, save_manifest
+from config import PLOT_MAX_WORKERS, PLOT_STYLE_VERSION
+
+MAX_DATE_TICKS = 15  # Date labels on the x-axis of a plot
+
+def line_plot_job(output_file: str, x: list, y: list, title: str, xlabel: str, ylabel: str,
+                  x_date_format: str = None) -> dict:
+    """
+    Describes a line plot to be rendered by render_plots. Jobs are plain dictionaries so they can be sent to
+    worker processes and hashed.
+
+    Args:
+        output_file (str): Path of the PNG file.
+        x (list): Values of the x-axis.
+        y (list): Values of the y-axis.
+        title (str): Title of the plot.
+        xlabel (str): Label of the x-axis.
+        ylabel (str): Label of the y-axis.
+        x_date_format (str): Format of the x-axis labels when x holds dates, e.g. '%d/%m/%Y'. Default lets
+                             matplotlib choose.
+
+    Returns:
+        dict: The plot job.
+    """
+    return {"output_file": output_file, "x": list(x), "y": list(y), "title": title, "xlabel": xlabel,
+            "ylabel": ylabel, "x_date_format": x_date_format}
+
+def job_fingerprint(job: dict) -> str:
+    """Returns the SHA-256 of the plotted data, labels and PLOT_STYLE_VERSION of a plot job."""
+    content = json.dumps({"job": job, "style": PLOT_STYLE_VERSION}, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def render_line_plot(job: dict) -> str:
+    """
+    Renders a line plot job with the object-oriented Figure API (no pyplot global state, safe to run in
+    worker processes).
+
+    Args:
+        job (dict): Plot job built by line_plot_job.
+
+    Returns:
+        str: Path of the PNG file.
+    """
+    figure = Figure(figsize=(10, 6))
+    axes = figure.subplots()
+    axes.plot(job["x"], job["y"], marker='o')
+
+    # Format the x-axis for better readability
+    if job.get("x_date_format"):
+        # Daily series: one tick per plotted date while they fit, never ticks between two dates
+        if len(job["x"]) <= MAX_DATE_TICKS:
+            axes.set_xticks(job["x"])
+        else:
+            axes.xaxis.set_major_locator(AutoDateLocator(maxticks=MAX_DATE_TICKS))
+        axes.xaxis.set_major_formatter(DateFormatter(job["x_date_format"]))
+    axes.tick_params(axis='x', labelrotation=45)
+    axes.set_xlabel(job["xlabel"])
+    axes.set_ylabel(job["ylabel"])
+    axes.set_title(job["title"])
+
+    # Add gridlines for better visual clarity
+    axes.grid(True)
+    figure.tight_layout()
+
+    temp_file = f"{job['output_file']}.tmp.png"
+    figure.savefig(temp_file)
+    os.replace(temp_file, job["output_file"])
+    return job["output_file"]
+
+def render_plots(jobs: list, manifest_path: str, max_workers: int = PLOT_MAX_WORKERS) -> list:
+    """
+    Renders a batch of plot jobs, in parallel across processes when there are several of them. A plot whose
+    fingerprint (data, labels and style) matches the one recorded in the manifest for its file, and whose file
+    still exists, is not rendered again.
+
+    Args:
+        jobs (list): Plot jobs built by line_plot_job.
+        manifest_path (str): Path of the JSON manifest of rendered plots (output file -> fingerprint).
+        max_workers (int): Maximum number of rendering processes. Default is PLOT_MAX_WORKERS.
+
+    Returns:
+        list: Paths of the plots of every job, rendered now or still up to date.
+    """
+    manifest = load_manifest(manifest_path)
+    fingerprints = {job["output_file"]: job_fingerprint(job) for job in jobs}
+    pending = [job for job in jobs if manifest.get(job["output_file"]) != fingerprints[job["output_file"]]
+               or not os.path.exists(job["output_file"])]
+    print(f"Plots: {len(jobs) - len(pending)} up to date, {len(pending)} to render.")
+
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(pending)))
+    if max_workers == 1:
+        results = [(job, _render_safely(job)) for job in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(zip(pending, executor.map(_render_safely, pending)))
+
+    for job, error in results:
+        if error is None:
+            manifest[job["output_file"]] = fingerprints[job["output_file"]]
+            print(f"Plot saved as: {job['output_file']}")
+        else:
+            manifest.pop(job["output_file"], None)
+            print(f"Error saving plot {job['output_file']}: {error}")
+
+    save_manifest(manifest, manifest_path)
+    return [job["output_file"] for job in jobs if os.path.exists(job["output_file"])]
+
+def _render_safely(job: dict) -> str:
+    """Renders a plot job, returning the error message instead of raising (None on success)."""
+    try:
+        render_line_plot(job)
+        return None
+    except Exception as e:
+        return str(e)
@@ -0,0 +1,264 @@
+import hashlib
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from utils.dataset_store import parse_dates
+from config import DATASET_FOLDER, QUOTES_DATABASE_FILE, QUOTES_TABLE, QUOTES_BULK_LOAD_DAYS
+
+# Columns of the quotes table, in the names of the cleaned dataset
+QUOTE_COLUMNS = ['data', 'Código', 'Nome', 'PU', 'Taxa Indicativa', 'Indexer']
+
+# Secondary indexes of the quotes table (name -> indexed columns), besides the index on 'data'
+SECONDARY_INDEXES = {
+    'idx_cotacao_codigo': ['Código', 'data'],
+    'idx_cotacao_indexer': ['Indexer', 'data'],
+    'idx_cotacao_nome': ['Nome', 'Código'],
+}
+
+# Numeric columns that may be averaged by average_by_day (column names cannot be bound as SQL parameters)
+AVERAGE_COLUMNS = ['PU', 'Taxa Indicativa']
+
+def _quote(name: str) -> str:
+    """Quotes an SQL identifier such as 'Taxa Indicativa'."""
+    return '"' + name.replace('"', '""') + '"'
+
+def to_iso_dates(dates: pd.Series) -> pd.Series:
+    """
+    Converts a date column ('YYYYMMDD', 'DD/MM/YYYY' or datetime) into ISO 'YYYY-MM-DD' strings, the format
+    SQLite date functions understand and which sorts chronologically.
+
+    Args:
+        dates (pd.Series): Date column.
+
+    Returns:
+        pd.Series: ISO dates (NaN for invalid dates).
+    """
+    codes, unique_dates = pd.factorize(dates)
+    unique_iso = np.append(parse_dates(pd.Series(unique_dates)).dt.strftime('%Y-%m-%d').to_numpy(dtype=object), np.nan)
+    return pd.Series(unique_iso[codes], index=dates.index)
+
+def _iso_date(value) -> str:
+    """Converts a single date ('YYYYMMDD', 'DD/MM/YYYY', 'YYYY-MM-DD' or datetime) into an ISO date."""
+    if not isinstance(value, str):
+        return pd.Timestamp(value).strftime('%Y-%m-%d')
+    if '-' in value:
+        return value
+    return to_iso_dates(pd.Series([value])).iloc[0]
+
+class QuoteDatabase:
+    """
+    Local SQLite database with the cleaned quotes in the QUOTES_TABLE table ("CotacaoDebentures"), indexed by
+    date, code, Indexer and issuer, so the reports of 'Resposta Segunda Parte.txt' no longer rescan the
+    cleaned CSV. Dates are declared as DATE and stored as ISO 'YYYY-MM-DD' text.
+
+    Each day is loaded in its own transaction, replacing any previous rows of that day, and days whose rows
+    did not change since their last load are not written again.
+    """
+
+    def __init__(self, database_path: str = os.path.join(DATASET_FOLDER, QUOTES_DATABASE_FILE)):
+        """
+        Args:
+            database_path (str): Path to the SQLite database file (created if missing).
+        """
+        folder = os.path.dirname(database_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(database_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """Closes the connection to the database."""
+        self.connection.close()
+
+    def _create_schema(self) -> None:
+        """Creates the quotes table, its indexes and the table of loaded days, if they do not exist."""
+        table = _quote(QUOTES_TABLE)
+        with self.connection:
+            self.connection.executescript(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    data DATE NOT NULL,
+                    "Código" TEXT NOT NULL,
+                    Nome TEXT,
+                    PU REAL,
+                    "Taxa Indicativa" REAL,
+                    Indexer TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_cotacao_data ON {table} (data);
+                CREATE TABLE IF NOT EXISTS loaded_days (
+                    data DATE PRIMARY KEY,
+                    row_count INTEGER NOT NULL,
+                    fingerprint TEXT NOT NULL
+                );
+            """)
+        self._create_secondary_indexes()
+
+    def _create_secondary_indexes(self) -> None:
+        """Creates the SECONDARY_INDEXES that do not exist (e.g. after a bulk load was interrupted)."""
+        with self.connection:
+            for name, columns in SECONDARY_INDEXES.items():
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {_quote(QUOTES_TABLE)} "
+                                        f"({', '.join(_quote(column) for column in columns)})")
+
+    def _drop_secondary_indexes(self) -> None:
+        """Drops the SECONDARY_INDEXES, which are cheaper to rebuild once than to update row by row."""
+        with self.connection:
+            for name in SECONDARY_INDEXES:
+                self.connection.execute(f"DROP INDEX IF EXISTS {name}")
+
+    @staticmethod
+    def _day_fingerprint(df_day: pd.DataFrame) -> str:
+        """Returns a hash of the rows of a day, independent of their order."""
+        row_hashes = pd.util.hash_pandas_object(df_day, index=False).sort_values().to_numpy()
+        return hashlib.sha256(row_hashes.tobytes()).hexdigest()
+
+    def upsert_day(self, df_day: pd.DataFrame, fingerprint: str = None) -> bool:
+        """
+        Replaces the rows of a single day in one transaction (all or nothing).
+
+        Args:
+            df_day (pd.DataFrame): Rows of one day with the QUOTE_COLUMNS, dates already in ISO format.
+            fingerprint (str): Hash of the rows, if already computed.
+
+        Returns:
+            bool: True if the day was written, False if it was unchanged since its last load.
+        """
+        day = df_day['data'].iloc[0]
+        fingerprint = fingerprint or self._day_fingerprint(df_day)
+        if self._loaded_fingerprints([day]).get(day) == fingerprint:
+            return False
+
+        rows = zip(*[df_day[column].astype(object).where(df_day[column].notna(), None).tolist()
+                     for column in QUOTE_COLUMNS])
+        table = _quote(QUOTES_TABLE)
+        with self.connection:  # Commits on success, rolls back on any error
+            self.connection.execute(f"DELETE FROM {table} WHERE data = ?", (day,))
+            self.connection.executemany(
+                f"INSERT INTO {table} ({', '.join(_quote(column) for column in QUOTE_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(QUOTE_COLUMNS))})", rows)
+            self.connection.execute("INSERT OR REPLACE INTO loaded_days (data, row_count, fingerprint) VALUES (?, ?, ?)",
+                                    (day, len(df_day), fingerprint))
+        return True
+
+    def _loaded_fingerprints(self, days: list) -> dict:
+        """Returns the fingerprint recorded for each of the given days that was already loaded."""
+        placeholders = ', '.join('?' * len(days))
+        query = f"SELECT data, fingerprint FROM loaded_days WHERE data IN ({placeholders})"
+        return dict(self.connection.execute(query, list(days)).fetchall())
+
+    def load(self, df: pd.DataFrame) -> int:
+        """
+        Upserts every day of a cleaned dataset. When at least QUOTES_BULK_LOAD_DAYS days changed (e.g. the first
+        load of a long history), the secondary indexes are dropped during the load and rebuilt once at the end.
+
+        Args:
+            df (pd.DataFrame): Cleaned dataset, with at least the QUOTE_COLUMNS.
+
+        Returns:
+            int: Number of days written (unchanged days are skipped).
+        """
+        df_quotes = df.loc[:, QUOTE_COLUMNS].copy()
+        df_quotes['data'] = to_iso_dates(df_quotes['data'])
+        df_quotes = df_quotes.dropna(subset=['data'])
+
+        days = {day: df_day for day, df_day in df_quotes.groupby('data', sort=True)}
+        fingerprints = {day: self._day_fingerprint(df_day) for day, df_day in days.items()}
+        loaded = self._loaded_fingerprints(list(days)) if days else {}
+        changed = [day for day in days if loaded.get(day) != fingerprints[day]]
+
+        bulk = len(changed) >= QUOTES_BULK_LOAD_DAYS
+        if bulk:
+            self._drop_secondary_indexes()
+        try:
+            for day in changed:
+                self.upsert_day(days[day], fingerprints[day])
+        finally:
+            if bulk:
+                self._create_secondary_indexes()
+
+        print(f"Quotes database updated: {len(changed)} day(s) written, {len(days) - len(changed)} unchanged.")
+        return len(changed)
+
+    def count_on(self, day) -> int:
+        """
+        Returns the number of quotes listed on a day.
+
+        Args:
+            day: The day, as 'YYYYMMDD', 'DD/MM/YYYY', 'YYYY-MM-DD' or datetime.
+        """
+        query = f"SELECT COUNT(*) FROM {_quote(QUOTES_TABLE)} WHERE data = ?"
+        return self.connection.execute(query, (_iso_date(day),)).fetchone()[0]
+
+    def count_per_day(self, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Returns the number of quotes of each day, most recent first.
+
+        Args:
+            start_date: First day (inclusive). Default has no lower bound.
+            end_date: Last day (inclusive). Default has no upper bound.
+
+        Returns:
+            pd.DataFrame: Columns 'data' (datetime) and 'count'.
+        """
+        start = _iso_date(start_date) if start_date is not None else '0000-01-01'
+        end = _iso_date(end_date) if end_date is not None else '9999-12-31'
+        query = (f"SELECT data, row_count AS count FROM loaded_days "
+                 f"WHERE data BETWEEN ? AND ? ORDER BY data DESC")
+        return pd.read_sql_query(query, self.connection, params=(start, end), parse_dates=['data'])
+
+    def average_by_day(self, column: str = 'Taxa Indicativa', days: int = 5) -> pd.DataFrame:
+        """
+        Returns the average of a column on each of the last 'days' days in the database (the last business days,
+        since quotes are only published on business days), most recent first.
+
+        Args:
+            column (str): One of AVERAGE_COLUMNS. Default is 'Taxa Indicativa'.
+            days (int): Number of days. Default is 5.
+
+        Returns:
+            pd.DataFrame: Columns 'data' (datetime) and 'average'.
+        """
+        if column not in AVERAGE_COLUMNS:
+            raise ValueError(f"Column '{column}' cannot be averaged, expected one of {AVERAGE_COLUMNS}.")
+        query = (f"SELECT data, AVG({_quote(column)}) AS average FROM {_quote(QUOTES_TABLE)} "
+                 f"WHERE data IN (SELECT data FROM loaded_days ORDER BY data DESC LIMIT ?) "
+                 f"GROUP BY data ORDER BY data DESC")
+        return pd.read_sql_query(query, self.connection, params=(days,), parse_dates=['data'])
+
+    def codes_by_issuer(self, issuer: str, exact: bool = False) -> list:
+        """
+        Returns the distinct codes of the debentures of an issuer.
+
+        Args:
+            issuer (str): Issuer name, e.g. 'VALE S/A'.
+            exact (bool): Whether to match the whole name (uses the index) instead of any name containing it.
+
+        Returns:
+            list: Sorted distinct codes.
+        """
+        condition = "Nome = ?" if exact else "Nome LIKE '%' || ? || '%'"
+        query = f'SELECT DISTINCT "Código" FROM {_quote(QUOTES_TABLE)} WHERE {condition} ORDER BY "Código"'
+        return [row[0] for row in self.connection.execute(query, (issuer,))]
+
+def load_quotes_database(df: pd.DataFrame, destination_folder: str) -> int:
+    """
+    Opens the quotes database of a folder, upserts the days of a cleaned dataset and closes it again (safe to
+    call from a background thread).
+
+    Args:
+        df (pd.DataFrame): Cleaned dataset.
+        destination_folder (str): Path to the folder where the database (QUOTES_DATABASE_FILE) is stored.
+
+    Returns:
+        int: Number of days written.
+    """
+    with QuoteDatabase(os.path.join(destination_folder, QUOTES_DATABASE_FILE)) as database:
+        return database.load(df)
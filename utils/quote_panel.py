@@ -0,0 +1,305 @@
+import os
+import numpy as np
+import pandas as pd
+from utils.business_calendar import get_calendar
+from utils.csv_utilities import load_manifest, save_manifest
+from utils.dataset_store import load_dataset, select_date_range
+from config import (
+    QUOTE_PANEL_FOLDER, QUOTE_PANEL_INDEX_FILE, PANEL_FIELDS, PANEL_CODE_CAPACITY, CLEANED_DATA_STORE,
+    CLEANED_DATA_FILE, CLEANED_DATA_DTYPES
+)
+
+class QuotePanel:
+    """
+    Dense panel of the cleaned quotes: one float64 array per field (PANEL_FIELDS) with a row per business day and
+    a column per debenture ('Código'), NaN where a debenture was not quoted. Codes and days are mapped to integer
+    positions kept in a JSON index next to the arrays.
+
+    Each array is a raw file memory-mapped from disk in date-major order, so reading a panel copies nothing and
+    ingesting a new day appends a row at the end of each file instead of rebuilding it. Every row reserves room
+    for PANEL_CODE_CAPACITY codes; the files are only rewritten when the codes outgrow it (the capacity doubles)
+    or when a day earlier than the panel is back-filled. A rewrite writes a new generation of files under new
+    names and the index switches to them in one atomic save, so an interrupted run leaves the previous panel
+    whole.
+    """
+
+    def __init__(self, folder: str, fields: list = PANEL_FIELDS, mode: str = 'r'):
+        """
+        Args:
+            folder (str): Folder of the panel (index and arrays).
+            fields (list): Columns of the cleaned dataset kept in the panel. Default is PANEL_FIELDS.
+            mode (str): 'r' to read the arrays, 'r+' to also ingest days. Default is 'r'.
+        """
+        self.folder = folder
+        self.fields = list(fields)
+        self.mode = mode
+        self.codes = []
+        self.days = np.array([], dtype='datetime64[D]')
+        self.loaded_days = set()  # Days ingested, as 'YYYY-MM-DD' (other rows are business days without quotes)
+        self.capacity = PANEL_CODE_CAPACITY
+        self.generation = 0  # Generation of the array files, advanced each time they are rewritten
+        self._arrays = {}
+
+    @staticmethod
+    def open(folder: str, fields: list = PANEL_FIELDS, mode: str = 'r') -> "QuotePanel":
+        """
+        Opens the panel saved in a folder, or returns an empty one if it does not exist, cannot be read or holds
+        other fields. The array files of the generation in the index must hold its days: appended rows are
+        written before the index is saved, so a file may be longer, but a shorter or missing file (damaged or
+        removed by hand) is rebuilt from the full cleaned dataset in 'r+' mode, and read as an empty panel in
+        'r' mode.
+
+        Args:
+            folder (str): Folder of the panel.
+            fields (list): Fields of the panel. Default is PANEL_FIELDS.
+            mode (str): 'r' (read-only memory maps) or 'r+' (to ingest days). Default is 'r'.
+
+        Returns:
+            QuotePanel: The panel.
+        """
+        panel = QuotePanel(folder, fields, mode)
+        index = load_manifest(os.path.join(folder, QUOTE_PANEL_INDEX_FILE))
+        if index.get('fields') != panel.fields:
+            return panel
+
+        panel.generation = index.get('generation', 0)
+        expected_size = len(index['days']) * index['capacity'] * np.dtype('float64').itemsize
+        sizes = [os.path.getsize(panel._path(field)) if os.path.exists(panel._path(field)) else -1
+                 for field in panel.fields]
+        if any(size < expected_size for size in sizes):
+            print(f"Warning: the arrays of the quote panel in {folder} are shorter than its index, "
+                  + ("rebuilding it from the cleaned dataset." if mode == 'r+' else "reading an empty panel."))
+            panel.generation += 1  # The rebuilt arrays never reuse the damaged files
+            if mode == 'r+':
+                panel.rebuild(os.path.dirname(folder))
+            return panel
+
+        panel.codes = index['codes']
+        panel.days = np.array(index['days'], dtype='datetime64[D]')
+        panel.loaded_days = set(index['loaded_days'])
+        panel.capacity = index['capacity']
+        panel._map_arrays()
+        return panel
+
+    def __len__(self) -> int:
+        """Number of business days in the panel."""
+        return len(self.days)
+
+    def _path(self, field: str, generation: int = None) -> str:
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.folder, f"{field}.f8" if not generation else f"{field}-{generation}.f8")
+
+    def _map_arrays(self) -> None:
+        """Memory-maps the array of each field (shape: days x capacity)."""
+        self._arrays = {
+            field: np.memmap(self._path(field), dtype='float64', mode=self.mode, shape=(len(self.days), self.capacity))
+            for field in self.fields
+        } if len(self.days) else {}
+
+    def _save_index(self) -> None:
+        """Saves the index, then removes the array files of other generations (no longer referenced)."""
+        save_manifest({
+            'fields': self.fields, 'capacity': self.capacity, 'codes': self.codes, 'generation': self.generation,
+            'days': [str(day) for day in self.days], 'loaded_days': sorted(self.loaded_days),
+        }, os.path.join(self.folder, QUOTE_PANEL_INDEX_FILE))
+        current = {os.path.basename(self._path(field)) for field in self.fields}
+        for file_name in os.listdir(self.folder):
+            if file_name.endswith(('.f8', '.f8.tmp')) and file_name not in current:
+                os.remove(os.path.join(self.folder, file_name))
+
+    def _resize(self, days: np.ndarray, capacity: int) -> None:
+        """
+        Gives the arrays the rows of 'days' and 'capacity' columns. New days after the last one are appended to
+        the files in place (the index still maps the rows it had); a larger capacity or days inserted before
+        existing ones write the next generation of files, and the index is saved to switch to them.
+        """
+        old_days, old_capacity = self.days, self.capacity
+        appended = capacity == old_capacity and np.array_equal(days[:len(old_days)], old_days)
+        if appended and len(days) == len(old_days):
+            return
+
+        self._arrays = {}  # Release the current memory maps before the files change
+        row_bytes = capacity * np.dtype('float64').itemsize
+        generation = self.generation if appended else self.generation + 1
+        for field in self.fields:
+            path = self._path(field)
+            if appended:
+                mode = 'r+b' if os.path.exists(path) else 'w+b'
+                with open(path, mode) as file:
+                    file.truncate(len(days) * row_bytes)
+                array = np.memmap(path, dtype='float64', mode='r+', shape=(len(days), capacity))
+                array[len(old_days):] = np.nan
+                array.flush()
+                del array
+            else:
+                array = np.memmap(self._path(field, generation), dtype='float64', mode='w+',
+                                  shape=(len(days), capacity))
+                array[:] = np.nan
+                if len(old_days):
+                    old = np.memmap(path, dtype='float64', mode='r', shape=(len(old_days), old_capacity))
+                    array[np.searchsorted(days, old_days), :old_capacity] = old
+                    del old
+                array.flush()
+                del array
+        self.days, self.capacity, self.generation = days, capacity, generation
+        if not appended:
+            self._save_index()
+        self._map_arrays()
+
+    def rebuild(self, destination_folder: str) -> int:
+        """
+        Ingests the full cleaned dataset of a folder into an empty panel (opened with mode='r+').
+
+        Args:
+            destination_folder (str): Path to the folder where the cleaned dataset is stored.
+
+        Returns:
+            int: Number of days ingested (0 if the cleaned dataset could not be loaded).
+        """
+        df = load_dataset(destination_folder, CLEANED_DATA_STORE, CLEANED_DATA_FILE,
+                          columns=['data', 'Código'] + self.fields, dtype=CLEANED_DATA_DTYPES)
+        return self.update(df) if df is not None else 0
+
+    def update(self, df: pd.DataFrame, keep_days: set = None) -> int:
+        """
+        Ingests the days of a cleaned dataset: the rows of those days are replaced by their quotes, and new codes
+        get the next free columns.
+
+        Args:
+            df (pd.DataFrame): Cleaned dataset, with 'data' (datetime), 'Código' and the fields of the panel.
+            keep_days (set): Days ('YYYY-MM-DD') whose current quotes are kept and only completed with those of
+                             'df', e.g. a day split across the chunks of a streaming run. Default replaces all.
+
+        Returns:
+            int: Number of days ingested.
+        """
+        if self.mode != 'r+':
+            raise ValueError("The quote panel was opened read-only, open it with mode='r+' to ingest days.")
+        if df.empty:
+            return 0
+        os.makedirs(self.folder, exist_ok=True)
+
+        # Positions of the codes, computed once per distinct code
+        codes = df['Código'].astype('category')
+        positions = pd.Index(self.codes).get_indexer(codes.cat.categories.astype(str))
+        new_codes = codes.cat.categories[positions < 0].astype(str).tolist()
+        positions[positions < 0] = np.arange(len(self.codes), len(self.codes) + len(new_codes))
+        self.codes = self.codes + new_codes
+        columns = np.append(positions, -1)[codes.cat.codes.to_numpy()]
+
+        # Every business day between the first and the last day is a row, so row steps are business-day steps
+        row_days = df['data'].to_numpy().astype('datetime64[D]')
+        new_days = np.unique(row_days)
+        days = np.union1d(self.days, new_days)
+        calendar_days = get_calendar().business_days_between(days[0].item(), days[-1].item())
+        days = np.union1d(days, np.array(calendar_days, dtype='datetime64[D]'))
+        capacity = self.capacity
+        while capacity < len(self.codes):
+            capacity *= 2
+        self._resize(days, capacity)
+
+        rows = np.searchsorted(self.days, row_days)
+        keep_days = keep_days or set()
+        cleared = np.searchsorted(self.days, [day for day in new_days if str(day) not in keep_days])
+        valid = columns >= 0
+        for field in self.fields:
+            array = self._arrays[field]
+            array[cleared] = np.nan
+            array[rows[valid], columns[valid]] = df[field].to_numpy(dtype='float64', na_value=np.nan)[valid]
+            array.flush()
+
+        self.loaded_days.update(str(day) for day in new_days)
+        self._save_index()
+        return len(new_days)
+
+    def _rows(self, start_date=None, end_date=None) -> slice:
+        """Returns the slice of rows between two dates (both inclusive)."""
+        if start_date is None and end_date is None:
+            return slice(0, len(self.days))
+        positions = select_date_range(pd.DataFrame({'data': self.days.astype('datetime64[ns]'),
+                                                    'row': np.arange(len(self.days))}), start_date, end_date)['row']
+        return slice(positions.iloc[0], positions.iloc[-1] + 1) if len(positions) else slice(0, 0)
+
+    def array(self, field: str, start_date=None, end_date=None) -> np.ndarray:
+        """
+        Returns the panel of a field as a view of its memory map (no copy): days x codes, in the order of
+        'days' and 'codes'.
+
+        Args:
+            field (str): One of the fields of the panel.
+            start_date: First day ('YYYYMMDD', 'DD/MM/YYYY' or datetime), inclusive. Default is unbounded.
+            end_date: Last day, inclusive. Default is unbounded.
+
+        Returns:
+            np.ndarray: Float64 array, NaN where a debenture was not quoted.
+        """
+        if field not in self.fields:
+            raise ValueError(f"Unknown panel field '{field}', expected one of {self.fields}.")
+        if not len(self.days):
+            return np.empty((0, 0))
+        return self._arrays[field][self._rows(start_date, end_date), :len(self.codes)]
+
+    def frame(self, field: str, start_date=None, end_date=None, values: np.ndarray = None) -> pd.DataFrame:
+        """
+        Returns the panel of a field (or 'values' of the same shape) as a DataFrame indexed by day, with a
+        column per code, wrapping the array without copying it.
+        """
+        rows = self._rows(start_date, end_date)
+        values = self.array(field, start_date, end_date) if values is None else values
+        return pd.DataFrame(values, index=pd.DatetimeIndex(self.days[rows], name='data'),
+                            columns=pd.Index(self.codes, name='Código'), copy=False)
+
+    def change(self, field: str, periods: int = 1, relative: bool = False, start_date=None,
+               end_date=None) -> pd.DataFrame:
+        """
+        Returns the change of a field over 'periods' business days for every code at once: the difference
+        (e.g. of 'Taxa Indicativa', in percentage points) or, when relative, the return (e.g. of 'PU').
+
+        Returns:
+            pd.DataFrame: Days x codes, NaN for the first 'periods' days and where either quote is missing.
+        """
+        values = self.array(field, start_date, end_date)
+        result = np.full(values.shape, np.nan)
+        if len(values) > periods:
+            current, previous = values[periods:], values[:-periods]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result[periods:] = current / previous - 1 if relative else current - previous
+        return self.frame(field, start_date, end_date, values=result)
+
+    def rolling_mean(self, field: str, window: int, min_periods: int = 1, start_date=None,
+                     end_date=None) -> pd.DataFrame:
+        """
+        Returns the mean of a field over the last 'window' business days for every code at once, from cumulative
+        sums of the values and of the quoted days (missing quotes are skipped).
+
+        Returns:
+            pd.DataFrame: Days x codes, NaN where fewer than 'min_periods' quotes fall in the window.
+        """
+        values = self.array(field, start_date, end_date)
+        quoted = ~np.isnan(values)
+        sums = np.cumsum(np.where(quoted, values, 0.0), axis=0)
+        counts = np.cumsum(quoted, axis=0)
+        sums[window:] -= sums[:-window].copy()
+        counts[window:] -= counts[:-window].copy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = np.where(counts >= max(1, min_periods), sums / counts, np.nan)
+        return self.frame(field, start_date, end_date, values=result)
+
+def update_quote_panel(df: pd.DataFrame, destination_folder: str, keep_days: set = None) -> QuotePanel:
+    """
+    Ingests the days of a cleaned dataset into the quote panel of a folder (QUOTE_PANEL_FOLDER), appending the
+    new days and replacing the days it already held.
+
+    Args:
+        df (pd.DataFrame): Cleaned dataset.
+        destination_folder (str): Path to the folder where the panel is stored.
+        keep_days (set): Days ('YYYY-MM-DD') completed instead of replaced. Default replaces every day of 'df'.
+
+    Returns:
+        QuotePanel: The updated panel.
+    """
+    panel = QuotePanel.open(os.path.join(destination_folder, QUOTE_PANEL_FOLDER), mode='r+')
+    days = panel.update(df, keep_days)
+    print(f"Quote panel updated for {days} day(s): {len(panel)} day(s) x {len(panel.codes)} code(s) in "
+          f"{panel.folder}")
+    return panel
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+from config import (
+    QUOTE_FLAGS, SCREEN_STALE_DAYS, SCREEN_JUMP_WINDOW, SCREEN_JUMP_MIN_PERIODS, SCREEN_JUMP_STDS,
+    SCREEN_JUMP_MIN_CHANGE, SCREEN_RATE_TOLERANCE
+)
+from utils.business_calendar import get_calendar
+
+def _windowed_sums(values: np.ndarray, valid: np.ndarray, first: np.ndarray, window: int) -> tuple:
+    """
+    Returns the count, sum and sum of squares of the valid values among the 'window' rows before each row,
+    without crossing the first row of its group ('first' holds the position of that row), from prefix sums.
+    """
+    position = np.arange(len(values))
+    start = np.maximum(position - window, first)
+    weights = np.where(valid, values, 0.0)
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    sums = np.concatenate(([0.0], np.cumsum(weights)))
+    squares = np.concatenate(([0.0], np.cumsum(weights * weights)))
+    return counts[position] - counts[start], sums[position] - sums[start], squares[position] - squares[start]
+
+def screen_quotes(df: pd.DataFrame, history: pd.DataFrame = None, stale_days: int = SCREEN_STALE_DAYS,
+                  jump_window: int = SCREEN_JUMP_WINDOW, jump_stds: float = SCREEN_JUMP_STDS) -> pd.Series:
+    """
+    Screens every quote of a dataset in one vectorized pass and returns a bitmask of QUOTE_FLAGS:
+
+    - 'stale': the 'Taxa Indicativa' of the code did not change over its last 'stale_days' business days.
+    - 'out_of_interval': the rate is outside ['Intervalo Indicativo Min.', 'Intervalo Indicativo Máx.'].
+    - 'outside_bid_ask': the rate is outside the range of 'Taxa de Compra' and 'Taxa de Venda'.
+    - 'jump': the change of the rate since the previous quote of the code is more than 'jump_stds' standard
+      deviations (and at least SCREEN_JUMP_MIN_CHANGE) away from the mean of its previous 'jump_window' changes.
+
+    The quotes are ordered by code and date once, and the per-code statistics come from prefix sums over that
+    order, so the cost does not depend on the number of codes. The rates must not be rounded yet, since rounding
+    would hide small changes. Missing bounds or too short histories raise no flag.
+
+    The stale and jump rules look back over the earlier quotes of each code: when 'df' holds only the last days
+    (a pipeline window or a streaming chunk), pass the earlier quotes as 'history' (see load_screening_history).
+    Its rows only extend the series and get no flags.
+
+    Args:
+        df (pd.DataFrame): Quotes, with 'Código', 'data', 'Taxa Indicativa' and the interval and buy/sell rate
+                           columns (the rows of several days, in any order).
+        history (pd.DataFrame, optional): Earlier quotes with 'Código', 'data' and 'Taxa Indicativa', none of them
+                                          repeated in 'df'. Default is None (no history).
+        stale_days (int): Business days without change that make a rate stale. Default is SCREEN_STALE_DAYS.
+        jump_window (int): Previous changes of each code used for the jump statistics. Default is SCREEN_JUMP_WINDOW.
+        jump_stds (float): Standard deviations from the mean change that make a jump. Default is SCREEN_JUMP_STDS.
+
+    Returns:
+        pd.Series: uint8 flags of each row (0 when the quote raises no flag), aligned with 'df'.
+    """
+    flags = np.zeros(len(df), dtype='uint8')
+    if df.empty:
+        return pd.Series(flags, index=df.index)
+
+    rate = df['Taxa Indicativa'].to_numpy(dtype='float64', na_value=np.nan)
+    tolerance = SCREEN_RATE_TOLERANCE
+    with np.errstate(invalid='ignore'):
+        low = df['Intervalo Indicativo Min.'].to_numpy(dtype='float64', na_value=np.nan)
+        high = df['Intervalo Indicativo Máx.'].to_numpy(dtype='float64', na_value=np.nan)
+        flags[(rate < low - tolerance) | (rate > high + tolerance)] |= QUOTE_FLAGS['out_of_interval']
+
+        buy = df['Taxa de Compra'].to_numpy(dtype='float64', na_value=np.nan)
+        sell = df['Taxa de Venda'].to_numpy(dtype='float64', na_value=np.nan)
+        outside = (rate < np.minimum(buy, sell) - tolerance) | (rate > np.maximum(buy, sell) + tolerance)
+        flags[outside] |= QUOTE_FLAGS['outside_bid_ask']
+
+    # Append the history behind the quotes, with codes numbered over both
+    dates = df['data'].to_numpy(dtype='datetime64[ns]')
+    if history is not None and not history.empty:
+        categories = pd.Index(df['Código'].astype(str).unique()).union(history['Código'].astype(str).unique())
+        codes = np.concatenate((
+            pd.Categorical(df['Código'].astype(str), categories=categories).codes,
+            pd.Categorical(history['Código'].astype(str), categories=categories).codes
+        ))
+        dates = np.concatenate((dates, history['data'].to_numpy(dtype='datetime64[ns]')))
+        rate = np.concatenate((rate, history['Taxa Indicativa'].to_numpy(dtype='float64', na_value=np.nan)))
+    else:
+        codes = df['Código'].astype('category').cat.codes.to_numpy()
+
+    # Order the quotes by code and date, the rows of each code then being its time series
+    order = np.lexsort((dates, codes))
+    sorted_codes, sorted_rate = codes[order], rate[order]
+    new_code = np.empty(len(order), dtype=bool)
+    new_code[0] = True
+    new_code[1:] = sorted_codes[1:] != sorted_codes[:-1]
+    first = np.maximum.accumulate(np.where(new_code, np.arange(len(order)), 0))
+
+    # Stale: business days covered by the current run of equal rates within the code
+    changed = new_code.copy()
+    changed[1:] |= sorted_rate[1:] != sorted_rate[:-1]
+    run_start = np.maximum.accumulate(np.where(changed, np.arange(len(order)), 0))
+    day_number = get_calendar().business_day_numbers(dates[order])
+    stale = (day_number - day_number[run_start] + 1 >= stale_days) & ~np.isnan(sorted_rate)
+
+    # Jump: change against the mean and standard deviation of the previous changes of the code
+    change = np.full(len(order), np.nan)
+    change[1:] = sorted_rate[1:] - sorted_rate[:-1]
+    change[new_code] = np.nan
+    valid = ~np.isnan(change)
+    count, total, squares = _windowed_sums(change, valid, first, jump_window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        std = np.sqrt(np.maximum(squares - total * mean, 0.0) / (count - 1))
+        threshold = np.maximum(jump_stds * std, SCREEN_JUMP_MIN_CHANGE)
+        # The margin keeps a change exactly on the threshold from flipping on floating point noise
+        jump = valid & (count >= max(2, SCREEN_JUMP_MIN_PERIODS)) & (np.abs(change - mean) > threshold + 1e-9)
+
+    sorted_flags = np.where(stale, QUOTE_FLAGS['stale'], 0) | np.where(jump, QUOTE_FLAGS['jump'], 0)
+    # Keep the flags of the rows of 'df', which come before the history
+    own = order < len(df)
+    flags[order[own]] |= sorted_flags[own].astype('uint8')
+    return pd.Series(flags, index=df.index)
+
+def has_flags(flags: pd.Series, *names: str) -> pd.Series:
+    """
+    Returns a boolean mask of the rows raising any of the named flags (any flag when no name is given).
+
+    Args:
+        flags (pd.Series): Bitmask column returned by screen_quotes.
+        names (str): Keys of QUOTE_FLAGS.
+
+    Returns:
+        pd.Series: True for the flagged rows.
+    """
+    unknown = [name for name in names if name not in QUOTE_FLAGS]
+    if unknown:
+        raise ValueError(f"Unknown quote flags {unknown}, expected some of {list(QUOTE_FLAGS)}.")
+    mask = sum(QUOTE_FLAGS[name] for name in names) if names else sum(QUOTE_FLAGS.values())
+    return (flags & mask) != 0
+
+def flag_counts(flags: pd.Series) -> dict:
+    """Returns the number of rows raising each flag."""
+    values = np.asarray(flags)
+    return {name: int(np.count_nonzero(values & bit)) for name, bit in QUOTE_FLAGS.items()}
@@ -0,0 +1,430 @@
+import os
+import gzip
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+from utils.csv_utilities import load_manifest, save_manifest
+from utils.instrumentation import stage
+from config import (
+    SNAPSHOT_FOLDER, SNAPSHOT_INDEX_FILE, SNAPSHOT_BASE_EVERY, SNAPSHOT_KEY_COLUMN, SNAPSHOT_MAX_DECIMALS
+)
+
+def frame_digest(df: pd.DataFrame) -> str:
+    """Returns a SHA-256 of the columns, dtypes and values of a DataFrame (NaN-aware, ignoring the index)."""
+    digest = hashlib.sha256()
+    digest.update(repr([(str(column), str(dtype)) for column, dtype in df.dtypes.items()]).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def _scaled(values: np.ndarray, scale: float) -> np.ndarray:
+    return np.round(np.nan_to_num(values, nan=0.0, posinf=0.0, neginf=0.0) * scale)
+
+def _same_values(a: np.ndarray, b: np.ndarray) -> bool:
+    """Returns True if two arrays hold the same values, NaN and the sign of zero included."""
+    if a.dtype.kind != 'f' or b.dtype.kind != 'f':
+        return pd.Series(a).equals(pd.Series(b))
+    return bool(np.all(((a == b) & (np.signbit(a) == np.signbit(b))) | (np.isnan(a) & np.isnan(b))))
+
+def _encode_values(old: np.ndarray, new: np.ndarray) -> dict:
+    """
+    Encodes the new values of the changed cells of a column. Floats with few decimals (rates, prices) are stored as
+    integer steps from the previous values in units of their last decimal, which compress far better than the
+    floats themselves; other columns, or floats that do not decode back exactly, keep their values.
+    """
+    if new.dtype == 'float64' and old.dtype == 'float64':
+        missing = np.isnan(new)
+        for decimals in range(SNAPSHOT_MAX_DECIMALS + 1):
+            scale = 10.0 ** decimals
+            steps = _scaled(new, scale) - _scaled(old, scale)
+            if np.abs(steps).max(initial=0) >= 2 ** 53:
+                break
+            encoded = {'decimals': decimals, 'missing': np.packbits(missing),
+                       'steps': steps.astype(np.min_scalar_type(-int(np.abs(steps).max(initial=0)) - 1))}
+            if _same_values(_decode_values(old, encoded), new):
+                return encoded
+    return {'values': new}
+
+def _decode_values(old: np.ndarray, encoded: dict) -> np.ndarray:
+    """Returns the new values of the changed cells of a column from their previous values and _encode_values."""
+    if 'values' in encoded:
+        return encoded['values']
+    scale = 10.0 ** encoded['decimals']
+    values = (_scaled(old.astype('float64'), scale) + encoded['steps']) / scale
+    values[np.unpackbits(encoded['missing'], count=len(values)).astype(bool)] = np.nan
+    return values
+
+def diff_frames(previous: pd.DataFrame, current: pd.DataFrame, key: str = SNAPSHOT_KEY_COLUMN) -> dict:
+    """
+    Computes the delta turning the sheet of a day into the sheet of the next day, keyed by 'key':
+
+    - 'added': the rows of the codes that are new on the day.
+    - 'removed': the codes that are no longer in the sheet.
+    - 'changed': the codes with a changed cell ('codes') and, for each column with changes ('columns'), a bit mask
+      of the codes whose cell changed and their new values (see _encode_values).
+    - 'order': the codes in the order of the day, or None when it is the order of the previous day without the
+      removed codes, followed by the added rows.
+
+    Args:
+        previous (pd.DataFrame): Sheet of the previous day.
+        current (pd.DataFrame): Sheet of the day.
+        key (str): Column identifying a row. Default is SNAPSHOT_KEY_COLUMN.
+
+    Returns:
+        dict: The delta, or None when the sheets cannot be diffed (other columns or dtypes, or missing or
+              duplicate keys).
+    """
+    if list(previous.columns) != list(current.columns) or not previous.dtypes.equals(current.dtypes) or \
+            key not in current.columns:
+        return None
+    old_keys, new_keys = pd.Index(previous[key]), pd.Index(current[key])
+    if not (old_keys.is_unique and new_keys.is_unique) or old_keys.hasnans or new_keys.hasnans:
+        return None
+
+    added = ~new_keys.isin(old_keys)
+    removed = old_keys[~old_keys.isin(new_keys)]
+    common = np.flatnonzero(~added)  # Positions in 'current' of the codes also in 'previous'
+    common_old = old_keys.get_indexer(new_keys[common])
+
+    differs = {}
+    for column in current.columns.drop(key):
+        old = previous[column].iloc[common_old].reset_index(drop=True)
+        new = current[column].iloc[common].reset_index(drop=True)
+        equal = (old == new).to_numpy(dtype=bool, na_value=False) | (old.isna() & new.isna()).to_numpy()
+        if not equal.all():
+            differs[column] = ~equal
+    rows = np.logical_or.reduce(list(differs.values())) if differs else np.zeros(len(common), dtype=bool)
+    columns = {}
+    for column, mask in differs.items():
+        cells = mask[rows]
+        columns[column] = {'mask': np.packbits(cells), **_encode_values(
+            previous[column].to_numpy()[common_old[rows][cells]], current[column].to_numpy()[common[rows][cells]])}
+
+    default_order = old_keys[old_keys.isin(new_keys)].append(new_keys[added])
+    return {
+        'added': current[added].reset_index(drop=True),
+        'removed': removed.tolist(),
+        'changed': {'codes': new_keys[common[rows]].tolist(), 'columns': columns},
+        'order': None if default_order.equals(new_keys) else new_keys.tolist(),
+    }
+
+def changed_cells(delta: dict) -> dict:
+    """Returns the changed columns of each code of a delta: code -> list of column names."""
+    codes = delta['changed']['codes']
+    cells = {}
+    for column, encoded in delta['changed']['columns'].items():
+        for code in np.asarray(codes, dtype=object)[np.unpackbits(encoded['mask'], count=len(codes)).astype(bool)]:
+            cells.setdefault(code, []).append(column)
+    return cells
+
+def apply_delta(previous: pd.DataFrame, delta: dict, key: str = SNAPSHOT_KEY_COLUMN) -> pd.DataFrame:
+    """Rebuilds the sheet of a day from the sheet of the previous day and the delta returned by diff_frames."""
+    state = previous.set_index(pd.Index(previous[key]))
+    if delta['removed']:
+        state = state.drop(index=delta['removed'])
+    positions = state.index.get_indexer(delta['changed']['codes'])
+    for column, encoded in delta['changed']['columns'].items():
+        rows = positions[np.unpackbits(encoded['mask'], count=len(positions)).astype(bool)]
+        array = state[column].to_numpy(copy=True)
+        array[rows] = _decode_values(array[rows], encoded)
+        state[column] = pd.Series(array, index=state.index, dtype=state[column].dtype)
+    if len(delta['added']):
+        added = delta['added']
+        state = pd.concat([state, added.set_axis(pd.Index(added[key]))])
+    if delta['order'] is not None:
+        state = state.reindex(delta['order'])
+    return state.reset_index(drop=True)
+
+class SnapshotStore:
+    """
+    Point-in-time store of the parsed sheets of each business day. For each sheet, a full base snapshot is kept
+    every 'base_every' stored days, and every other day only holds its delta from the previous stored day, keyed by
+    SNAPSHOT_KEY_COLUMN: the added rows, the removed codes and the cells that changed. Most debentures keep their
+    name, dates and index from one day to the next, so a day costs a fraction of its CSV.
+
+    When SNAPSHOT_STORE_ENABLED is set the store is the source of record of the sheets: no per-sheet CSV is
+    written, and the combine and back-fill steps read the days through sheet() (index_source_files lists the
+    stored sheets). Per-sheet CSVs are only an export ('cli.py snapshot --as-of DAY --export FOLDER').
+
+    as_of() rebuilds a day exactly (same columns, dtypes, values and row order as the sheets that were added): a
+    delta is only kept if applying it gives back the sheet, otherwise the day is stored as a base. Rebuilding reads
+    the last base before the day and at most about 'base_every' deltas, starting from the last day rebuilt when it
+    lies on the way.
+
+    Each file is written under a new name (day, parent and a digest of their contents) before the JSON index points
+    to it, so an interrupted update leaves the previous days readable.
+    """
+
+    def __init__(self, folder: str, base_every: int = SNAPSHOT_BASE_EVERY, key: str = SNAPSHOT_KEY_COLUMN):
+        """
+        Args:
+            folder (str): Folder of the store (index and snapshot files).
+            base_every (int): Stored days of a sheet between two full bases. Default is SNAPSHOT_BASE_EVERY.
+            key (str): Column identifying a row of a sheet. Default is SNAPSHOT_KEY_COLUMN.
+        """
+        self.folder = folder
+        self.base_every = max(1, base_every)
+        self.key = key
+        self.index_path = os.path.join(folder, SNAPSHOT_INDEX_FILE)
+        # Sheet -> day ('yyyymmdd') -> {'file', 'kind' ('base' or 'delta'), 'parent', 'digest', 'rows'}
+        self.sheets = load_manifest(self.index_path).get('sheets', {})
+        self._cache = {}  # Sheet -> (day, DataFrame) of the last day rebuilt
+
+    def days(self, sheet_name: str = None) -> list:
+        """Returns the days stored (for one sheet, or for any sheet), in ascending order."""
+        sheets = [sheet_name] if sheet_name is not None else list(self.sheets)
+        return sorted({day for name in sheets for day in self.sheets.get(name, {})})
+
+    def sheet_names(self, date_str: str) -> list:
+        """Returns the sheets stored on a day (not on an earlier one), in name order."""
+        return sorted(name for name, entries in self.sheets.items() if date_str in entries)
+
+    def _read(self, sheet_name: str, day: str):
+        with gzip.open(os.path.join(self.folder, sheet_name, self.sheets[sheet_name][day]['file']), 'rb') as file:
+            return pickle.load(file)
+
+    def _write(self, sheet_name: str, day: str, kind: str, parent: str, content, df: pd.DataFrame) -> dict:
+        """Writes a snapshot file under a new name and returns its index entry (the index is saved by the caller)."""
+        digest = frame_digest(df)
+        # The name changes with the content of the parent too, so a re-encoded delta never replaces the file in use
+        parent_digest = self.sheets[sheet_name][parent]['digest'] if parent is not None else ''
+        name_digest = hashlib.sha256((digest + parent_digest).encode("utf-8")).hexdigest()
+        file_name = f"{day}-{parent or kind}-{name_digest[:16]}.pkl.gz"
+        file_path = os.path.join(self.folder, sheet_name, file_name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        temp_path = f"{file_path}.tmp"
+        with gzip.open(temp_path, 'wb', compresslevel=6) as file:
+            pickle.dump(content, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, file_path)
+        return {'file': file_name, 'kind': kind, 'parent': parent, 'digest': digest, 'rows': len(df)}
+
+    def _depth(self, sheet_name: str, day: str) -> int:
+        """Returns the number of deltas applied to the last base to rebuild a stored day."""
+        entries, depth = self.sheets[sheet_name], 0
+        while entries[day]['kind'] == 'delta':
+            depth, day = depth + 1, entries[day]['parent']
+        return depth
+
+    def _encode(self, sheet_name: str, day: str, df: pd.DataFrame, parent: str) -> dict:
+        """Writes a day as a delta from 'parent' when it is due no base and the delta rebuilds it exactly."""
+        if parent is not None:
+            if self._depth(sheet_name, parent) + 1 < self.base_every:
+                previous = self._load(sheet_name, parent)
+                delta = diff_frames(previous, df, self.key)
+                if delta is not None and apply_delta(previous, delta, self.key).equals(df):
+                    return self._write(sheet_name, day, 'delta', parent, delta, df)
+        return self._write(sheet_name, day, 'base', None, df, df)
+
+    def _load(self, sheet_name: str, day: str) -> pd.DataFrame:
+        """Rebuilds the sheet of a stored day from its base and the deltas after it (the result is cached)."""
+        entries = self.sheets[sheet_name]
+        cached_day, cached = self._cache.get(sheet_name, (None, None))
+        chain = [day]
+        while entries[chain[-1]]['kind'] == 'delta' and chain[-1] != cached_day:
+            chain.append(entries[chain[-1]]['parent'])
+
+        if chain[-1] == cached_day:
+            df = cached
+        else:
+            df = self._read(sheet_name, chain[-1])
+        for step in reversed(chain[:-1]):
+            df = apply_delta(df, self._read(sheet_name, step), self.key)
+        self._cache[sheet_name] = (day, df)
+        return df
+
+    def add_day(self, date_str: str, sheets_dict: dict) -> dict:
+        """
+        Stores the sheets of a business day. A sheet identical to the one stored is left untouched; a day added
+        before stored days (a back-fill, or a republished day) re-encodes the next stored day from it.
+
+        Args:
+            date_str (str): Business day in the format 'yyyymmdd'.
+            sheets_dict (dict): Sheet name -> processed DataFrame (empty sheets are skipped).
+
+        Returns:
+            dict: Number of sheets stored as 'base', as 'delta', and 'unchanged'.
+        """
+        counts = {'base': 0, 'delta': 0, 'unchanged': 0}
+        obsolete = []
+        for sheet_name, df in sheets_dict.items():
+            if df.empty:
+                continue
+            entries = self.sheets.setdefault(sheet_name, {})
+            if day_entry := entries.get(date_str):
+                if day_entry['digest'] == frame_digest(df):
+                    counts['unchanged'] += 1
+                    continue
+                obsolete.append((sheet_name, day_entry['file']))
+
+            days = sorted(entries)
+            earlier = [day for day in days if day < date_str]
+            later = [day for day in days if day > date_str]
+            following = self._load(sheet_name, later[0]) if later else None
+
+            entries[date_str] = self._encode(sheet_name, date_str, df, earlier[-1] if earlier else None)
+            self._cache[sheet_name] = (date_str, df.copy())
+            counts[entries[date_str]['kind']] += 1
+            # The next day is re-encoded from the new one, which lengthens the chains of deltas after it: the
+            # first day whose chain got too deep becomes a base
+            for position, day in enumerate(later):
+                if position:
+                    if entries[day]['kind'] == 'base':
+                        break
+                    if self._depth(sheet_name, day) < self.base_every:
+                        continue
+                content = following if not position else self._load(sheet_name, day)
+                obsolete.append((sheet_name, entries[day]['file']))
+                entries[day] = self._encode(sheet_name, day, content, later[position - 1] if position else date_str)
+                self._cache[sheet_name] = (day, content)
+
+        if counts['base'] or counts['delta']:
+            os.makedirs(self.folder, exist_ok=True)
+            save_manifest({'key': self.key, 'sheets': self.sheets}, self.index_path)
+            for sheet_name, file_name in obsolete:
+                if all(entry['file'] != file_name for entry in self.sheets[sheet_name].values()):
+                    os.remove(os.path.join(self.folder, sheet_name, file_name))
+        return counts
+
+    def sheet(self, date_str: str, sheet_name: str) -> pd.DataFrame:
+        """
+        Returns a sheet stored on a day exactly as it was added (reading the days of a sheet in date order only
+        applies one delta per day).
+
+        Args:
+            date_str (str): Day in the format 'yyyymmdd'.
+            sheet_name (str): Name of the sheet.
+
+        Returns:
+            pd.DataFrame: The sheet, or None if it was not stored on that day.
+        """
+        if date_str not in self.sheets.get(sheet_name, {}):
+            return None
+        return self._load(sheet_name, date_str).copy()
+
+    def verify(self, start_date: str = None, end_date: str = None) -> list:
+        """
+        Rebuilds every stored day of every sheet and compares it with the digest recorded when it was added
+        (frame_digest covers the columns, dtypes, values and row order), which checks the exact-rebuild contract
+        of as_of() on the data on disk.
+
+        Args:
+            start_date (str): First day to check, 'yyyymmdd'. Default is the first day stored.
+            end_date (str): Last day to check, 'yyyymmdd'. Default is the last day stored.
+
+        Returns:
+            list: (day, sheet name) of the days whose rebuild differs from what was added (empty when all match).
+        """
+        mismatches = []
+        with stage("snapshot_verify") as metrics:
+            for sheet_name, entries in self.sheets.items():
+                for day in sorted(entries):
+                    if (start_date is None or day >= start_date) and (end_date is None or day <= end_date):
+                        df = self._load(sheet_name, day)
+                        metrics.count(rows_in=len(df))
+                        if frame_digest(df) != entries[day]['digest'] or len(df) != entries[day]['rows']:
+                            mismatches.append((day, sheet_name))
+        return sorted(mismatches)
+
+    def as_of(self, date_str: str, sheet_names: list = None) -> dict:
+        """
+        Returns the sheets as they were published on a day: those of the last stored day on or before it.
+
+        Args:
+            date_str (str): Day in the format 'yyyymmdd'.
+            sheet_names (list): Sheets to rebuild. Default is every sheet of that day.
+
+        Returns:
+            dict: Sheet name -> DataFrame, as added (empty if no day was stored on or before 'date_str').
+        """
+        stored = [day for day in self.days() if day <= date_str]
+        if not stored:
+            return {}
+        day = stored[-1]
+        sheets = {}
+        with stage("snapshot_as_of", day=day) as metrics:
+            for sheet_name in sheet_names or self.sheets:
+                if day in self.sheets.get(sheet_name, {}):
+                    sheets[sheet_name] = self._load(sheet_name, day).copy()
+            metrics.count(rows_out=sum(len(df) for df in sheets.values()))
+        return sheets
+
+    def changes(self, start_date: str, end_date: str, sheet_names: list = None) -> pd.DataFrame:
+        """
+        Lists what changed in the sheets on each stored day between two days (both inclusive), from the
+        previous stored day: one row per added, removed or changed code.
+
+        Args:
+            start_date (str): First day, 'yyyymmdd'.
+            end_date (str): Last day, 'yyyymmdd'.
+            sheet_names (list): Sheets to compare. Default is every sheet.
+
+        Returns:
+            pd.DataFrame: 'data', 'sheet_name', 'change' ('added', 'removed' or 'changed') and 'columns' (the
+                          changed columns, comma-separated), followed by the row of the code on that day (on the
+                          previous day for removed codes).
+        """
+        events = []
+        for sheet_name in sheet_names or self.sheets:
+            days = self.days(sheet_name)
+            for position, day in enumerate(days):
+                if not start_date <= day <= end_date:
+                    continue
+                previous = self._load(sheet_name, days[position - 1]) if position else None
+                current = self._load(sheet_name, day)
+                if self.sheets[sheet_name][day]['kind'] == 'delta':
+                    delta = self._read(sheet_name, day)
+                else:
+                    delta = diff_frames(previous, current, self.key) if previous is not None else None
+                if delta is None:
+                    # First day of the sheet, or the columns changed: every row is replaced
+                    delta = {'added': current, 'removed': [] if previous is None else previous[self.key].tolist(),
+                             'changed': {'codes': [], 'columns': {}}}
+                changed_columns = changed_cells(delta)
+
+                parts = [delta['added'].assign(change='added', columns='')]
+                if delta['removed']:
+                    parts.append(previous[previous[self.key].isin(delta['removed'])].assign(change='removed',
+                                                                                           columns=''))
+                if changed_columns:
+                    rows = current[current[self.key].isin(changed_columns)]
+                    parts.append(rows.assign(change='changed',
+                                             columns=[", ".join(changed_columns[code]) for code in rows[self.key]]))
+                for part in parts:
+                    if len(part):
+                        events.append(part.assign(data=day, sheet_name=sheet_name))
+
+        if not events:
+            return pd.DataFrame(columns=['data', 'sheet_name', 'change', 'columns'])
+        result = pd.concat(events, ignore_index=True)
+        leading = ['data', 'sheet_name', 'change', 'columns']
+        result = result[leading + [column for column in result.columns if column not in leading]]
+        result['data'] = pd.to_datetime(result['data'], format="%Y%m%d")
+        return result
+
+    def size(self) -> int:
+        """Returns the bytes of the snapshot files on disk."""
+        return sum(os.path.getsize(os.path.join(self.folder, sheet_name, entry['file']))
+                   for sheet_name, entries in self.sheets.items() for entry in entries.values())
+
+def update_snapshot_store(source_folder: str, sheets_by_day: dict) -> SnapshotStore:
+    """
+    Adds the parsed sheets of some business days to the snapshot store of a folder (SNAPSHOT_FOLDER), in date
+    order, so each new day is stored as a delta from the previous one.
+
+    Args:
+        source_folder (str): Path to the source folder, where the store is kept (under SNAPSHOT_FOLDER).
+        sheets_by_day (dict): Mapping of business day ('yyyymmdd') to its dictionary of processed sheets.
+
+    Returns:
+        SnapshotStore: The updated store.
+    """
+    store = SnapshotStore(os.path.join(source_folder, SNAPSHOT_FOLDER))
+    counts = {'base': 0, 'delta': 0, 'unchanged': 0}
+    with stage("update_snapshot_store") as metrics:
+        for date_str in sorted(sheets_by_day):
+            for kind, count in store.add_day(date_str, sheets_by_day[date_str]).items():
+                counts[kind] += count
+        metrics.count(rows_out=sum(len(df) for sheets_dict in sheets_by_day.values() for df in sheets_dict.values()))
+    print(f"Snapshot store updated: {counts['base']} base(s), {counts['delta']} delta(s), {counts['unchanged']} "
+          f"unchanged sheet(s); {len(store.days())} day(s) in {store.size() / 1_048_576:.2f} MB in {store.folder}")
+    return store